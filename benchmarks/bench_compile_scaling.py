@@ -0,0 +1,44 @@
+__author__ = 'paulpatterson'
+
+## Compiles generated classes of increasing size and reports the time spent per token. If compilation is linear in the
+## size of its input the final column stays (roughly) constant as the class grows.
+##
+## usage: python -m benchmarks.bench_compile_scaling
+
+from pathlib import Path
+import shutil
+import tempfile
+import time
+
+from jack_compiler.JackCompiler import JackCompiler
+from jack_compiler.Tokenizer import Tokenizer
+from benchmarks.corpus import write_jack_class
+
+SIZES = [25, 50, 100, 200, 400]
+
+
+def count_tokens(jack_file_path):
+    return len(Tokenizer(jack_filepath=jack_file_path).tokenize())
+
+
+def time_compilation(jack_file_path):
+    start = time.perf_counter()
+    JackCompiler(path=jack_file_path).compile()
+    return time.perf_counter() - start
+
+
+def main():
+    working_directory = Path(tempfile.mkdtemp())
+    try:
+        print("{:>12} {:>10} {:>12} {:>14}".format("subroutines", "tokens", "seconds", "usec/token"))
+        for size in SIZES:
+            jack_file_path = write_jack_class(working_directory, size)
+            num_tokens = count_tokens(jack_file_path)
+            elapsed = time_compilation(jack_file_path)
+            print("{:>12} {:>10} {:>12.3f} {:>14.2f}".format(size, num_tokens, elapsed, 1e6 * elapsed / num_tokens))
+    finally:
+        shutil.rmtree(working_directory.as_posix())
+
+
+if __name__ == "__main__":
+    main()
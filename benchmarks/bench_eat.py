@@ -0,0 +1,97 @@
+__author__ = 'paulpatterson'
+
+## Measures how many tokens per second CompilationEngine's _eat* methods validate and consume, against a copy of the
+## validation they replaced (a regex compiled for every type check, and lists for every multi-value check). The tokens
+## of a large generated class are read once, then replayed through each engine with no syntax tree and no vm writer,
+## so only validation and advancing are timed: keywords and symbols are checked against their own values (symbols
+## that end a var list against the set of allowed values), and identifiers are checked as types.
+##
+## usage: python -m benchmarks.bench_eat
+
+import re
+import time
+
+from jack_compiler.CompilationEngine import CompilationEngine, VAR_DEC_TERMINATORS
+from jack_compiler.Tokenizer import Tokenizer, KEYWORD, SYMBOL, IDENTIFIER, TOKEN_TAGS
+from benchmarks.corpus import generate_jack_class
+
+NUM_SUBROUTINES = 400
+REPETITIONS = 5
+LEGACY_TYPE_PATTERN = r"int|char|boolean|[a-zA-Z_][a-zA-Z0-9_]*"
+
+
+class ReplayTokenizer():
+    """ Hands out a list of tokens, one per call to advance. """
+
+    def __init__(self, tokens):
+        self.tokens = iter(tokens)
+        self.current_token = next(self.tokens)
+
+    def advance(self):
+        self.current_token = next(self.tokens, None)
+
+
+class LegacyCompilationEngine(CompilationEngine):
+    """ CompilationEngine with the token validation it used to have. """
+
+    def _eat_type(self):
+        return self._validate_and_insert_current_token(expected_pattern=LEGACY_TYPE_PATTERN).value
+
+    def _validate_and_insert_current_token(self, expected_kind=None, expected_value=None, expected_pattern=None):
+        token = self.cur_tkn
+        if expected_kind is not None:
+            assert token.kind == expected_kind, \
+                "unexpected token type; type of current token '{}' is '{}', not '{}'".format(token.value, token.tag,
+                                                                                            TOKEN_TAGS[expected_kind])
+        if expected_value is not None:
+            if isinstance(expected_value, str):
+                assert token.value == expected_value, \
+                    "unexpected value; value of current token is '{}' not '{}'".format(token.value, expected_value)
+            else:
+                assert token.value in list(expected_value), \
+                    "unexpected value; value of current token '{}' is not in '{}'".format(token.value, expected_value)
+        if expected_pattern is not None:
+            regex = re.compile(expected_pattern)
+            assert regex.search(token.value) is not None, \
+                "expected current token value to match pattern {}; it didn't.".format(expected_pattern)
+
+        self._tree.append_token(token)
+
+        self.tknzr.advance()
+        return token
+
+
+def read_tokens(jack_code):
+    tokenizer = Tokenizer(jack_code=jack_code)
+    tokens = []
+    while tokenizer.advance() is not None:
+        tokens.append(tokenizer.current_token)
+    return tokens
+
+
+def eat_all(engine_class, tokens):
+    """ Consumes every token in tokens through an engine of engine_class, returning the elapsed time. """
+    engine = engine_class(ReplayTokenizer(tokens), None, build_ast=False)
+    start = time.perf_counter()
+    for token in tokens:
+        if token.kind == KEYWORD:
+            engine._eat_keyword(token.value)
+        elif token.kind == SYMBOL:
+            engine._eat_symbol(VAR_DEC_TERMINATORS if token.value in VAR_DEC_TERMINATORS else token.value)
+        elif token.kind == IDENTIFIER:
+            engine._eat_type()
+        else:
+            engine._eat()
+    return time.perf_counter() - start
+
+
+def main():
+    tokens = read_tokens(generate_jack_class(NUM_SUBROUTINES))
+    print("{} tokens, best of {}".format(len(tokens), REPETITIONS))
+    for name, engine_class in [("legacy", LegacyCompilationEngine), ("current", CompilationEngine)]:
+        elapsed = min(eat_all(engine_class, tokens) for _ in range(REPETITIONS))
+        print("{:>8}: {:,.0f} _eat calls per second".format(name, len(tokens) / elapsed))
+
+
+if __name__ == "__main__":
+    main()
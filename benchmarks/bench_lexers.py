@@ -0,0 +1,55 @@
+__author__ = 'paulpatterson'
+
+## Measures the throughput, in tokens per second, of each lexer engine over the Jack code in the project's test corpus.
+## The engines take turns over ROUNDS passes of the corpus, and each is credited with its fastest pass, so that a burst
+## of load on the machine does not skew one engine against the others.
+##
+## usage: python -m benchmarks.bench_lexers
+
+from pathlib import Path
+import time
+
+from lxml import etree
+
+from jack_compiler.Tokenizer import LEXERS
+
+TESTS_DIR = Path(__file__).resolve().parent.parent / "tests"
+ROUNDS = 30
+
+
+def load_test_corpus():
+    """ Returns a list holding every jack class and (wrapped) jack snippet found in the test xml files. """
+    compilation_tests = etree.parse((TESTS_DIR / "CompilationTests.xml").as_posix()).getroot()
+    jack_sources = [jack_class.text for jack_class in compilation_tests.iter("jack_class")]
+
+    syntax_tests = etree.parse((TESTS_DIR / "SyntaxAnalysisTests.xml").as_posix()).getroot()
+    snippet_wrapper = syntax_tests.find("snippet_wrapper").text
+    jack_sources += [snippet_wrapper.format(snippet.text) for snippet in syntax_tests.iter("jack_snippet")]
+    return jack_sources
+
+
+def time_pass(lexer, jack_sources):
+    """ Returns the number of tokens lexer finds in jack_sources, and the seconds it takes to find them. """
+    num_tokens = 0
+    start = time.perf_counter()
+    for jack_code in jack_sources:
+        for _ in lexer(jack_code):
+            num_tokens += 1
+    return num_tokens, time.perf_counter() - start
+
+
+def main():
+    jack_sources = load_test_corpus()
+    best_times = {name: float("inf") for name in LEXERS}
+    for _ in range(ROUNDS):
+        for name, lexer in sorted(LEXERS.items()):
+            num_tokens, seconds = time_pass(lexer, jack_sources)
+            best_times[name] = min(best_times[name], seconds)
+    results = {name: num_tokens / seconds for name, seconds in best_times.items()}
+    slowest = min(results.values())
+    for name, rate in sorted(results.items()):
+        print("{:>10}: {:>12,.0f} tokens/s ({:.1f}x)".format(name, rate, rate / slowest))
+
+
+if __name__ == "__main__":
+    main()
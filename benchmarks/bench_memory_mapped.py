@@ -0,0 +1,55 @@
+__author__ = 'paulpatterson'
+
+## Compares reading a large jack file into a str (the default) with memory-mapping it, by tokenizing the whole file in
+## a fresh interpreter for each mode and reporting the wall time and the peak resident set size of that interpreter.
+##
+## usage: python -m benchmarks.bench_memory_mapped [num_subroutines]
+
+from pathlib import Path
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from jack_compiler.Tokenizer import Tokenizer
+from benchmarks.corpus import write_jack_class
+
+DEFAULT_NUM_SUBROUTINES = 10000
+MODES = ["read", "mmap"]
+
+
+def tokenize(jack_file_path, mode):
+    """ Tokenizes jack_file_path, printing the elapsed time and peak RSS (in KiB) of the current process. """
+    start = time.perf_counter()
+    tokenizer = Tokenizer(jack_filepath=jack_file_path, memory_map=(mode == "mmap"))
+    num_tokens = 0
+    while tokenizer.advance() is not None:
+        num_tokens += 1
+    elapsed = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(num_tokens, elapsed, peak_rss)
+
+
+def main(num_subroutines):
+    working_directory = Path(tempfile.mkdtemp())
+    try:
+        jack_file_path = write_jack_class(working_directory, num_subroutines)
+        size_mb = jack_file_path.stat().st_size / 2 ** 20
+        print("{} subroutines, {:.1f} MiB of jack".format(num_subroutines, size_mb))
+        for mode in MODES:
+            output = subprocess.check_output([sys.executable, "-m", "benchmarks.bench_memory_mapped", "--child",
+                                              mode, jack_file_path.as_posix()], universal_newlines=True)
+            num_tokens, elapsed, peak_rss = output.split()
+            print("{:>6}: {} tokens in {:.2f}s, peak RSS {:,.0f} KiB".format(mode, num_tokens, float(elapsed),
+                                                                             float(peak_rss)))
+    finally:
+        shutil.rmtree(working_directory.as_posix())
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        tokenize(Path(sys.argv[3]), sys.argv[2])
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_NUM_SUBROUTINES)
@@ -0,0 +1,63 @@
+__author__ = 'paulpatterson'
+
+## Compiles generated classes declaring thousands of fields and locals (see generate_wide_jack_class) with the current
+## SymbolTable, and with a copy of the table it replaced, whose running indices were found by counting every symbol of
+## a scope, making each declaration cost time proportional to the number before it.
+##
+## usage: python -m benchmarks.bench_symbol_table
+
+from collections import OrderedDict
+import time
+
+from jack_compiler.CompilationEngine import CompilationEngine
+from jack_compiler.SymbolTable import Symbol, SymbolTable
+from jack_compiler.Tokenizer import Tokenizer
+from jack_compiler.VMWriter import VMWriter
+from benchmarks.corpus import generate_wide_jack_class
+
+SIZES = [1000, 2000, 4000]
+
+
+class LegacySymbolTable():
+    """ The symbol table as it was, with its lookups reduced to the calls CompilationEngine makes. """
+
+    def __init__(self):
+        self._class_symbols = OrderedDict()
+        self._subroutine_symbols = OrderedDict()
+
+    def start_subroutine(self):
+        self._subroutine_symbols.clear()
+
+    def define(self, name, var_type, kind):
+        symbol_table = self._class_symbols if kind in ["STATIC", "FIELD"] else self._subroutine_symbols
+        symbol_table[name] = Symbol(var_type, kind, self.var_count(kind))
+
+    def var_count(self, kind):
+        symbol_table = self._class_symbols if kind in ["STATIC", "FIELD"] else self._subroutine_symbols
+        return len(list(filter(lambda x: x.kind == kind, symbol_table.values())))
+
+    def info_for_symbol(self, name):
+        if name in self._subroutine_symbols.keys():
+            return self._subroutine_symbols[name]
+        elif name in self._class_symbols.keys():
+            return self._class_symbols[name]
+
+
+def time_compilation(jack_code, symbol_table_class):
+    engine = CompilationEngine(Tokenizer(jack_code=jack_code), VMWriter(), build_ast=False)
+    engine.symbol_table = symbol_table_class()
+    start = time.perf_counter()
+    engine.compile()
+    return time.perf_counter() - start
+
+
+def main():
+    print("{:>10} {:>12} {:>12}".format("variables", "legacy (s)", "current (s)"))
+    for size in SIZES:
+        jack_code = generate_wide_jack_class(size)
+        print("{:>10} {:>12.3f} {:>12.3f}".format(size, time_compilation(jack_code, LegacySymbolTable),
+                                                  time_compilation(jack_code, SymbolTable)))
+
+
+if __name__ == "__main__":
+    main()
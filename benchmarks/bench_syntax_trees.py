@@ -0,0 +1,49 @@
+__author__ = 'paulpatterson'
+
+## Compiles a directory of generated classes with and without building syntax trees, and reports the time taken and
+## the peak memory allocated (as traced by tracemalloc) for each. Without trees the peak should stay roughly the same
+## as the number of classes grows, since only one class is held in memory at a time.
+##
+## usage: python -m benchmarks.bench_syntax_trees [num_classes]
+
+from pathlib import Path
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from jack_compiler.JackCompiler import JackCompiler
+from benchmarks.corpus import write_jack_class
+
+DEFAULT_NUM_CLASSES = 20
+NUM_SUBROUTINES = 100
+
+
+def compile_directory(directory, build_syntax_trees):
+    """ Compiles every class in directory, returning the elapsed time and the peak traced memory (in bytes). """
+    tracemalloc.start()
+    start = time.perf_counter()
+    JackCompiler(path=directory, build_syntax_trees=build_syntax_trees).compile()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main(num_classes):
+    working_directory = Path(tempfile.mkdtemp())
+    try:
+        for index in range(num_classes):
+            write_jack_class(working_directory, NUM_SUBROUTINES, "Class{}".format(index))
+        print("{} classes of {} subroutines".format(num_classes, NUM_SUBROUTINES))
+        for build_syntax_trees in [True, False]:
+            elapsed, peak = compile_directory(working_directory, build_syntax_trees)
+            print("{:>14}: {:.2f}s, peak {:,.0f} KiB".format("trees" if build_syntax_trees else "no trees", elapsed,
+                                                             peak / 1024))
+    finally:
+        shutil.rmtree(working_directory.as_posix())
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_NUM_CLASSES)
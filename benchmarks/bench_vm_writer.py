@@ -0,0 +1,149 @@
+__author__ = 'paulpatterson'
+
+## Compares the buffered VMWriter with the writer it replaced, which formatted every command and wrote it straight to
+## the vm file. The commands emitted while compiling a large generated class are recorded once and then replayed
+## against both writers, so the timings cover emission only. The raw write calls (each one a write syscall) that reach
+## the file are counted too.
+##
+## usage: python -m benchmarks.bench_vm_writer
+
+from pathlib import Path
+import io
+import shutil
+import tempfile
+import time
+
+from jack_compiler.CompilationEngine import CompilationEngine
+from jack_compiler.Tokenizer import Tokenizer
+from jack_compiler.VMCode import SEGMENTS, SEGMENT_NAMES
+from jack_compiler.VMWriter import VMWriter
+from benchmarks.corpus import generate_jack_class
+
+NUM_SUBROUTINES = 400
+REPETITIONS = 10
+
+
+class CountingFileIO(io.FileIO):
+    """ A raw file that counts the write calls made on it. """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.num_writes = 0
+
+    def write(self, data):
+        self.num_writes += 1
+        return super().write(data)
+
+
+def open_counted(vm_file_path):
+    raw_file = CountingFileIO(vm_file_path.as_posix(), "w")
+    return raw_file, io.TextIOWrapper(io.BufferedWriter(raw_file))
+
+
+class UnbufferedVMWriter():
+    """ The VMWriter as it was: one format and one write per command, and a file that is never closed. """
+
+    def __init__(self, outfile):
+        self.outfile = outfile
+
+    def write_push(self, segment, index):
+        self.outfile.write("push {} {}\n".format(SEGMENT_NAMES[SEGMENTS[segment]], index))
+
+    def write_pop(self, segment, index):
+        self.outfile.write("pop {} {}\n".format(SEGMENT_NAMES[SEGMENTS[segment]], index))
+
+    def write_arithmetic(self, command):
+        self.outfile.write(command.lower() + "\n")
+
+    def write_label(self, label):
+        self.outfile.write("label {}\n".format(label))
+
+    def write_goto(self, label):
+        self.outfile.write("goto {}\n".format(label))
+
+    def write_if_goto(self, label):
+        self.outfile.write("if-goto {}\n".format(label))
+
+    def write_call(self, name, num_args):
+        self.outfile.write("call {} {}\n".format(name, num_args))
+
+    def write_function(self, name, num_locals):
+        self.outfile.write("function {} {}\n".format(name, num_locals))
+
+    def write_return(self):
+        self.outfile.write("return\n")
+
+    def write_string(self, string):
+        self.write_push("CONST", len(string))
+        self.write_call("String.new", 1)
+        for ascii_code in [ord(character) for character in string]:
+            self.write_push("CONST", ascii_code)
+            self.write_call("String.appendChar", 2)
+
+
+class RecordingVMWriter():
+    """ Records the writer calls made by a CompilationEngine, leaving out the source marks the old writer lacked. """
+
+    def __init__(self):
+        self.calls = []
+
+    def mark_source(self, offset):
+        pass
+
+    def __getattr__(self, name):
+        return lambda *args: self.calls.append((name, args))
+
+
+def record_calls(jack_code):
+    recorder = RecordingVMWriter()
+    CompilationEngine(Tokenizer(jack_code=jack_code), recorder).compile()
+    return recorder.calls
+
+
+def replay(calls, vm_writer):
+    for name, args in calls:
+        getattr(vm_writer, name)(*args)
+
+
+def time_unbuffered(calls, vm_file_path):
+    raw_file, outfile = open_counted(vm_file_path)
+    start = time.perf_counter()
+    replay(calls, UnbufferedVMWriter(outfile))
+    outfile.flush()
+    elapsed = time.perf_counter() - start
+    outfile.close()
+    return elapsed, raw_file.num_writes
+
+
+class CountingVMWriter(VMWriter):
+    """ The buffered VMWriter, writing through a raw file that counts its write calls. """
+
+    def _open_vm_file(self):
+        self.raw_file, outfile = open_counted(self.vm_file_path)
+        return outfile
+
+
+def time_buffered(calls, vm_file_path):
+    vm_writer = CountingVMWriter(vm_file_path)
+    start = time.perf_counter()
+    with vm_writer:
+        replay(calls, vm_writer)
+    return time.perf_counter() - start, vm_writer.raw_file.num_writes
+
+
+def main():
+    calls = record_calls(generate_jack_class(NUM_SUBROUTINES))
+    working_directory = Path(tempfile.mkdtemp())
+    try:
+        print("{} writer calls, best of {} runs".format(len(calls), REPETITIONS))
+        print("{:>12} {:>12} {:>14}".format("writer", "msec", "raw writes"))
+        for writer_name, time_writer in [("unbuffered", time_unbuffered), ("buffered", time_buffered)]:
+            runs = [time_writer(calls, working_directory / "Main.vm") for _ in range(REPETITIONS)]
+            elapsed, num_writes = min(runs)
+            print("{:>12} {:>12.2f} {:>14}".format(writer_name, 1e3 * elapsed, num_writes))
+    finally:
+        shutil.rmtree(working_directory.as_posix())
+
+
+if __name__ == "__main__":
+    main()
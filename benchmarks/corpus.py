@@ -0,0 +1,59 @@
+__author__ = 'paulpatterson'
+
+## Generates large, valid Jack classes for the benchmarks in this package. The generated code exercises every kind of
+## statement and term the compiler knows about, so that timings are representative of real (if repetitive) programs.
+
+SUBROUTINE_TEMPLATE = """
+    /** Generated method number {index}. */
+    method int step{index}(int a, int b) {{
+        var int i, total;
+        var Array values;
+        let values = Array.new(10);
+        let i = 0;
+        let total = a + (b * {index});
+        while (i < 10) {{
+            let values[i] = total - i;
+            if (values[i] > 100) {{
+                let total = total / 2;
+            }} else {{
+                let total = total + ~i;
+            }}
+            let i = i + 1;
+        }}
+        // call a sibling method and an OS function
+        do Output.printString("step {index}");
+        do step{previous}(total, -i);
+        let count = count + values[3];
+        do values.dispose();
+        return total;
+    }}
+"""
+
+
+def generate_jack_class(num_subroutines, class_name="Main"):
+    """ Returns the source of a Jack class declaring num_subroutines generated methods. """
+    lines = ["class {} {{".format(class_name), "    field int count;", "    static boolean ready;"]
+    for index in range(num_subroutines):
+        lines.append(SUBROUTINE_TEMPLATE.format(index=index, previous=max(index - 1, 0)))
+    lines.append("}")
+    return "\n".join(lines)
+
+
+def write_jack_class(directory, num_subroutines, class_name="Main"):
+    """ Writes a generated class to directory/class_name.jack and returns the path of the new file. """
+    jack_file_path = directory / (class_name + ".jack")
+    with open(jack_file_path.as_posix(), "w") as jack_file:
+        jack_file.write(generate_jack_class(num_subroutines, class_name))
+    return jack_file_path
+
+
+def generate_wide_jack_class(num_variables, class_name="Main"):
+    """ Returns the source of a Jack class declaring num_variables fields, and a method declaring num_variables
+    locals, each of which it assigns from a field. """
+    lines = ["class {} {{".format(class_name)]
+    lines.extend("    field int f{};".format(index) for index in range(num_variables))
+    lines.append("    method int sum() {")
+    lines.extend("        var int v{};".format(index) for index in range(num_variables))
+    lines.extend("        let v{0} = f{0} + 1;".format(index) for index in range(num_variables))
+    lines.extend(["        return v0;", "    }", "}"])
+    return "\n".join(lines)
@@ -1,124 +1,234 @@
 __author__ = 'paulpatterson'
 
-from lxml import etree
+## The abstract syntax tree is built from plain python nodes, one class per construct of the Jack grammar. Each node
+## keeps its parent and its children, in source order; the children of a node are other nodes and the Tokens it
+## consumed directly, so no leaf objects are made. The parts of a construct that code generation asks about (a class's
+## name, a subroutine's kind, the names a declaration introduces...) are stored as attributes of its node when they are
+## parsed, so they never have to be searched for.
+##
+## The tree can be exported to the xml of the nand2tetris syntax analyser (export_xml, or str(tree)), which is what
+## the tests compare against; lxml is only needed for that.
 
 
-class AbstractSyntaxTree():
+class Node():
+    """ A node of the tree. tag is the name of the node's element in xml output. """
 
-    def __init__(self, root_node=None):
-        """ Creates a new AbstractSyntaxTree instance. If root_node != none, it becomes the root node of the tree. """
-        self._tree = None
-        self._current_node = None
+    __slots__ = ("parent", "children")
+    tag = None
 
-        if root_node is not None:
-            self.current_node = root_node
-            self._tree = etree.ElementTree(root_node)
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.children = []
 
-    @property
-    def stmt(self):
-        """ Returns the nearest statement node ancestor of current_node, otherwise returns None. """
-        ancestor = self.current_node
-        while ancestor.tag.find("Statement") == -1:
-            ancestor = ancestor.getparent()
-        return ancestor
+    def __repr__(self):
+        return "{}({} children)".format(type(self).__name__, len(self.children))
 
-    @property
-    def class_name(self):
-        """ Returns the class name of the enclosing class node. """
-        class_node = self._tree.getroot()
-        return class_node.find("./identifier").text.strip()
 
-    @property
-    def subroutine_name(self):
-        """ Returns the name of the subroutine that encloses current_node. """
-        subroutine_dec = self._get_enclosing_node("subroutineDec")
-        return list(subroutine_dec)[2].text.strip()
+class Statement(Node):
+    """ A node for one of the five kinds of statement. """
 
-    @property
-    def num_subroutine_params(self):
-        """ Returns the number of parameters declared by the subroutine enclosing current_node. """
-        subroutineDec = self._get_enclosing_node("subroutineDec")
-        explicit_params = len(subroutineDec.findall("parameterList/identifier"))
-        return explicit_params if self.subroutine_kind != "method" else explicit_params + 1
+    __slots__ = ()
 
-    @property
-    def num_subroutine_locals(self):
-        """ Returns the number of local variables declared by the subroutine enclosing current_node. """
-        subroutineBody = self._get_enclosing_node("subroutineBody")
-        var_decs = [list(var_dec) for var_dec in subroutineBody.findall("varDec")]
-        return int(sum(map(lambda x: 1 + ((x - 4) / 2), [len(list(var_dec)) for var_dec in var_decs])))
 
-    @property
-    def subroutine_kind(self):
-        """ Returns the kind (method, constructor, function) of the subroutine enclosing current_node. """
-        subroutine_dec = self._get_enclosing_node("subroutineDec")
-        return list(subroutine_dec)[0].text.strip()
+class ClassDec(Node):
+    __slots__ = ("name",)
+    tag = "class"
 
-    @property
-    def subroutine_is_method(self):
-        """ Returns True if the subroutine enclosing current_node is a method, otherwise returns False. """
-        subroutine_dec = self._get_enclosing_node("subroutineDec")
-        return list(subroutine_dec)[0].text.strip() == "method"
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.name = None
 
-    @property
-    def subroutine_is_constructor(self):
-        """ Returns True if the subroutine enclosing current_node is a constructor, otherwise returns False. """
-        subroutine_dec = self._get_enclosing_node("subroutineDec")
-        return list(subroutine_dec)[0].text.strip() == "constructor"
+
+class ClassVarDec(Node):
+    __slots__ = ("kind", "type", "names")
+    tag = "classVarDec"
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.kind = None
+        self.type = None
+        self.names = []
+
+
+class SubroutineDec(Node):
+    """ A constructor, function or method. num_parameters counts the parameters declared (so excludes a method's
+    'this'), and num_locals the local variables declared by its body. """
+
+    __slots__ = ("kind", "return_type", "name", "num_parameters", "num_locals")
+    tag = "subroutineDec"
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.kind = None
+        self.return_type = None
+        self.name = None
+        self.num_parameters = 0
+        self.num_locals = 0
+
+
+class ParameterList(Node):
+    __slots__ = ("types", "names")
+    tag = "parameterList"
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.types = []
+        self.names = []
+
+
+class SubroutineBody(Node):
+    __slots__ = ()
+    tag = "subroutineBody"
+
+
+class VarDec(Node):
+    __slots__ = ("type", "names")
+    tag = "varDec"
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.type = None
+        self.names = []
+
+
+class Statements(Node):
+    __slots__ = ()
+    tag = "statements"
+
+
+class LetStatement(Statement):
+    __slots__ = ("var_name",)
+    tag = "letStatement"
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.var_name = None
+
+
+class IfStatement(Statement):
+    __slots__ = ()
+    tag = "ifStatement"
+
+
+class WhileStatement(Statement):
+    __slots__ = ()
+    tag = "whileStatement"
+
+
+class DoStatement(Statement):
+    __slots__ = ()
+    tag = "doStatement"
+
+
+class ReturnStatement(Statement):
+    __slots__ = ()
+    tag = "returnStatement"
+
+
+class Expression(Node):
+    """ An expression: a term, followed by zero or more pairs of operator and term. The Jack grammar gives its
+    operators no precedence, so they are kept, in order, in operators rather than as a tree of binary operations. """
+
+    __slots__ = ("operators",)
+    tag = "expression"
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.operators = []
+
+
+class Term(Node):
+    __slots__ = ()
+    tag = "term"
+
+
+class ExpressionList(Node):
+    __slots__ = ("num_expressions",)
+    tag = "expressionList"
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.num_expressions = 0
+
+
+class AbstractSyntaxTree():
+
+    def __init__(self, root_node=None):
+        """ Creates a new AbstractSyntaxTree instance. If root_node != none, it becomes the root node of the tree. """
+        self.root = root_node
+        self.current_node = root_node
 
     @property
-    def current_node(self):
-        """ Returns the current_node. """
-        return self._current_node
-
-    @current_node.setter
-    def current_node(self, value):
-        """ Sets the current node (value must be an Element instance). """
-        self._current_node = value
-
-    def append(self, tag, text=None):
-        """ Creates a node and adds it to the children of current_node. Finally, this new node becomes current_node. """
-        if self._tree is None:
-            new_node = etree.Element(tag)
-            self._tree = etree.ElementTree(new_node)
+    def class_name(self):
+        """ Returns the class name of the enclosing class node. """
+        return self.root.name
+
+    def append(self, node_class):
+        """ Creates a node of node_class and adds it to the children of current_node (or makes it the root, if the tree
+        is empty). Finally, this new node becomes current_node. """
+        new_node = node_class(self.current_node)
+        if self.root is None:
+            self.root = new_node
         else:
-            new_node = etree.SubElement(self.current_node, tag)
-
-        if text is not None:
-            new_node.text = text
+            self.current_node.children.append(new_node)
 
         self.current_node = new_node
 
         return new_node
 
-    def append_leaf(self, tag, text=None):
-        """ Creates a node and adds it to the children of current node.
-
-        Unlike ``append`` this method does not make the newly created node the current_node."""
-        new_node = etree.SubElement(self.current_node, tag)
-        if text is not None:
-            new_node.text = text
-        return new_node
+    def append_token(self, token):
+        """ Adds token to the children of current_node. """
+        self.current_node.children.append(token)
+        return token
 
     def write(self, file_path):
-        """ Writes the contents of """
+        """ Writes the tree, as xml, to file_path. """
         assert file_path.exists(), "no such file '{}'".format(file_path)
         with open(file_path.as_posix(), 'w') as outfile:
             outfile.write(str(self))
 
-    def _get_enclosing_node(self, tag):
-        """ Searches current_node's ancestors for a node whose tag matches the specified tag. """
-        ancestor = self.current_node
-        while ancestor.tag != tag:
-            ancestor = ancestor.getparent()
-        return ancestor
-
     def __str__(self):
         """ Returns a formatted xml string representing the contents of the tree. """
-        return etree.tostring(self._tree, pretty_print=True).decode("utf-8")
+        return stringify_xml(export_xml(self.root))
+
+
+class NullSyntaxTree():
+    """ Stands in for an AbstractSyntaxTree when only vm code is wanted. Nodes are still created, so that the engine
+    can record what it parses on them, but they are never linked to one another, and tokens are dropped; each node
+    can be reclaimed as soon as the engine has finished with it. """
+
+    __slots__ = ("current_node",)
+
+    def __init__(self):
+        self.current_node = None
+
+    def append(self, node_class):
+        """ Returns a new, unattached, node of node_class. """
+        return node_class()
+
+    def append_token(self, token):
+        return token
+
+
+def export_xml(node):
+    """ Returns an lxml Element representing node and its descendants, in the form written by the nand2tetris syntax
+    analyser: each token becomes a leaf whose tag names the token's kind and whose text is the token's value, padded
+    with a space on either side. """
+    from lxml import etree
+
+    def append_children(element, node):
+        for child in node.children:
+            if isinstance(child, Node):
+                append_children(etree.SubElement(element, child.tag), child)
+            else:
+                etree.SubElement(element, child.tag).text = " {} ".format(child.value)
+
+    root = etree.Element(node.tag)
+    append_children(root, node)
+    return root
 
 
 def stringify_xml(elem):
     """ Return a pretty-printed XML string for the Element. """
+    from lxml import etree
     return etree.tostring(elem, pretty_print=True).decode("utf-8")
-
@@ -0,0 +1,80 @@
+__author__ = 'paulpatterson'
+
+## The build cache lets JackCompiler skip .jack files that have not changed since they were last compiled. It is kept
+## as a json manifest in the output directory, with one entry per .jack file recording
+##
+##   - a hash of the file's contents,
+##   - the version of the compiler that compiled it, and
+##   - a hash of the .vm file that was written.
+##
+## A file is only skipped if all three still hold. The compiler version is a hash of the compiler's own source, so
+## any change to the compiler (not just a version bump) invalidates every entry.
+
+import hashlib
+import json
+from pathlib import Path
+
+MANIFEST_NAME = ".jack_build_cache.json"
+
+
+def _compute_compiler_version():
+    """ Returns a hash of the source of every module in the jack_compiler package. """
+    digest = hashlib.sha256()
+    for module_path in sorted(Path(__file__).resolve().parent.glob("*.py")):
+        digest.update(module_path.name.encode("utf-8"))
+        digest.update(module_path.read_bytes())
+    return digest.hexdigest()
+
+COMPILER_VERSION = _compute_compiler_version()
+
+
+def hash_file(file_path):
+    """ Returns the sha256 hex digest of the contents of file_path. """
+    return hashlib.sha256(file_path.read_bytes()).hexdigest()
+
+
+class BuildCache():
+
+    def __init__(self, output_directory, compiler_version=COMPILER_VERSION):
+        """ Creates a BuildCache backed by the manifest in output_directory, loading it if it exists.
+
+        A manifest that cannot be read, or that was written by a different compiler version, is treated as empty. """
+        self.manifest_path = output_directory / MANIFEST_NAME
+        self.compiler_version = compiler_version
+        self._entries = {}
+        self._source_hashes = {}
+
+        try:
+            with open(self.manifest_path.as_posix()) as manifest_file:
+                manifest = json.load(manifest_file)
+        except (OSError, ValueError):
+            return
+
+        if isinstance(manifest, dict) and manifest.get("compiler") == self.compiler_version:
+            self._entries = manifest.get("files", {})
+
+    def is_fresh(self, jack_file, vm_file):
+        """ Returns True if vm_file holds the output of compiling the current contents of jack_file with this
+        version of the compiler. """
+        entry = self._entries.get(jack_file.name)
+        if entry is None or entry["source"] != self._source_hash(jack_file):
+            return False
+        return vm_file.exists() and entry["vm_file"] == vm_file.name and entry["vm"] == hash_file(vm_file)
+
+    def record(self, jack_file, vm_file):
+        """ Records that vm_file has just been compiled from jack_file. """
+        self._entries[jack_file.name] = {"source": self._source_hash(jack_file),
+                                         "vm_file": vm_file.name,
+                                         "vm": hash_file(vm_file)}
+
+    def save(self):
+        """ Writes the manifest back to disk. """
+        with open(self.manifest_path.as_posix(), "w") as manifest_file:
+            json.dump({"compiler": self.compiler_version, "files": self._entries}, manifest_file, indent=1,
+                      sort_keys=True)
+
+    def _source_hash(self, jack_file):
+        """ Returns the hash of jack_file's contents, computing it at most once per BuildCache. """
+        if jack_file not in self._source_hashes:
+            self._source_hashes[jack_file] = hash_file(jack_file)
+        return self._source_hashes[jack_file]
@@ -0,0 +1,56 @@
+__author__ = 'paulpatterson'
+
+## Whole-program analysis of the vm code of every class in a program. The call graph is read from the call
+## instructions of each function; CompilationEngine has already resolved every subroutine call (whether written as
+## className.sub, var.method or method) to the function it names, using the symbol table, so no further resolution is
+## needed here. Functions that cannot be reached from the program's entry points are never called, and can be dropped.
+##
+## The OS only ever calls into a program through Sys.init, which calls Main.main, so these are the only roots.
+
+from jack_compiler.Optimizer import split_functions
+from jack_compiler.VMCode import VMCode, CALL, FUNCTION
+
+ROOT_FUNCTIONS = ["Sys.init", "Main.main"]
+
+
+def build_call_graph(vm_codes):
+    """ Returns a dictionary mapping the name of every function defined in vm_codes (an iterable of VMCode, one per
+    class) to the set of names of the functions it calls. """
+    call_graph = {}
+    callees = None
+    for vm_code in vm_codes:
+        for instruction in vm_code:
+            if instruction.opcode == FUNCTION:
+                callees = call_graph[instruction.name] = set()
+            elif instruction.opcode == CALL:
+                callees.add(instruction.name)
+    return call_graph
+
+
+def reachable_functions(call_graph, roots=ROOT_FUNCTIONS):
+    """ Returns the set of functions in call_graph that can be reached from roots. Calls to functions that call_graph
+    does not define (those of the OS) are ignored. """
+    reachable = set()
+    unvisited = [root for root in roots if root in call_graph]
+    while len(unvisited) > 0:
+        function_name = unvisited.pop()
+        if function_name in reachable:
+            continue
+        reachable.add(function_name)
+        unvisited.extend(callee for callee in call_graph[function_name]
+                         if callee in call_graph and callee not in reachable)
+    return reachable
+
+
+def prune_functions(vm_code, reachable):
+    """ Returns a copy of vm_code without the functions that are not in reachable, and a list of the names of the
+    functions removed. """
+    pruned = VMCode()
+    removed = []
+    for function in split_functions(vm_code):
+        if function[0].name in reachable:
+            for instruction in function:
+                pruned.append(*instruction)
+        else:
+            removed.append(function[0].name)
+    return pruned, removed
@@ -1,22 +1,74 @@
 __author__ = 'paulpatterson'
 
-import re
 from jack_compiler.SymbolTable import SymbolTable
-from jack_compiler.AbstractSyntaxTree import AbstractSyntaxTree
+from jack_compiler.AbstractSyntaxTree import AbstractSyntaxTree, NullSyntaxTree, ClassDec, ClassVarDec, SubroutineDec, \
+    ParameterList, SubroutineBody, VarDec, Statements, LetStatement, IfStatement, WhileStatement, DoStatement, \
+    ReturnStatement, Expression, Term, ExpressionList
+from jack_compiler.Tokenizer import KEYWORD, SYMBOL, IDENTIFIER, INT_CONST, STRING_CONST, TOKEN_TAGS
+
+## The grammar's sets of tokens, as frozensets so that every check made while parsing is a single hash lookup. (Keyword
+## and symbol values are interned by the tokenizer, so hashing them is cheap.)
+OPERATORS = frozenset(["+", "-", "*", "/", "&", "|", "<", ">", "="])
+UNARY_OPERATORS = frozenset(["-", "~"])
+CLASS_VAR_KINDS = frozenset(["static", "field"])
+SUBROUTINE_KINDS = frozenset(["constructor", "function", "method"])
+STATEMENT_KEYWORDS = frozenset(["do", "while", "if", "let", "return"])
+PRIMITIVE_TYPES = frozenset(["int", "char", "boolean"])
+VAR_DEC_TERMINATORS = frozenset([";", ","])
+CONSTANT_KINDS = frozenset([INT_CONST, KEYWORD, STRING_CONST])
+
+
+class SubroutineContext():
+    """ What the engine knows about the subroutine it is compiling, recorded once, as its declaration is parsed, so
+    that code generation never has to look it up. counters numbers the if and while statements of the subroutine,
+    for their labels. """
+
+    __slots__ = ("class_name", "kind", "name", "num_parameters", "num_locals", "counters")
+
+    def __init__(self, class_name, kind, name):
+        self.class_name = class_name
+        self.kind = kind
+        self.name = name
+        self.num_parameters = 0
+        self.num_locals = 0
+        self.counters = {"if": 0, "while": 0}
 
-OPERATORS = [" + ", " - ", " * ", " / ", " & ", " | ", " < ", " > ", " = "]
-TYPE_PATTERN = r" int | char | boolean | [a-zA-Z_][a-zA-Z0-9_]* "
+    @property
+    def function_name(self):
+        """ Returns the name of the subroutine's vm function. """
+        return "{}.{}".format(self.class_name, self.name)
+
+    @property
+    def is_method(self):
+        return self.kind == "method"
+
+    @property
+    def is_constructor(self):
+        return self.kind == "constructor"
 
 
 class CompilationEngine():
 
-    def __init__(self, tokenizer=None, vm_writer=None):
+    def __init__(self, tokenizer=None, vm_writer=None, build_ast=True, signature_index=None):
         """ Creates a new compilation engine with the given input and output. The next routine called must be
-        compile_class """
+        compile_class
+
+        If build_ast is False only vm code is generated: no syntax tree is kept (ast is None), and everything code
+        generation needs is taken from the parser's own state.
+
+        signature_index, a SignatureIndex of the classes in the build, tells the engine what the subroutines it calls
+        are; without it every unqualified call is taken to be a method call.
+
+        The offset of each construct is passed to vm_writer's mark_source before the code for it is written, so that a
+        writer keeping a source map knows where every command came from. """
         self.tknzr = tokenizer
         self.vm_writer = vm_writer
         self.symbol_table = SymbolTable()
-        self.ast = AbstractSyntaxTree()
+        self.signature_index = signature_index
+        self.ast = AbstractSyntaxTree() if build_ast else None
+        self._tree = self.ast if build_ast else NullSyntaxTree()
+        self.class_name = None
+        self.subroutine = None
 
     @property
     def cur_tkn(self):
@@ -31,130 +83,141 @@ class CompilationEngine():
 
         class: 'class' className '{' classVarDec* subroutineDec* '}'
         """
-        assert self.cur_tkn.text == " class ", "unexpected 'class' as first token - got '{}'".format(self.cur_tkn.text)
+        assert self.cur_tkn.value == "class", "unexpected 'class' as first token - got '{}'".format(self.cur_tkn.value)
 
-        _ = self.ast.append(tag="class")
+        class_dec = self._tree.append(ClassDec)
 
         self._eat_keyword("class")
-        self._eat_identifier()
+        self.class_name = class_dec.name = self._eat_identifier()
         self._eat_symbol("{")
 
-        while self.cur_tkn.text in [" static ", " field "]:
+        while self.cur_tkn.value in CLASS_VAR_KINDS:
             self._compile_class_var_dec()
 
-        while self.cur_tkn.text in [" constructor ", " function ", " method "]:
+        while self.cur_tkn.value in SUBROUTINE_KINDS:
             self._compile_subroutine_dec()
 
         self._eat_symbol("}")
 
     def _compile_class_var_dec(self):
         """ Compiles a static variable declaration, or a field declaration """
-        if self.cur_tkn.text not in [" static ", " field "]:
+        if self.cur_tkn.value not in CLASS_VAR_KINDS:
             return
 
-        class_var_dec = self.ast.append("classVarDec")
+        class_var_dec = self._tree.append(ClassVarDec)
 
-        field_or_static = self._eat_keyword()
-        var_type = self._eat(expected_pattern=TYPE_PATTERN)
+        field_or_static = class_var_dec.kind = self._eat_keyword()
+        var_type = class_var_dec.type = self._eat_type()
         var_name = self._eat_identifier()
+        class_var_dec.names.append(var_name)
         self.symbol_table.define(var_name, var_type, field_or_static.upper())
 
-        while self.cur_tkn.text == " , ":
+        while self.cur_tkn.value == ",":
             self._eat_symbol(",")
             var_name = self._eat_identifier()
+            class_var_dec.names.append(var_name)
             self.symbol_table.define(var_name, var_type, field_or_static.upper())
 
         self._eat_symbol(";")
-        self.ast.current_node = class_var_dec.getparent()
+        self._tree.current_node = class_var_dec.parent
 
     def _compile_subroutine_dec(self):
         """ Compiles a complete method, function, or constructor """
-        if self.cur_tkn.text not in [" constructor ", " function ", " method "]:
+        if self.cur_tkn.value not in SUBROUTINE_KINDS:
             return False
 
         self.symbol_table.start_subroutine()
-        subroutine_dec = self.ast.append(tag="subroutineDec")
+        subroutine_dec = self._tree.append(SubroutineDec)
+        self.vm_writer.mark_source(self.cur_tkn.offset)
 
-        if self._eat_keyword() == "method":
-            self.symbol_table.define("this", self.ast.class_name, "ARG")
-        self._eat()
-        self._eat_identifier()  # subroutine name
+        kind = subroutine_dec.kind = self._eat_keyword()
+        if kind == "method":
+            self.symbol_table.define("this", self.class_name, "ARG")
+        subroutine_dec.return_type = self._eat()
+        name = subroutine_dec.name = self._eat_identifier()
+        self.subroutine = SubroutineContext(self.class_name, kind, name)
 
         self._eat_symbol("(")
-        self._compile_parameter_list()
+        self.subroutine.num_parameters = subroutine_dec.num_parameters = self._compile_parameter_list()
         self._eat_symbol(")")
         self._compile_subroutine_body()
+        subroutine_dec.num_locals = self.subroutine.num_locals
 
-        self.ast.current_node = subroutine_dec.getparent()
+        self._tree.current_node = subroutine_dec.parent
 
     def _compile_parameter_list(self):
-        """ Compiles a (possibly empty) parameter list. Does not handle the enclosing '()' """
-        parameter_list = self.ast.append(tag="parameterList")
+        """ Compiles a (possibly empty) parameter list, returning the number of parameters. Does not handle the
+        enclosing '()' """
+        parameter_list = self._tree.append(ParameterList)
 
-        while self.cur_tkn.text != " ) ":
+        while self.cur_tkn.value != ")":
 
-            var_type = self._eat(expected_pattern=TYPE_PATTERN)
+            var_type = self._eat_type()
             var_name = self._eat_identifier()
+            parameter_list.types.append(var_type)
+            parameter_list.names.append(var_name)
             self.symbol_table.define(var_name, var_type, "ARG")
 
-            if self.cur_tkn.text == " , ":
+            if self.cur_tkn.value == ",":
                 _ = self._eat_symbol(",")
 
-        self.ast.current_node = parameter_list.getparent()
+        self._tree.current_node = parameter_list.parent
+        return len(parameter_list.names)
 
     def _compile_subroutine_body(self):
         """ Compiles a subroutine's body """
-        subroutine_body = self.ast.append("subroutineBody")
-        self.counters = {"if": 0, "while": 0}
+        subroutine_body = self._tree.append(SubroutineBody)
 
         self._eat_symbol("{")
 
-        while self.cur_tkn.text == " var ":
-            self._compile_var_dec()
+        while self.cur_tkn.value == "var":
+            self.subroutine.num_locals += self._compile_var_dec()
 
         ## Write the signature
-        func_name = "{}.{}".format(self.ast.class_name, self.ast.subroutine_name)
-        self.vm_writer.write_function(func_name, self.ast.num_subroutine_locals)
+        self.vm_writer.write_function(self.subroutine.function_name, self.subroutine.num_locals)
 
-        if self.ast.subroutine_is_constructor:
+        if self.subroutine.is_constructor:
             self.vm_writer.write_push("CONST", self.symbol_table.var_count("FIELD"))
             self.vm_writer.write_call("Memory.alloc", 1)
             self.vm_writer.write_pop("POINTER", 0)
-        elif self.ast.subroutine_is_method:
+        elif self.subroutine.is_method:
             self.vm_writer.write_push("ARG", 0)
             self.vm_writer.write_pop("POINTER", 0)
 
         self._compile_statements()
         self._eat_symbol("}")
 
-        self.ast.current_node = subroutine_body.getparent()
+        self._tree.current_node = subroutine_body.parent
 
     def _compile_var_dec(self):
         """ Compiles a 'var' declaration
 
-        a 'varDec' element is only added if their is at least one variable declaration """
-        if self.cur_tkn.text != " var ":
-            return
+        a 'varDec' element is only added if their is at least one variable declaration. Returns the number of
+        variables declared. """
+        if self.cur_tkn.value != "var":
+            return 0
 
-        var_dec = self.ast.append(tag="varDec")
+        var_dec = self._tree.append(VarDec)
 
         self._eat_keyword("var")
-        var_type = self._eat(expected_pattern=TYPE_PATTERN)
+        var_type = var_dec.type = self._eat_type()
 
         while True:
 
-            assert self.cur_tkn.tag == "identifier", \
-                "expected keyword or identifier, got ' {} '".format(self.cur_tkn.text)
+            assert self.cur_tkn.kind == IDENTIFIER, \
+                "expected keyword or identifier, got '{}'".format(self.cur_tkn.value)
             var_name = self._eat_identifier()
+            var_dec.names.append(var_name)
             self.symbol_table.define(var_name, var_type, "VAR")
 
             previous_token = self.cur_tkn
-            self._eat_symbol([";", ","])
+            self._eat_symbol(VAR_DEC_TERMINATORS)
 
-            if previous_token.text == " ; ":
+            if previous_token.value == ";":
                 break
 
-        self.ast.current_node = var_dec.getparent()
+        self._tree.current_node = var_dec.parent
+        return len(var_dec.names)
 
     def _compile_statements(self):
         """ Compiles a sequence of statements. Does not handle the enclosing '{}'
@@ -164,42 +227,46 @@ class CompilationEngine():
 
         Note: There is no compile_statement method
         """
-        stmts = self.ast.append(tag="statements")
+        stmts = self._tree.append(Statements)
 
-        while self.cur_tkn.text in [" do ", " while ", " if ", " let ", " return "]:
-            stmt_type = self.cur_tkn.text
-            if stmt_type == " do ":
+        while self.cur_tkn.value in STATEMENT_KEYWORDS:
+            stmt_type = self.cur_tkn.value
+            self.vm_writer.mark_source(self.cur_tkn.offset)
+            if stmt_type == "do":
                 self._compile_do()
-            elif stmt_type == " while ":
+            elif stmt_type == "while":
                 self._compile_while()
-            elif stmt_type == " if ":
+            elif stmt_type == "if":
                 self._compile_if()
-            elif stmt_type == " let ":
+            elif stmt_type == "let":
                 self._compile_let()
             else:
                 self._compile_return()
 
-        self.ast.current_node = stmts.getparent()
+        self._tree.current_node = stmts.parent
 
     def _compile_let(self):
         """ Compiles a 'let' statement """
-        let_stmt = self.ast.append(tag="letStatement")
+        let_stmt = self._tree.append(LetStatement)
+        offset = self.cur_tkn.offset
 
         self._eat_keyword("let")
-        var_name = self._eat_identifier()
+        var_name = let_stmt.var_name = self._eat_identifier()
         array_assignment = False
 
-        if self.cur_tkn.text == ' [ ':
+        if self.cur_tkn.value == '[':
             symbol = self.symbol_table.info_for_symbol(var_name)
             array_assignment = True
             self._eat_symbol("[")
             self._compile_expression()
+            self.vm_writer.mark_source(offset)
             self.vm_writer.write_push(symbol.kind, symbol.index)
             self.vm_writer.write_arithmetic("ADD")
             self._eat_symbol("]")
 
         self._eat_symbol("=")
         self._compile_expression()
+        self.vm_writer.mark_source(offset)
 
         if array_assignment:
             self.vm_writer.write_pop("TEMP", 0)
@@ -213,19 +280,22 @@ class CompilationEngine():
 
         self._eat_symbol(";")
 
-        self.ast.current_node = let_stmt.getparent()
+        self._tree.current_node = let_stmt.parent
 
     def _compile_if(self):
         """ Compiles an 'if' statement, possibly with a trailing 'else' clause """
-        if_stmt = self.ast.append(tag="ifStatement")
+        if_stmt = self._tree.append(IfStatement)
 
-        label_suffix = self.counters["if"]
-        self.counters["if"] = label_suffix + 1
+        counters = self.subroutine.counters
+        label_suffix = counters["if"]
+        counters["if"] = label_suffix + 1
 
+        offset = self.cur_tkn.offset
         self._eat_keyword("if")
         self._eat_symbol("(")
         self._compile_expression()
         self._eat_symbol(")")
+        self.vm_writer.mark_source(offset)
 
         self.vm_writer.write_if_goto("IF_TRUE{}".format(label_suffix))
         self.vm_writer.write_goto("IF_FALSE{}".format(label_suffix))
@@ -234,34 +304,39 @@ class CompilationEngine():
         self._eat_symbol("{")
         self._compile_statements()
         self._eat_symbol("}")
+        self.vm_writer.mark_source(offset)
 
-        if self.cur_tkn.text == ' else ':
+        if self.cur_tkn.value == 'else':
             self.vm_writer.write_goto("IF_END{}".format(label_suffix))
 
         self.vm_writer.write_label("IF_FALSE{}".format(label_suffix))
 
-        if self.cur_tkn.text == ' else ':
+        if self.cur_tkn.value == 'else':
             self._eat_keyword("else")
             self._eat_symbol("{")
             self._compile_statements()
             self._eat_symbol("}")
+            self.vm_writer.mark_source(offset)
             self.vm_writer.write_label("IF_END{}".format(label_suffix))
 
-        self.ast.current_node = if_stmt.getparent()
+        self._tree.current_node = if_stmt.parent
 
     def _compile_while(self):
         """ Compiles a 'while' statement """
-        while_stmt = self.ast.append(tag="whileStatement")
+        while_stmt = self._tree.append(WhileStatement)
 
-        label_suffix = self.counters["while"]
-        self.counters["while"] = label_suffix + 1
+        counters = self.subroutine.counters
+        label_suffix = counters["while"]
+        counters["while"] = label_suffix + 1
 
+        offset = self.cur_tkn.offset
         self.vm_writer.write_label("WHILE_EXP{}".format(label_suffix))
 
         self._eat_keyword("while")
         self._eat_symbol("(")
         self._compile_expression()
         self._eat_symbol(")")
+        self.vm_writer.mark_source(offset)
 
         self.vm_writer.write_arithmetic("NOT")
         self.vm_writer.write_if_goto("WHILE_END{}".format(label_suffix))
@@ -269,47 +344,53 @@ class CompilationEngine():
         self._eat_symbol("{")
         self._compile_statements()
         self._eat_symbol("}")
+        self.vm_writer.mark_source(offset)
 
         self.vm_writer.write_goto("WHILE_EXP{}".format(label_suffix))
         self.vm_writer.write_label("WHILE_END{}".format(label_suffix))
 
-        self.ast.current_node = while_stmt.getparent()
+        self._tree.current_node = while_stmt.parent
 
     def _compile_do(self):
         """ Compiles a 'do' statement """
 
-        do_stmt = self.ast.append("doStatement")
+        do_stmt = self._tree.append(DoStatement)
         self._eat_keyword("do")
-        self._compile_term()  # term will 'expand' to 'subroutineCall'
+        self._compile_term(do_statement=True)  # term will 'expand' to 'subroutineCall'
         self._eat_symbol(";")
 
-        self.ast.current_node = do_stmt.getparent()
+        self._tree.current_node = do_stmt.parent
 
     def _compile_return(self):
         """ Compiles a 'return' statement """
 
-        return_stmt = self.ast.append("returnStatement")
+        return_stmt = self._tree.append(ReturnStatement)
+        offset = self.cur_tkn.offset
         self._eat_keyword("return")
 
-        if self.cur_tkn.text != " ; ":
+        if self.cur_tkn.value != ";":
             self._compile_expression()
+            self.vm_writer.mark_source(offset)
         else:
             self.vm_writer.write_push("CONST", 0)
 
         self.vm_writer.write_return()
         self._eat_symbol(";")
 
-        self.ast.current_node = return_stmt.getparent()
+        self._tree.current_node = return_stmt.parent
 
     def _compile_expression(self):
         """ Compiles an expression """
 
-        expression = self.ast.append(tag="expression")
+        expression = self._tree.append(Expression)
         self._compile_term()
 
-        while self.cur_tkn.text in OPERATORS:
+        while self.cur_tkn.value in OPERATORS:
+            offset = self.cur_tkn.offset
             command = self._eat_symbol()
+            expression.operators.append(command)
             self._compile_term()
+            self.vm_writer.mark_source(offset)
             if command == "+":
                 self.vm_writer.write_arithmetic("ADD")
             elif command == "|":
@@ -330,103 +411,117 @@ class CompilationEngine():
                 assert command == "/", "unexpected command '{}', expected '/'".format(command)
                 self.vm_writer.write_call("Math.divide", 2)
 
-        self.ast.current_node = expression.getparent()
+        self._tree.current_node = expression.parent
 
-    def _compile_term(self):
+    def _compile_term(self, do_statement=False):
         """ Compiles a term
 
         If the current token is an identifier, the routines must distinguish between a variable, an array entry, or a
         subroutine call. A single lookahead token (which may be one of '[', '(', or '.') suffices to distinguish
-        between the possibilities. Any other token is not part of this term and should not be advanced over. """
-        term = self.ast.append("term") if self.ast.current_node.tag != "doStatement" else None
+        between the possibilities. Any other token is not part of this term and should not be advanced over.
 
-        tkn_tag = self.cur_tkn.tag
-        tkn_txt = self.cur_tkn.text
+        If do_statement is True the term is the subroutine call of a do statement: it gets no 'term' node, and the
+        value the call returns is discarded. """
+        term = self._tree.append(Term) if not do_statement else None
 
-        if tkn_tag in ["integerConstant", "keyword", "stringConstant"]:
+        tkn_kind = self.cur_tkn.kind
+        tkn_txt = self.cur_tkn.value
+        offset = self.cur_tkn.offset
+        self.vm_writer.mark_source(offset)
+
+        if tkn_kind in CONSTANT_KINDS:
             # term -> integerConstant | stringConstant | keywordConstant
             value = self._eat()
-            if tkn_tag == "integerConstant":
-                self.vm_writer.write_push("CONST", value)
-            elif tkn_tag == "stringConstant":
+            if tkn_kind == INT_CONST:
+                self.vm_writer.write_push("CONST", int(value))
+            elif tkn_kind == STRING_CONST:
                 self.vm_writer.write_string(tkn_txt)
-            elif tkn_txt == " true ":
+            elif tkn_txt == "true":
                 self.vm_writer.write_push("CONST", 0)
                 self.vm_writer.write_arithmetic("NOT")
-            elif tkn_txt in [" false ", " null "]:
+            elif tkn_txt == "false" or tkn_txt == "null":
                 self.vm_writer.write_push("CONST", 0)
             else:
-                assert tkn_txt == " this ", "expected ' this ', got {}".format(tkn_txt)
+                assert tkn_txt == "this", "expected 'this', got {}".format(tkn_txt)
                 self.vm_writer.write_push("POINTER", 0)
 
-        elif tkn_txt in [" - ", " ~ "]:
+        elif tkn_txt in UNARY_OPERATORS:
             # term -> unaryOp term
             command = "NEG" if self._eat_symbol() == "-" else "NOT"
             self._compile_term()
+            self.vm_writer.mark_source(offset)
             self.vm_writer.write_arithmetic(command)
 
-        elif tkn_txt == " ( ":
+        elif tkn_txt == "(":
             # term -> '(' expression ')'
             self._eat_symbol("(")
             self._compile_expression()
             self._eat_symbol(")")
 
-        elif tkn_tag == 'identifier':
+        elif tkn_kind == IDENTIFIER:
             # need to lookahead
             identifier = self._eat_identifier()
             tkn_nxt = self.cur_tkn
 
-            if tkn_nxt.text == ' [ ':
+            if tkn_nxt.value == '[':
                 # term -> varName '[' expression ']'
-                variable = identifier
+                symbol = self.symbol_table.info_for_symbol(identifier)
                 self._eat_symbol("[")
                 self._compile_expression()
-                self.vm_writer.write_push(self.symbol_table.kind_of(variable), self.symbol_table.index_of(variable))
+                self.vm_writer.mark_source(offset)
+                self.vm_writer.write_push(symbol.kind, symbol.index)
                 self.vm_writer.write_arithmetic("ADD")
                 self.vm_writer.write_pop("POINTER", 1)
                 self.vm_writer.write_push("THAT", 0)
                 self._eat_symbol("]")
 
-            elif tkn_nxt.text == ' ( ' or tkn_nxt.text == ' . ':
-                self.calling_method = False
-                if self.cur_tkn.text == " . ":
+            elif tkn_nxt.value == '(' or tkn_nxt.value == '.':
+                calling_method = False
+                if self.cur_tkn.value == ".":
                     self._eat_symbol(".")
-                    subroutine_name = self._eat_identifier().strip()
+                    subroutine_name = self._eat_identifier()
 
-                    if self.symbol_table.recognises_symbol(tkn_txt.strip()):
+                    symbol = self.symbol_table.info_for_symbol(tkn_txt)
+                    if symbol is not None:
                         # term -> varName '.' subroutineName '(' expressionList ')'  // a method call
                         # tkn_text is a varName
                         # .jack: do game.run()
                         # .vm:   function PongGame.run 1 // 1 arg (self)
-                        symbol = self.symbol_table.info_for_symbol(tkn_txt.strip())
                         self.vm_writer.write_push(symbol.kind, symbol.index)
                         call_name = symbol.type + "." + subroutine_name
-                        self.calling_method = True
+                        calling_method = True
 
                     else:
                         # term -> className '.' subroutineName '(' expressionList ')'  // a subroutine call
                         # tkn_txt is className
                         # .jack: PongGame.newInstance()
                         # .vm:   call PongGame.newInstance 0 // (no args)
-                        call_name = tkn_txt.strip() + "." + subroutine_name
+                        call_name = tkn_txt + "." + subroutine_name
+
+                elif self._calls_function(identifier):
+                    # term -> subroutineName '(' expressionList ')'  // a function (or constructor) of this class
+                    # .jack: do reset()
+                    # .vm:   call PongGame.reset 0
+                    call_name = self.class_name + "." + identifier
 
                 else:
                     # term -> subroutineName '(' expressionList ')'  // a method call
                     # .jack: do moveBall()
                     # .vm:   call PongGame.moveBall 1
                     self.vm_writer.write_push("POINTER", 0)
-                    call_name = self.ast.class_name + "." + identifier
-                    self.calling_method = True
+                    call_name = self.class_name + "." + identifier
+                    calling_method = True
 
                 self._eat_symbol("(")
-                self._compile_expressison_list()
+                expression_list = self._compile_expressison_list()
                 self._eat_symbol(")")
+                self.vm_writer.mark_source(offset)
 
-                num_args = len(self.ast.current_node.findall("expressionList/expression"))
-                num_args += 1 if self.calling_method else 0
+                num_args = expression_list.num_expressions
+                num_args += 1 if calling_method else 0
                 self.vm_writer.write_call(call_name, num_args)
 
-                if self.ast.stmt.tag.find("let") == -1:
+                if do_statement:
                     self.vm_writer.write_pop("TEMP", 0)
 
             else:
@@ -435,62 +530,78 @@ class CompilationEngine():
                     self.vm_writer.write_push(symbol_info.kind, symbol_info.index)
 
         if term is not None:
-            self.ast.current_node = term.getparent()
+            self._tree.current_node = term.parent
+
+    def _calls_function(self, subroutine_name):
+        """ Returns True if the signature index knows subroutine_name to be a function or constructor of the class
+        being compiled. """
+        if self.signature_index is None:
+            return False
+        signature = self.signature_index.signature_of(self.class_name, subroutine_name)
+        return signature is not None and signature.kind != "method"
 
     def _compile_expressison_list(self):
-        """ Compiles a (possibly empty) comma-separated list of expressions """
-        expression_list = self.ast.append("expressionList")
+        """ Compiles a (possibly empty) comma-separated list of expressions, returning its node """
+        expression_list = self._tree.append(ExpressionList)
 
-        if self.cur_tkn.text != ' ) ':
+        if self.cur_tkn.value != ')':
             while True:
                 self._compile_expression()
-                if self.cur_tkn.text != ' , ':
+                expression_list.num_expressions += 1
+                if self.cur_tkn.value != ',':
                     break
                 self._eat_symbol(",")
 
-        self.ast.current_node = expression_list.getparent()
+        self._tree.current_node = expression_list.parent
+        return expression_list
 
     # Consuming tokens
 
     def _eat_symbol(self, expected_value=None):
-        return self._validate_and_insert_current_token("symbol", expected_value).text.strip()
+        return self._validate_and_insert_current_token(SYMBOL, expected_value).value
 
     def _eat_identifier(self, expected_value=None):
-        return self._validate_and_insert_current_token("identifier", expected_value).text.strip()
+        return self._validate_and_insert_current_token(IDENTIFIER, expected_value).value
 
     def _eat_string_constant(self, expected_value=None):
-        return self._validate_and_insert_current_token("stringConstant", expected_value).text.strip()
+        return self._validate_and_insert_current_token(STRING_CONST, expected_value).value
 
     def _eat_integer_constant(self, expected_value=None):
-        return self._validate_and_insert_current_token("integerConstant", expected_value).text.strip()
+        return self._validate_and_insert_current_token(INT_CONST, expected_value).value
 
     def _eat_keyword(self, expected_value=None):
-        return self._validate_and_insert_current_token("keyword", expected_value).text.strip()
-
-    def _eat(self, expected_value=None, expected_pattern=None):
-        subelement = self._validate_and_insert_current_token(expected_value=expected_value,
-                                                             expected_pattern=expected_pattern)
-        return subelement.text.strip()
-
-    def _validate_and_insert_current_token(self, expected_type=None, expected_value=None, expected_pattern=None):
-        tkn_type = self.cur_tkn.tag
-        tkn_text = self.cur_tkn.text
-        if expected_type is not None:
-            assert tkn_type == expected_type, \
-                "unexpected token type; type of current token '{}' is '{}', not '{}'".format(tkn_text, tkn_type, expected_type)
+        return self._validate_and_insert_current_token(KEYWORD, expected_value).value
+
+    def _eat_type(self):
+        """ Consumes a type: int, char, boolean or a class name """
+        token = self.cur_tkn
+        assert token.kind == IDENTIFIER or token.value in PRIMITIVE_TYPES, \
+            "expected a type, got '{}'".format(token.value)
+        return self._validate_and_insert_current_token().value
+
+    def _eat(self, expected_value=None):
+        return self._validate_and_insert_current_token(expected_value=expected_value).value
+
+    def _validate_and_insert_current_token(self, expected_kind=None, expected_value=None):
+        """ Checks the current token against the expectations supplied, adds it to the ast and advances past it.
+
+        expected_value is either a single value or a frozenset of the values allowed. Returns the token that was
+        consumed. """
+        token = self.cur_tkn
+        if expected_kind is not None:
+            assert token.kind == expected_kind, \
+                "unexpected token type; type of current token '{}' is '{}', not '{}'".format(token.value, token.tag,
+                                                                                            TOKEN_TAGS[expected_kind])
         if expected_value is not None:
-            try:
-                assert tkn_text == " " + expected_value + " ", \
-                    "unexpected value; value of current token is '{}' not '{}'".format(tkn_text, expected_value)
-            except TypeError:
-                assert tkn_text in [" " + v + " " for v in expected_value], \
-                    "unexpected value; value of current token '{}' is not in '{}'".format(tkn_text, expected_value)
-        if expected_pattern is not None:
-            regex = re.compile(expected_pattern)
-            assert regex.search(tkn_text) is not None, \
-                "expected current token value to match pattern {}; it didn't.".format(expected_pattern)
-
-        subelement = self.ast.append_leaf(tag=self.cur_tkn.tag, text=self.cur_tkn.text)
+            if isinstance(expected_value, str):
+                assert token.value == expected_value, \
+                    "unexpected value; value of current token is '{}' not '{}'".format(token.value, expected_value)
+            else:
+                assert token.value in expected_value, \
+                    "unexpected value; value of current token '{}' is not in '{}'".format(token.value,
+                                                                                          sorted(expected_value))
+
+        self._tree.append_token(token)
 
         self.tknzr.advance()
-        return subelement
\ No newline at end of file
+        return token
@@ -0,0 +1,111 @@
+__author__ = 'paulpatterson'
+
+## Inlines calls to small leaf functions: the callee's body replaces the call, saving the cost of building and
+## tearing down a vm frame. It works on the VMCode of a whole program, so that functions can be inlined across
+## classes.
+##
+## A function can be inlined if its body (without its function and return commands) has at most threshold
+## instructions, ends with its only return and is straight-line code: no labels, no jumps, and no calls (so it
+## cannot be recursive). A function that uses the static segment is only inlined into its own class, as statics
+## belong to the class whose vm file they appear in.
+##
+## At the call site the arguments are popped (last first) into locals added to the caller, after which the callee's
+## body runs with its argument and local segments remapped onto the caller's new locals; the callee's own locals are
+## zeroed first, as a function command would. If the callee sets pointer 0 (a method does, to reach its fields) the
+## caller's pointer 0 is saved in another new local and restored once the body has left its result on the stack.
+## Inlined bodies never overlap (the arguments of a call are fully evaluated before its body starts) so every call
+## site in a function shares the same new locals.
+
+from collections import Counter
+
+from jack_compiler.Optimizer import split_functions
+from jack_compiler.VMCode import VMCode, Instruction, PUSH, POP, LABEL, GOTO, IF_GOTO, CALL, FUNCTION, RETURN, \
+    CONSTANT, ARGUMENT, LOCAL, STATIC, POINTER
+
+DEFAULT_INLINE_THRESHOLD = 8
+
+CONTROL_OPCODES = (LABEL, GOTO, IF_GOTO, CALL, FUNCTION, RETURN)
+POINTER_0 = (POINTER, 0)
+
+
+def inline_calls(vm_codes, threshold=DEFAULT_INLINE_THRESHOLD):
+    """ Inlines every call, in vm_codes (a list holding the VMCode of each class in a program), to a function that
+    can be inlined under threshold.
+
+    Returns a list holding the new VMCode of each class, and a Counter giving the number of calls inlined for each
+    (caller, callee) pair of function names. """
+    functions = [function for vm_code in vm_codes for function in split_functions(vm_code)]
+    inlinable = {function[0].name: function for function in functions if _can_inline(function, threshold)}
+
+    inlined_calls = Counter()
+    inlined_vm_codes = []
+    for vm_code in vm_codes:
+        inlined_vm_code = VMCode()
+        for function in split_functions(vm_code):
+            for instruction in _inline_calls_in_function(function, inlinable, inlined_calls):
+                inlined_vm_code.append(*instruction)
+        inlined_vm_codes.append(inlined_vm_code)
+    return inlined_vm_codes, inlined_calls
+
+
+def _can_inline(function, threshold):
+    """ Returns True if calls to function (a list of Instructions, starting with its function command) can be
+    replaced by its body. """
+    body = function[1:]
+    return len(body) - 1 <= threshold and len(body) > 0 and body[-1].opcode == RETURN and \
+        not any(instruction.opcode in CONTROL_OPCODES for instruction in body[:-1])
+
+
+def _inline_calls_in_function(function, inlinable, inlined_calls):
+    """ Returns the instructions of function with every call to a function in inlinable replaced by its body, and
+    records each call replaced in inlined_calls. """
+    header = function[0]
+    caller_class = _class_name(header.name)
+    num_new_locals = 0
+    instructions = [header]
+
+    for instruction in function[1:]:
+        callee = inlinable.get(instruction.name) if instruction.opcode == CALL else None
+        if callee is None or (_class_name(callee[0].name) != caller_class and _uses_statics(callee)):
+            instructions.append(instruction)
+            continue
+
+        num_args = instruction.arg
+        args_base = header.arg
+        locals_base = args_base + num_args
+        body = callee[1:-1]
+        saves_pointer = any(_is_pop_to(body_instruction, POINTER_0) for body_instruction in body)
+        saved_pointer = locals_base + callee[0].arg
+        num_new_locals = max(num_new_locals, num_args + callee[0].arg + (1 if saves_pointer else 0))
+
+        for index in reversed(range(num_args)):
+            instructions.append(Instruction(POP, LOCAL, None, args_base + index))
+        for index in range(callee[0].arg):
+            instructions.extend([Instruction(PUSH, CONSTANT, None, 0),
+                                 Instruction(POP, LOCAL, None, locals_base + index)])
+        if saves_pointer:
+            instructions.extend([Instruction(PUSH, POINTER, None, 0), Instruction(POP, LOCAL, None, saved_pointer)])
+        for body_instruction in body:
+            if body_instruction.segment == ARGUMENT:
+                body_instruction = body_instruction._replace(segment=LOCAL, arg=args_base + body_instruction.arg)
+            elif body_instruction.segment == LOCAL:
+                body_instruction = body_instruction._replace(arg=locals_base + body_instruction.arg)
+            instructions.append(body_instruction)
+        if saves_pointer:
+            instructions.extend([Instruction(PUSH, LOCAL, None, saved_pointer), Instruction(POP, POINTER, None, 0)])
+        inlined_calls[(header.name, callee[0].name)] += 1
+
+    instructions[0] = header._replace(arg=header.arg + num_new_locals)
+    return instructions
+
+
+def _uses_statics(function):
+    return any(instruction.segment == STATIC for instruction in function)
+
+
+def _is_pop_to(instruction, location):
+    return instruction.opcode == POP and (instruction.segment, instruction.arg) == location
+
+
+def _class_name(function_name):
+    return function_name.split(".")[0]
@@ -1,72 +1,455 @@
 __author__ = 'paulpatterson'
 
-from pathlib import Path
-import tempfile
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import time
 from jack_compiler.Tokenizer import Tokenizer
 from jack_compiler.VMWriter import VMWriter
 from jack_compiler.CompilationEngine import CompilationEngine
+from jack_compiler.BuildCache import BuildCache, hash_file, COMPILER_VERSION
+from jack_compiler.Optimizer import optimize, OPTIMIZATION_LEVELS
+from jack_compiler.CallGraph import build_call_graph, reachable_functions, prune_functions, ROOT_FUNCTIONS
+from jack_compiler.Inliner import inline_calls
+from jack_compiler.SignatureIndex import SignatureIndex, build_signature_index, scan_signatures
+from jack_compiler.SemanticChecker import SemanticChecker
+from jack_compiler.SourceMap import write_source_map, source_map_path
+
+DEFAULT_POLL_INTERVAL = 0.5
+
+CompilationResult = namedtuple("CompilationResult", "vm_code ast num_instructions_removed vm_instructions diagnostics")
 
 
 class JackCompiler():
 
-    def __init__(self, path=None):
+    def __init__(self, path=None, jobs=1, use_cache=False, optimization_level=0, whole_program=False,
+                 inline_threshold=None, build_syntax_trees=True, check=False, source_maps=False):
         """ Creates a new JackCompiler instance. If path is set is should point to a jack file, or a directory
-        containing at least one such file. """
+        containing at least one such file. (Without a path, there is nothing to compile unless the instance was
+        created by compiler_for_jack_string.)
+
+        If jobs is greater than one, the files are compiled in parallel by a pool of that many processes.
+
+        If use_cache is True, a build cache is kept alongside the output, and files whose contents (and whose
+        compiler) have not changed since they were last compiled are skipped.
+
+        optimization_level selects the vm optimizations applied to each class (see Optimizer.py); the number of
+        instructions they remove from each class is stored in instructions_removed, by file name. The build cache
+        only reuses output compiled at the same level.
+
+        If whole_program is True the files are treated as a complete program: every class is compiled before any vm
+        is written, and functions that cannot be reached from Main.main (see CallGraph.py) are left out of the vm
+        files. Their names are stored in removed_functions. The build cache is not used, as the output for each
+        class then depends on every other class.
+
+        If inline_threshold is set (which needs whole_program), calls to small leaf functions of at most that many
+        instructions are inlined before unreachable functions are removed (see Inliner.py). The number of calls
+        inlined is stored in inlined_calls, for each (caller, callee) pair.
+
+        Before anything is compiled, the headers of every file are scanned into signature_index (see SignatureIndex.py),
+        which tells the compiler what each subroutine of the build is. The signatures are cached alongside the source
+        whenever the build cache is used.
+
+        If build_syntax_trees is False, only vm code is generated: no syntax tree is built, and
+        abstract_syntax_trees stays empty, so the memory a build needs depends on the size of its largest class
+        rather than the size of the whole program.
+
+        If check is True every class is also run through the SemanticChecker. Its diagnostics are stored in
+        diagnostics, by file path, and once every file has been compiled they are all reported together by raising an
+        AssertionError. A file with diagnostics does not count as compiled, and since a class's diagnostics depend on
+        the signatures of the others, the build cache is invalidated whenever any signature changes.
+
+        If source_maps is True a source map (see SourceMap.py) is written alongside each vm file, recording the line
+        and column of jack code each vm command came from. Maps describe unoptimized code, so they cannot be combined
+        with an optimization level above 0 or with whole_program. """
+        assert optimization_level in OPTIMIZATION_LEVELS, \
+            "unknown optimization level {}, expected one of {}".format(optimization_level, OPTIMIZATION_LEVELS)
+        assert inline_threshold is None or whole_program, "inlining is only supported in whole-program mode"
+        assert not source_maps or (optimization_level == 0 and not whole_program), \
+            "source maps are only supported for unoptimized builds that are not whole-program"
+        self.path = path
         self.jack_file_paths = []
+        self.compiled_file_paths = []
         self._abstract_syntax_trees = []
         self.outfile = None
-        self.using_temporary_file_path = False
+        self.jack_code = None
+        self.vm_code = None
+        self.jobs = jobs
+        self.use_cache = use_cache
+        self.optimization_level = optimization_level
+        self.instructions_removed = {}
+        self.whole_program = whole_program
+        self.removed_functions = []
+        self.inline_threshold = inline_threshold
+        self.inlined_calls = {}
+        self.build_syntax_trees = build_syntax_trees
+        self.signature_index = None
+        self.check = check
+        self.diagnostics = {}
+        self.source_maps = source_maps
+        self._whole_program_code = {}
+        self._watched_files = {}
+
+        if path is None:
+            return
 
         assert path.exists(), \
             "Compilation failed: non-existent path '{}'".format(path.as_posix())
         if path.is_file():
             assert path.suffix == ".jack", \
                 "Compilation failed: supplied filename must have '.jack' extension, not '{}'".format(path.suffix)
-            self.jack_file_paths = [path]
-        else:
-            for child in path.iterdir():
-                if child.is_file() and child.suffix == ".jack":
-                    self.jack_file_paths.append(child)
+        self.jack_file_paths = self._find_jack_files()
 
     @classmethod
     def compiler_for_jack_string(cls, jack_string, outfile):
-        """ Allows clients to compile a string of valid jack code. The resulting vm is written to outfile. """
-        assert outfile.suffix == ".vm", "{} should have .vm extension".format(outfile.as_posix())
+        """ Allows clients to compile a string of valid jack code.
 
-        temporary_file = tempfile.NamedTemporaryFile(delete=False, suffix=".jack")
-        temporary_file_path = Path(temporary_file.name)
-        with open(temporary_file_path.as_posix(), "w+") as jack_file:
-            jack_file.write(jack_string)
+        The string is compiled in memory: once compile has been called the resulting vm is available from vm_code,
+        and its tree from abstract_syntax_trees. Nothing is written to outfile, which is accepted for compatibility
+        (the vm used to be written there, and the file deleted again by compile). """
+        assert outfile.suffix == ".vm", "{} should have .vm extension".format(outfile.as_posix())
 
-        jack_compiler = cls(temporary_file_path)
+        jack_compiler = cls()
+        jack_compiler.jack_code = jack_string
         jack_compiler.outfile = outfile
 
         return jack_compiler
 
     def compile(self):
-        """ Compiles every .jack file contained within jack_file_paths """
-        for jack_file in self.jack_file_paths:
-            if self.outfile is not None:
-                vm_file_path = self.outfile
+        """ Compiles every .jack file contained within jack_file_paths (or, when the build cache is in use, every
+        such file that has changed since it was last compiled).
+
+        The paths of the files actually compiled are stored in compiled_file_paths. """
+        if self.jack_code is not None:
+            self.signature_index = _signature_index_of(self.jack_code)
+            result = compile_jack_code(self.jack_code, self.optimization_level, self.build_syntax_trees,
+                                       self.signature_index, self.check)
+            self.vm_code = result.vm_code
+            self.instructions_removed[self.outfile.with_suffix(".jack").name] = result.num_instructions_removed
+            if result.ast is not None:
+                self.abstract_syntax_trees.append(result.ast)
+            self.diagnostics = {self.outfile.with_suffix(".jack"): result.diagnostics} if result.diagnostics else {}
+            self._assert_no_diagnostics()
+            return
+
+        self.compiled_file_paths = []
+        self.diagnostics = {}
+        self.signature_index = self._build_signature_index()
+        build_cache = self._open_build_cache()
+        jack_file_paths = self.jack_file_paths
+        if build_cache is not None:
+            jack_file_paths = [jack_file for jack_file in jack_file_paths
+                               if not self._is_fresh(build_cache, jack_file)]
+
+        try:
+            if self.jobs > 1 and len(jack_file_paths) > 1:
+                self._compile_in_parallel(jack_file_paths)
+            else:
+                for jack_file in jack_file_paths:
+                    result = compile_jack_file(jack_file, self._output_file_path(jack_file), self.optimization_level,
+                                               self.build_syntax_trees, self.signature_index, self.check,
+                                               self.source_maps)
+                    self._record_result(jack_file, result)
+            self._assert_no_diagnostics()
+            if self.whole_program:
+                self._write_reachable_functions()
+        finally:
+            if build_cache is not None:
+                for jack_file in self.compiled_file_paths:
+                    build_cache.record(jack_file, self._vm_file_path(jack_file))
+                build_cache.save()
+
+    def _compile_in_parallel(self, jack_file_paths):
+        """ Compiles every file in jack_file_paths on a pool of self.jobs processes.
+
+        A file that fails to compile does not stop the others. Once every file has been attempted, any failures are
+        reported together, in the same order as jack_file_paths, by raising an AssertionError. """
+        vm_file_paths = [self._output_file_path(jack_file) for jack_file in jack_file_paths]
+        with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+            results = list(executor.map(_compile_jack_file_reporting_errors, jack_file_paths, vm_file_paths,
+                                        repeat(self.optimization_level), repeat(self.build_syntax_trees),
+                                        repeat(self.signature_index), repeat(self.check),
+                                        repeat(self.source_maps)))
+
+        errors = []
+        for jack_file, (result, error) in zip(jack_file_paths, results):
+            if error is None:
+                self._record_result(jack_file, result)
             else:
-                jack_file_name = jack_file.stem
-                vm_file_path = jack_file.with_name(jack_file_name + ".vm")
+                errors.append("{}: {}".format(jack_file.as_posix(), error))
+
+        assert len(errors) == 0, "Compilation failed for {} file(s):\n{}".format(len(errors), "\n".join(errors))
+
+    def _record_result(self, jack_file, result):
+        """ Records the CompilationResult of successfully compiling jack_file (or, if the checker found errors in it,
+        its diagnostics). """
+        if len(result.diagnostics) > 0:
+            self.diagnostics[jack_file] = result.diagnostics
+            return
+        if result.ast is not None:
+            self.abstract_syntax_trees.append(result.ast)
+        self.compiled_file_paths.append(jack_file)
+        self.instructions_removed[jack_file.name] = result.num_instructions_removed
+        if self.whole_program:
+            self._whole_program_code[jack_file] = result.vm_instructions
+
+    def _assert_no_diagnostics(self):
+        """ Raises an AssertionError listing every diagnostic, by file and then position, if there are any. """
+        num_diagnostics = sum(len(diagnostics) for diagnostics in self.diagnostics.values())
+        assert num_diagnostics == 0, "Compilation failed with {} error(s):\n{}".format(
+            num_diagnostics, "\n".join(format_diagnostic(jack_file, diagnostic)
+                                       for jack_file in sorted(self.diagnostics)
+                                       for diagnostic in self.diagnostics[jack_file]))
+
+    def _write_reachable_functions(self):
+        """ Writes the vm file of every class compiled in whole-program mode, leaving out the functions that cannot be
+        reached from the program's entry points (once calls have been inlined, if inlining is on). """
+        if self.inline_threshold is not None:
+            jack_files = list(self._whole_program_code)
+            vm_codes, self.inlined_calls = inline_calls(list(self._whole_program_code.values()), self.inline_threshold)
+            self._whole_program_code = dict(zip(jack_files, vm_codes))
+
+        call_graph = build_call_graph(self._whole_program_code.values())
+        assert "Main.main" in call_graph, "Compilation failed: a whole program needs a Main.main function"
+        reachable = reachable_functions(call_graph, ROOT_FUNCTIONS)
+
+        self.removed_functions = []
+        for jack_file, vm_instructions in self._whole_program_code.items():
+            vm_instructions, removed_functions = prune_functions(vm_instructions, reachable)
+            self.removed_functions.extend(removed_functions)
+            with VMWriter(self._vm_file_path(jack_file)) as vm_writer:
+                vm_writer.vm_instructions = vm_instructions
+        self._whole_program_code = {}
+
+    def watch(self, poll_interval=DEFAULT_POLL_INTERVAL, report=print, max_polls=None):
+        """ Compiles every out-of-date file, then polls the source path every poll_interval seconds, recompiling
+        only those files that have changed. Runs until interrupted, or until max_polls polls have been made. (Watching
+        is not supported in whole-program mode.)
+
+        report is called with a line of text for every file compiled (giving the time it took) and for every file
+        that fails to compile; failures do not stop the watch. """
+        assert not self.whole_program, "watch does not support whole-program compilation"
+        polls = 0
+        while True:
+            self.recompile_changed_files(report)
+            polls += 1
+            if max_polls is not None and polls >= max_polls:
+                return
+            time.sleep(poll_interval)
 
-            tokenizer = Tokenizer(jack_filepath=jack_file)
-            vm_writer = VMWriter(vm_file_path)
+    def recompile_changed_files(self, report=print):
+        """ Compiles every .jack file under the source path that is new, or has changed, since the previous call,
+        and returns the paths of the files compiled.
 
-            compilation_engine = CompilationEngine(tokenizer, vm_writer)
-            compilation_engine.compile()
-            self.abstract_syntax_trees.append(compilation_engine.ast)
+        A file's modification time and size are checked first; only if they differ is its contents hashed, so that
+        touching a file without changing it does not trigger a compile. On the first call every file counts as new,
+        unless the build cache is in use and says it is up to date. Trees are not built, so watching does not
+        accumulate memory.
 
+        When checking, a change to any signature means every file is checked (and so compiled) again. """
+        self.jack_file_paths = self._find_jack_files()
+        if self.signature_index is None:
+            self.signature_index = self._build_signature_index()
+        build_cache = self._open_build_cache()
+        changed_files = []
+
+        watched_files = {}
+        for jack_file in self.jack_file_paths:
+            stat = jack_file.stat()
+            signature = (stat.st_mtime_ns, stat.st_size)
+            previous = self._watched_files.get(jack_file)
+            if previous is not None and previous[0] == signature:
+                watched_files[jack_file] = previous
+                continue
+
+            source_hash = hash_file(jack_file)
+            watched_files[jack_file] = (signature, source_hash)
+            if previous is not None and previous[1] == source_hash:
+                continue
+            if previous is None and build_cache is not None and self._is_fresh(build_cache, jack_file):
+                continue
+            changed_files.append(jack_file)
+        self._watched_files = watched_files
+        if len(changed_files) > 0:
+            previous_digest = self.signature_index.digest()
+            self.signature_index = self._build_signature_index()
+            if self.check and self.signature_index.digest() != previous_digest:
+                changed_files = list(self.jack_file_paths)
+                build_cache = self._open_build_cache()
+
+        compiled_files = []
+        for jack_file in changed_files:
+            start = time.perf_counter()
+            try:
+                result = compile_jack_file(jack_file, self._vm_file_path(jack_file), self.optimization_level,
+                                           build_ast=False, signature_index=self.signature_index, check=self.check,
+                                           source_map=self.source_maps)
+            except Exception as e:
+                report("{}: failed ({}: {})".format(jack_file.name, type(e).__name__, e))
+                continue
+            if len(result.diagnostics) > 0:
+                report("{}: failed ({} error(s))".format(jack_file.name, len(result.diagnostics)))
+                for diagnostic in result.diagnostics:
+                    report(format_diagnostic(jack_file, diagnostic))
+                continue
+            message = "{}: compiled in {:.1f} ms".format(jack_file.name, 1000 * (time.perf_counter() - start))
+            if self.optimization_level > 0:
+                message += ", {} vm instruction(s) removed".format(result.num_instructions_removed)
+            report(message)
+            compiled_files.append(jack_file)
+
+        if build_cache is not None and len(compiled_files) > 0:
+            for jack_file in compiled_files:
+                build_cache.record(jack_file, self._vm_file_path(jack_file))
+            build_cache.save()
+
+        return compiled_files
+
+    def _find_jack_files(self):
+        """ Returns a sorted list of the .jack files at (or, for a directory, in) the source path. """
+        if self.path is None:
+            return []
+        if self.path.is_file():
+            return [self.path]
+        return [child for child in sorted(self.path.iterdir()) if child.is_file() and child.suffix == ".jack"]
+
+    def _build_signature_index(self):
+        """ Returns the SignatureIndex of every file in jack_file_paths, caching it alongside them whenever the build
+        cache would be used. """
+        cache_directory = None
+        if self.use_cache and not self.whole_program and self.outfile is None and len(self.jack_file_paths) > 0:
+            cache_directory = self.jack_file_paths[0].parent
+        return build_signature_index(self.jack_file_paths, cache_directory)
+
+    def _open_build_cache(self):
+        """ Returns the BuildCache for this compilation, or None if no cache should be used. """
+        if not self.use_cache or self.whole_program or self.outfile is not None or len(self.jack_file_paths) == 0:
+            return None
+        compiler_version = COMPILER_VERSION
+        if self.optimization_level > 0:
+            compiler_version += "-O{}".format(self.optimization_level)
+        if self.check:
+            compiler_version += "-checked-{}".format(self.signature_index.digest())
+        if self.source_maps:
+            compiler_version += "-mapped"
+        return BuildCache(self.jack_file_paths[0].parent, compiler_version)
+
+    def _is_fresh(self, build_cache, jack_file):
+        """ Returns True if build_cache says jack_file need not be compiled again (and, if source maps are being
+        written, its source map is still there). """
+        vm_file_path = self._vm_file_path(jack_file)
+        if self.source_maps and not source_map_path(vm_file_path).exists():
+            return False
+        return build_cache.is_fresh(jack_file, vm_file_path)
+
+    def _output_file_path(self, jack_file):
+        """ Returns the path compiling jack_file should write to: None in whole-program mode, where the vm is only
+        written once the whole program has been compiled, otherwise its .vm file. """
+        return None if self.whole_program else self._vm_file_path(jack_file)
+
+    def _vm_file_path(self, jack_file):
+        """ Returns the path of the .vm file that jack_file compiles to. """
         if self.outfile is not None:
-            self.outfile.unlink()
+            return self.outfile
+        return jack_file.with_name(jack_file.stem + ".vm")
 
     # Debugging / testing
 
     @property
     def abstract_syntax_trees(self):
-        """ List containing an AbstractSyntaxTree instance for every .jack file that was successfully compiled. """
+        """ List containing an AbstractSyntaxTree instance for every .jack file that was successfully compiled (empty
+        unless syntax trees are built). """
         return self._abstract_syntax_trees
 
 
+def compile_jack_file(jack_file, vm_file_path, optimization_level=0, build_ast=True, signature_index=None,
+                      check=False, source_map=False):
+    """ Compiles jack_file, writing the resulting vm code to vm_file_path (unless it is None). signature_index, if
+    given, is the SignatureIndex of the build jack_file is part of; if check is True the class is also run through the
+    SemanticChecker. If source_map is True (which needs a vm_file_path, and optimization level 0) a source map is
+    written alongside the vm file. If the checker finds errors, neither file is left behind.
+
+    Returns a CompilationResult holding the class's AbstractSyntaxTree (None unless build_ast is True), the number of
+    instructions removed by the optimizer, the class's VMCode (its vm_code is None) and a list of the checker's
+    Diagnostics. """
+    assert not source_map or (vm_file_path is not None and optimization_level == 0), \
+        "a source map needs a vm file, and unoptimized vm code"
+    tokenizer = Tokenizer(jack_filepath=jack_file)
+    with VMWriter(vm_file_path, source_map) as vm_writer:
+        ast, num_instructions_removed, diagnostics = _compile(tokenizer, vm_writer, optimization_level, build_ast,
+                                                              signature_index, check)
+        if len(diagnostics) > 0:
+            vm_writer.discard()
+    if len(diagnostics) > 0:
+        if source_map and source_map_path(vm_file_path).exists():
+            source_map_path(vm_file_path).unlink()
+    elif source_map:
+        write_source_map(jack_file, vm_file_path, vm_writer.source_offsets, tokenizer.position)
+    return CompilationResult(None, ast, num_instructions_removed, vm_writer.vm_instructions, diagnostics)
+
+
+def compile_jack_code(jack_code, optimization_level=0, build_ast=True, signature_index=None, check=False):
+    """ Compiles a string holding the code of one jack class, entirely in memory. signature_index, if given, is the
+    SignatureIndex of the build the class is part of (by default, one holding just this class, so that unqualified
+    calls to its functions are told apart from calls to its methods); if check is True the class is also run through
+    the SemanticChecker.
+
+    Returns a CompilationResult holding the resulting vm code (as a string), the class's AbstractSyntaxTree (None
+    unless build_ast is True), the number of instructions removed by the optimizer, the class's VMCode and a list of
+    the checker's Diagnostics. """
+    if signature_index is None:
+        signature_index = _signature_index_of(jack_code)
+    with VMWriter() as vm_writer:
+        ast, num_instructions_removed, diagnostics = _compile(Tokenizer(jack_code=jack_code), vm_writer,
+                                                              optimization_level, build_ast, signature_index, check)
+    return CompilationResult(vm_writer.vm_code, ast, num_instructions_removed, vm_writer.vm_instructions, diagnostics)
+
+
+def format_diagnostic(jack_file, diagnostic):
+    """ Returns diagnostic as a line of text, in the file:line:column: message form that editors recognise. """
+    return "{}:{}:{}: {}".format(jack_file.as_posix(), diagnostic.line, diagnostic.column, diagnostic.message)
+
+
+def _signature_index_of(jack_code):
+    """ Returns a SignatureIndex holding the signatures of the one class declared by jack_code. """
+    signature_index = SignatureIndex()
+    class_name, signatures = scan_signatures(jack_code)
+    if class_name is not None:
+        signature_index.add_class(class_name, signatures)
+    return signature_index
+
+
+def _compile(tokenizer, vm_writer, optimization_level, build_ast, signature_index, check):
+    """ Compiles the class read by tokenizer into vm_writer's instructions, checks it (if check is True) and optimizes
+    it. Returns the class's AbstractSyntaxTree (None unless build_ast is True), the number of instructions the
+    optimizer removed and a list of the checker's Diagnostics.
+
+    Checking needs a syntax tree, so one is built when check is True, but it is only returned if build_ast is True. """
+    compilation_engine = CompilationEngine(tokenizer, vm_writer, build_ast or check, signature_index)
+    compilation_engine.compile()
+    ast = compilation_engine.ast if build_ast else None
+
+    diagnostics = []
+    if check:
+        diagnostics = SemanticChecker(compilation_engine.ast, signature_index, tokenizer.position).check()
+
+    if optimization_level == 0:
+        return ast, 0, diagnostics
+
+    vm_instructions = optimize(vm_writer.vm_instructions, optimization_level)
+    num_instructions_removed = len(vm_writer.vm_instructions) - len(vm_instructions)
+    vm_writer.vm_instructions = vm_instructions
+    return ast, num_instructions_removed, diagnostics
+
+
+def _compile_jack_file_reporting_errors(jack_file, vm_file_path, optimization_level, build_ast, signature_index,
+                                        check, source_map):
+    """ Runs compile_jack_file in a worker process. Returns a (result, error) pair, where exactly one of the two is
+    None.
+
+    Errors are returned as strings, rather than raised, so that one failure cannot hide the outcome of other files. """
+    try:
+        return compile_jack_file(jack_file, vm_file_path, optimization_level, build_ast, signature_index, check,
+                                 source_map), None
+    except Exception as e:
+        return None, "{}: {}".format(type(e).__name__, e)
@@ -0,0 +1,323 @@
+__author__ = 'paulpatterson'
+
+## The optimizer rewrites the VMCode of a class into shorter (or faster), equivalent, vm code. It is opt-in: level 0
+## (the default) leaves the code exactly as CompilationEngine wrote it, level 1 applies the peephole rewrites below.
+##
+## Peephole rewrites are made as the instructions are copied, by matching patterns against the tail of the copy; a
+## rewrite feeds its replacement back through the same matching, so that rewrites can enable further rewrites.
+##
+##   not; not                                         ->  (nothing)
+##   push constant 0; if-goto L                       ->  (nothing)
+##   push constant c; if-goto L (c != 0)             ->  goto L
+##   push constant c; not; if-goto L                  ->  goto L              (~c is never 0, as 0 <= c <= 32767)
+##   b; if-goto A; goto B; label A (A used only here) ->  b; not; if-goto B   (b a boolean, see below)
+##   goto L; label L                                  ->  label L
+##   push x; pop temp 0; pop pointer 1;
+##   push temp 0; pop that 0 (x not that/pointer)    ->  pop pointer 1; push x; pop that 0
+##
+## Constant expressions are folded, with the 16-bit wraparound of the Hack platform. A constant is any push constant,
+## optionally followed by neg or not (vm constants cannot be negative), so -3 + 1 folds to push constant 2; neg.
+##
+##   <constant a>; <constant b>; op                   ->  <constant a op b>   (op: add, sub, and, or, eq, gt, lt,
+##                                                                             Math.multiply, Math.divide)
+##   <constant a>; neg|not                            ->  <constant -a|~a>    (when that is shorter)
+##   <constant c>; if-goto L                          ->  goto L, or nothing when c is 0
+##
+## and operations on a constant are reduced where that avoids work (x is any value, and temp 0 is free as scratch):
+##
+##   x; push constant 0; add|sub|or                   ->  x
+##   x; push constant 1; call Math.multiply|divide    ->  x
+##   x; <constant -1>; call Math.multiply|divide      ->  x; neg
+##   x; push constant 0; call Math.multiply           ->  x; pop temp 0; push constant 0
+##   x; push constant 2^k; call Math.multiply         ->  x; (pop temp 0; push temp 0; push temp 0; add) k times,
+##                                                        for k <= MAX_DOUBLINGS
+##   push constant a; push y; call Math.multiply      ->  push y; push constant a; call Math.multiply
+##
+## There is no shift in the vm, so division by other powers of two still calls Math.divide.
+##
+## Jack treats any non-zero value as true, but not is bitwise (~5 is -6, also true), so a branch can only be inverted
+## with not when its condition is known to be 0 or -1: the result of eq, gt or lt, or the constant 0, each followed by
+## any number of nots.
+##
+## After the peephole rewrites, dead code is eliminated using the function's control flow: instructions that cannot be
+## reached from the start of the function (code after a return or a goto, branches that constant conditions have
+## made impossible) are removed, then labels that nothing jumps to, and gotos to the very next instruction. This
+## collapses, for example, if (false) { A } else { B } to B. The two passes are repeated until neither changes the
+## code.
+##
+## Labels are local to the function that declares them, so each function is optimized on its own.
+
+from collections import Counter
+
+from jack_compiler.VMCode import VMCode, Instruction, PUSH, POP, ADD, SUB, NEG, EQ, GT, LT, AND, OR, NOT, LABEL, \
+    GOTO, IF_GOTO, CALL, FUNCTION, RETURN, NO_SEGMENT, CONSTANT, POINTER, TEMP, THAT
+
+OPTIMIZATION_LEVELS = [0, 1]
+
+MAX_CONSTANT = 32767
+MAX_DOUBLINGS = 3
+
+NEG_INSTRUCTION = Instruction(NEG, NO_SEGMENT, None, 0)
+NOT_INSTRUCTION = Instruction(NOT, NO_SEGMENT, None, 0)
+ADD_INSTRUCTION = Instruction(ADD, NO_SEGMENT, None, 0)
+POP_TEMP_0 = Instruction(POP, TEMP, None, 0)
+POP_POINTER_1 = Instruction(POP, POINTER, None, 1)
+PUSH_TEMP_0 = Instruction(PUSH, TEMP, None, 0)
+POP_THAT_0 = Instruction(POP, THAT, None, 0)
+
+MULTIPLY = "Math.multiply"
+DIVIDE = "Math.divide"
+
+BINARY_FOLDS = {ADD: lambda x, y: x + y, SUB: lambda x, y: x - y, AND: lambda x, y: x & y, OR: lambda x, y: x | y,
+                EQ: lambda x, y: -1 if x == y else 0, GT: lambda x, y: -1 if x > y else 0,
+                LT: lambda x, y: -1 if x < y else 0}
+RIGHT_IDENTITIES = {ADD: 0, SUB: 0, OR: 0}
+
+
+def optimize(vm_code, optimization_level=1):
+    """ Returns an optimized copy of vm_code (at level 0, an exact copy). """
+    assert optimization_level in OPTIMIZATION_LEVELS, \
+        "unknown optimization level {}, expected one of {}".format(optimization_level, OPTIMIZATION_LEVELS)
+    if optimization_level == 0:
+        return VMCode(vm_code)
+
+    optimized = VMCode()
+    for function in split_functions(vm_code):
+        while True:
+            num_instructions = len(function)
+            function = eliminate_dead_code(PeepholeOptimizer(function).optimize())
+            if len(function) == num_instructions:
+                break
+        for instruction in function:
+            optimized.append(*instruction)
+    return optimized
+
+
+def split_functions(vm_code):
+    """ Returns vm_code as a list of functions, each a list of Instructions starting with its function command. """
+    functions = []
+    for instruction in vm_code:
+        if instruction.opcode == FUNCTION or len(functions) == 0:
+            functions.append([])
+        functions[-1].append(instruction)
+    return functions
+
+
+def eliminate_dead_code(instructions):
+    """ Returns the instructions of a single function without those that can never run, the labels that are never
+    jumped to, and gotos that jump to the next instruction. """
+    while True:
+        reachable = _reachable_instructions(instructions)
+        instructions = [instruction for instruction, is_reachable in zip(instructions, reachable) if is_reachable]
+
+        label_references = Counter(instruction.name for instruction in instructions
+                                   if instruction.opcode in (GOTO, IF_GOTO))
+        live_instructions = []
+        for instruction in instructions:
+            if instruction.opcode == LABEL:
+                if label_references[instruction.name] == 0:
+                    continue
+                if len(live_instructions) > 0 and live_instructions[-1].opcode == GOTO and \
+                        live_instructions[-1].name == instruction.name:
+                    del live_instructions[-1]
+                    label_references[instruction.name] -= 1
+                    if label_references[instruction.name] == 0:
+                        continue
+            live_instructions.append(instruction)
+
+        if len(live_instructions) == len(instructions):
+            return instructions
+        instructions = live_instructions
+
+
+def _reachable_instructions(instructions):
+    """ Returns a list holding, for each of a function's instructions, whether control can ever reach it. """
+    label_positions = {instruction.name: position for position, instruction in enumerate(instructions)
+                       if instruction.opcode == LABEL}
+    reachable = [False] * len(instructions)
+    starts = [0]
+    while len(starts) > 0:
+        position = starts.pop()
+        while position < len(instructions) and not reachable[position]:
+            reachable[position] = True
+            instruction = instructions[position]
+            if instruction.opcode == RETURN:
+                break
+            if instruction.opcode == GOTO:
+                position = label_positions[instruction.name]
+                continue
+            if instruction.opcode == IF_GOTO:
+                starts.append(label_positions[instruction.name])
+            position += 1
+    return reachable
+
+
+class PeepholeOptimizer():
+
+    def __init__(self, instructions):
+        """ Creates a PeepholeOptimizer for the instructions of a single function. """
+        self.instructions = instructions
+        self.label_references = Counter(instruction.name for instruction in instructions
+                                        if instruction.opcode in (GOTO, IF_GOTO))
+        self.output = []
+
+    def optimize(self):
+        """ Returns the function's instructions, with every peephole rewrite applied. """
+        self.output = []
+        for instruction in self.instructions:
+            self._emit(instruction)
+        return self.output
+
+    def _emit(self, instruction):
+        """ Appends instruction to the output, then rewrites the tail of the output if it matches a pattern. """
+        output = self.output
+        opcode = instruction.opcode
+
+        if opcode in BINARY_FOLDS:
+            right = _constant_before(output, len(output))
+            left = _constant_before(output, right[1]) if right is not None else None
+            if left is not None:
+                del output[left[1]:]
+                output.extend(constant_instructions(BINARY_FOLDS[opcode](left[0], right[0])))
+                return
+            if right is not None and right[1] == len(output) - 1 and RIGHT_IDENTITIES.get(opcode) == right[0]:
+                del output[-1]
+                return
+
+        elif opcode == NEG or opcode == NOT:
+            operand = _constant_before(output, len(output))
+            if operand is not None:
+                folded = constant_instructions(-operand[0] if opcode == NEG else ~operand[0])
+                if len(folded) < len(output) - operand[1] + 1:
+                    del output[operand[1]:]
+                    output.extend(folded)
+                    return
+
+        elif opcode == CALL and instruction.name in (MULTIPLY, DIVIDE) and instruction.arg == 2:
+            if self._reduce_multiply_or_divide(instruction):
+                return
+
+        output.append(instruction)
+
+        if opcode == NOT:
+            if len(output) >= 2 and output[-2].opcode == NOT:
+                del output[-2:]
+
+        elif opcode == IF_GOTO:
+            condition = _constant_before(output, len(output) - 1)
+            if condition is not None:
+                del output[condition[1]:]
+                if condition[0] != 0:
+                    self._emit(Instruction(GOTO, NO_SEGMENT, instruction.name, 0))
+                else:
+                    self.label_references[instruction.name] -= 1
+
+        elif opcode == LABEL:
+            label = instruction.name
+            if len(output) >= 3 and output[-3].opcode == IF_GOTO and output[-3].name == label and \
+                    output[-2].opcode == GOTO and self.label_references[label] == 1 and \
+                    _is_boolean_before(output, len(output) - 3):
+                branch = output[-2]
+                del output[-3:]
+                self.label_references[label] = 0
+                self._emit(NOT_INSTRUCTION)
+                self._emit(Instruction(IF_GOTO, NO_SEGMENT, branch.name, 0))
+            elif len(output) >= 2 and output[-2].opcode == GOTO and output[-2].name == label:
+                del output[-2]
+                self.label_references[label] -= 1
+
+        elif instruction == POP_THAT_0:
+            if len(output) >= 5 and output[-4:-1] == [POP_TEMP_0, POP_POINTER_1, PUSH_TEMP_0] and \
+                    output[-5].opcode == PUSH and output[-5].segment not in (THAT, POINTER):
+                value = output[-5]
+                del output[-5:]
+                output.extend([POP_POINTER_1, value, POP_THAT_0])
+
+    def _reduce_multiply_or_divide(self, call):
+        """ Folds, or strength-reduces, a call to Math.multiply or Math.divide (which is about to be emitted) whose
+        arguments are at the tail of the output. Returns True if the call was replaced. """
+        output = self.output
+        right = _constant_before(output, len(output))
+        if right is None:
+            if call.name == MULTIPLY and len(output) >= 2 and output[-1].opcode == PUSH and \
+                    _is_push_constant(output[-2]):
+                left_operand, right_operand = output[-2:]
+                del output[-2:]
+                for instruction in (right_operand, left_operand, call):
+                    self._emit(instruction)
+                return True
+            return False
+
+        divisor_or_factor, start = right
+        left = _constant_before(output, start)
+        if left is not None:
+            if call.name == MULTIPLY:
+                value = left[0] * divisor_or_factor
+            elif divisor_or_factor != 0:
+                value = abs(left[0]) // abs(divisor_or_factor)
+                value = value if (left[0] < 0) == (divisor_or_factor < 0) else -value
+            else:
+                return False
+            del output[left[1]:]
+            output.extend(constant_instructions(value))
+            return True
+
+        if divisor_or_factor == 1:
+            del output[start:]
+        elif divisor_or_factor == -1:
+            del output[start:]
+            output.append(NEG_INSTRUCTION)
+        elif call.name == MULTIPLY and divisor_or_factor == 0:
+            del output[start:]
+            output.extend([POP_TEMP_0, Instruction(PUSH, CONSTANT, None, 0)])
+        elif call.name == MULTIPLY and divisor_or_factor in [2 ** k for k in range(1, MAX_DOUBLINGS + 1)]:
+            del output[start:]
+            for _ in range(divisor_or_factor.bit_length() - 1):
+                output.extend([POP_TEMP_0, PUSH_TEMP_0, PUSH_TEMP_0, ADD_INSTRUCTION])
+        else:
+            return False
+        return True
+
+
+def to_word(value):
+    """ Returns value as a signed 16-bit integer, wrapping it around as the Hack platform does. """
+    value &= 0xFFFF
+    return value - 0x10000 if value & 0x8000 else value
+
+
+def constant_instructions(value):
+    """ Returns the shortest instructions that push the 16-bit integer value. """
+    value = to_word(value)
+    if value >= 0:
+        return [Instruction(PUSH, CONSTANT, None, value)]
+    if value == -1:
+        return [Instruction(PUSH, CONSTANT, None, 0), NOT_INSTRUCTION]
+    if value == -MAX_CONSTANT - 1:
+        return [Instruction(PUSH, CONSTANT, None, MAX_CONSTANT), NOT_INSTRUCTION]
+    return [Instruction(PUSH, CONSTANT, None, -value), NEG_INSTRUCTION]
+
+
+def _constant_before(output, end):
+    """ If the instructions of output that end just before index end push a constant, returns a (value, start) pair
+    giving the constant and the index of its first instruction; otherwise returns None. """
+    if end >= 1 and _is_push_constant(output[end - 1]):
+        return output[end - 1].arg, end - 1
+    if end >= 2 and output[end - 1].opcode in (NEG, NOT) and _is_push_constant(output[end - 2]):
+        value = output[end - 2].arg
+        return to_word(-value if output[end - 1].opcode == NEG else ~value), end - 2
+    return None
+
+
+def _is_boolean_before(output, end):
+    """ Returns True if the instructions of output that end just before index end push a value that is known to be
+    either 0 (false) or -1 (true). """
+    while end >= 1 and output[end - 1].opcode == NOT:
+        end -= 1
+    if end < 1:
+        return False
+    instruction = output[end - 1]
+    return instruction.opcode in (EQ, GT, LT) or (_is_push_constant(instruction) and instruction.arg == 0)
+
+
+def _is_push_constant(instruction):
+    return instruction.opcode == PUSH and instruction.segment == CONSTANT
@@ -0,0 +1,140 @@
+__author__ = 'paulpatterson'
+
+## The semantic checker looks for the mistakes the parser lets through, and reports every one it finds rather than
+## stopping at the first:
+##
+##   - identifiers that are not declared: variables missing from the symbol table, classes that are neither in the
+##     build nor in the OS, and subroutines that the class they are called on does not declare;
+##   - calls whose number of arguments differs from the number of parameters of the callee's signature;
+##   - uses of 'this' in a function, explicit or implied: the keyword itself, a field, or a call to a method of the
+##     class without an object.
+##
+## It works on the syntax tree of one class, visiting each node once, and learns about other classes from the build's
+## SignatureIndex (and the OS). A call whose callee it knows nothing about (a method of a variable of a type outside
+## the build, say) is not checked further.
+
+from collections import namedtuple
+
+from jack_compiler.AbstractSyntaxTree import Node, ClassVarDec, SubroutineDec, ParameterList, SubroutineBody, VarDec, \
+    LetStatement, DoStatement, Term
+from jack_compiler.SignatureIndex import SignatureIndex, OS_SIGNATURE_INDEX
+from jack_compiler.SymbolTable import SymbolTable
+from jack_compiler.Tokenizer import IDENTIFIER, KEYWORD
+
+Diagnostic = namedtuple("Diagnostic", "line column message")
+
+
+class SemanticChecker():
+
+    def __init__(self, ast, signature_index=None, position=None):
+        """ Creates a checker for the class whose AbstractSyntaxTree is ast. signature_index is the SignatureIndex of
+        the build (by default, one holding no classes). position maps the offset of a token in the source to its
+        (line, column); without it, diagnostics have no position. """
+        self.ast = ast
+        self.signature_index = signature_index if signature_index is not None else SignatureIndex()
+        self.position = position
+        self.symbol_table = SymbolTable()
+        self.subroutine_kind = None
+        self.diagnostics = []
+
+    def check(self):
+        """ Checks the class, and returns a list of Diagnostics for the errors found, in source order. """
+        for child in self.ast.root.children:
+            if isinstance(child, ClassVarDec):
+                for name in child.names:
+                    self.symbol_table.define(name, child.type, child.kind.upper())
+            elif isinstance(child, SubroutineDec):
+                self._check_subroutine(child)
+        return self.diagnostics
+
+    def _check_subroutine(self, subroutine_dec):
+        self.symbol_table.start_subroutine()
+        self.subroutine_kind = subroutine_dec.kind
+        if subroutine_dec.kind == "method":
+            self.symbol_table.define("this", self.ast.class_name, "ARG")
+        for child in subroutine_dec.children:
+            if isinstance(child, ParameterList):
+                for var_type, name in zip(child.types, child.names):
+                    self.symbol_table.define(name, var_type, "ARG")
+            elif isinstance(child, SubroutineBody):
+                for body_child in child.children:
+                    if isinstance(body_child, VarDec):
+                        for name in body_child.names:
+                            self.symbol_table.define(name, body_child.type, "VAR")
+                    elif isinstance(body_child, Node):
+                        self._check_node(body_child)
+
+    def _check_node(self, node):
+        """ Checks node and its descendants. """
+        children = node.children
+        if isinstance(node, Term):
+            first = children[0]
+            if isinstance(first, Node):
+                pass
+            elif first.kind == IDENTIFIER:
+                following = children[1].value if len(children) > 1 and not isinstance(children[1], Node) else None
+                if following == "(" or following == ".":
+                    self._check_call(children, 0)
+                else:
+                    self._check_variable(first)
+            elif first.kind == KEYWORD and first.value == "this" and self.subroutine_kind == "function":
+                self._report(first, "'this' cannot be used in a function")
+        elif isinstance(node, LetStatement):
+            self._check_variable(children[1])
+        elif isinstance(node, DoStatement):
+            self._check_call(children, 1)
+
+        for child in children:
+            if isinstance(child, Node):
+                self._check_node(child)
+
+    def _check_variable(self, token):
+        symbol = self.symbol_table.info_for_symbol(token.value)
+        if symbol is None:
+            self._report(token, "undeclared identifier '{}'".format(token.value))
+        elif symbol.kind == "FIELD" and self.subroutine_kind == "function":
+            self._report(token, "field '{}' cannot be used in a function".format(token.value))
+
+    def _check_call(self, children, start):
+        """ Checks the subroutine call whose first token is children[start]. """
+        if children[start + 1].value == ".":
+            receiver, name_token, expression_list = children[start], children[start + 2], children[start + 4]
+            symbol = self.symbol_table.info_for_symbol(receiver.value)
+            if symbol is not None:
+                self._check_variable(receiver)
+                class_name = symbol.type
+            elif self.signature_index.knows_class(receiver.value) or OS_SIGNATURE_INDEX.knows_class(receiver.value):
+                class_name = receiver.value
+            else:
+                self._report(receiver, "undeclared identifier '{}'".format(receiver.value))
+                return
+            signature = self._signature_of(class_name, name_token)
+            if signature is not None and symbol is None and signature.kind == "method":
+                self._report(name_token, "method '{}.{}' called without an object".format(class_name,
+                                                                                         name_token.value))
+        else:
+            name_token, expression_list = children[start], children[start + 2]
+            class_name = self.ast.class_name
+            signature = self._signature_of(class_name, name_token)
+            if self.subroutine_kind == "function" and signature is not None and signature.kind == "method":
+                self._report(name_token, "method '{}' cannot be called from a function without an object".format(
+                    name_token.value))
+
+        if signature is not None and len(signature.parameter_types) != expression_list.num_expressions:
+            self._report(name_token, "'{}.{}' expects {} argument(s), got {}".format(
+                class_name, name_token.value, len(signature.parameter_types), expression_list.num_expressions))
+
+    def _signature_of(self, class_name, name_token):
+        """ Returns the Signature of class_name.name_token, reporting it as undeclared if class_name is known but does
+        not declare it. Returns None if there is no signature to check the call against. """
+        for signature_index in (self.signature_index, OS_SIGNATURE_INDEX):
+            if signature_index.knows_class(class_name):
+                signature = signature_index.signature_of(class_name, name_token.value)
+                if signature is None:
+                    self._report(name_token, "undeclared subroutine '{}.{}'".format(class_name, name_token.value))
+                return signature
+        return None
+
+    def _report(self, token, message):
+        line, column = self.position(token.offset) if self.position is not None else (None, None)
+        self.diagnostics.append(Diagnostic(line, column, message))
@@ -0,0 +1,157 @@
+__author__ = 'paulpatterson'
+
+## The signature index records the header of every subroutine in a build - its kind, return type, name and parameter
+## types - by class, so that a class can be compiled knowing what the other classes of the build declare.
+##
+## It is built by a pre-pass that only looks at headers. Strings and comments are blanked out of each file, after
+## which every remaining 'constructor', 'function' or 'method' (keywords, so never identifiers) begins a header, which
+## a regex reads; subroutine bodies are never tokenized. The signatures found in each file are kept, with a hash of the
+## file's contents, in a json file alongside the source, so later builds only rescan the files that have changed. The
+## index itself holds nothing but strings and tuples, so it can be written to json and sent to worker processes.
+
+from collections import namedtuple
+import hashlib
+import json
+import re
+
+from jack_compiler.BuildCache import COMPILER_VERSION
+
+INDEX_NAME = ".jack_signatures.json"
+
+Signature = namedtuple("Signature", "kind return_type name parameter_types")
+
+IGNORED_REGEX = re.compile(r'"[^"\n]*"|//[^\n]*|/\*.*?\*/', re.DOTALL)
+CLASS_REGEX = re.compile(r"\bclass\s+([A-Za-z_]\w*)")
+SUBROUTINE_REGEX = re.compile(r"\b(constructor|function|method)\s+([A-Za-z_]\w*)\s+([A-Za-z_]\w*)\s*\(([^)]*)\)")
+
+
+def scan_signatures(jack_code):
+    """ Returns the name of the class declared by jack_code, and a list of the Signatures of its subroutines, in the
+    order they are declared. If jack_code declares no class, the name is None (and the error is left for the compiler
+    to report). """
+    jack_code = IGNORED_REGEX.sub(" ", jack_code)
+    class_match = CLASS_REGEX.search(jack_code)
+    if class_match is None:
+        return None, []
+    signatures = []
+    for kind, return_type, name, parameters in SUBROUTINE_REGEX.findall(jack_code):
+        parameter_types = tuple(parameter.split()[0] for parameter in parameters.split(",") if parameter.strip())
+        signatures.append(Signature(kind, return_type, name, parameter_types))
+    return class_match.group(1), signatures
+
+
+class SignatureIndex():
+
+    def __init__(self):
+        """ Creates an empty SignatureIndex. """
+        self._classes = {}
+
+    def add_class(self, class_name, signatures):
+        """ Records the signatures of class_name's subroutines, replacing any recorded before. """
+        self._classes[class_name] = {signature.name: signature for signature in signatures}
+
+    def knows_class(self, class_name):
+        """ Returns True if class_name is declared by a file in the build. """
+        return class_name in self._classes
+
+    def signature_of(self, class_name, subroutine_name):
+        """ Returns the Signature of class_name.subroutine_name, or None if the index does not know it. """
+        subroutines = self._classes.get(class_name)
+        return None if subroutines is None else subroutines.get(subroutine_name)
+
+    def digest(self):
+        """ Returns a hash of every signature in the index, which changes whenever any signature does. """
+        return hashlib.sha256(json.dumps(self.to_json(), sort_keys=True).encode("utf-8")).hexdigest()
+
+    def to_json(self):
+        """ Returns the index as a json-compatible dictionary, mapping each class name to a list of signatures. """
+        return {class_name: [list(signature) for signature in subroutines.values()]
+                for class_name, subroutines in self._classes.items()}
+
+    @classmethod
+    def from_json(cls, classes):
+        """ Returns a SignatureIndex holding the classes of a dictionary made by to_json. """
+        signature_index = cls()
+        for class_name, signatures in classes.items():
+            signature_index.add_class(class_name, _signatures_from_json(signatures))
+        return signature_index
+
+
+def build_signature_index(jack_file_paths, cache_directory=None):
+    """ Scans the headers of every file in jack_file_paths and returns a SignatureIndex of the classes they declare.
+
+    If cache_directory is given, the signatures found are cached there (see INDEX_NAME), and files whose contents
+    have not changed since they were last scanned are not scanned again. """
+    cached_files = _load_cached_files(cache_directory)
+    files = {}
+    signature_index = SignatureIndex()
+
+    for jack_file in jack_file_paths:
+        source = jack_file.read_bytes()
+        source_hash = hashlib.sha256(source).hexdigest()
+        entry = cached_files.get(jack_file.name)
+        if entry is None or entry["source"] != source_hash:
+            class_name, signatures = scan_signatures(source.decode("utf-8"))
+            entry = {"source": source_hash, "class": class_name, "signatures": [list(s) for s in signatures]}
+        files[jack_file.name] = entry
+        if entry["class"] is not None:
+            signature_index.add_class(entry["class"], _signatures_from_json(entry["signatures"]))
+
+    if cache_directory is not None and files != cached_files:
+        with open((cache_directory / INDEX_NAME).as_posix(), "w") as index_file:
+            json.dump({"compiler": COMPILER_VERSION, "files": files}, index_file, indent=1, sort_keys=True)
+
+    return signature_index
+
+
+def _load_cached_files(cache_directory):
+    """ Returns the cached entries, by file name, of the index file in cache_directory; an index file that is missing,
+    cannot be read, or was written by a different compiler version, is treated as empty. """
+    if cache_directory is None:
+        return {}
+    try:
+        with open((cache_directory / INDEX_NAME).as_posix()) as index_file:
+            cached_index = json.load(index_file)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(cached_index, dict) or cached_index.get("compiler") != COMPILER_VERSION:
+        return {}
+    return cached_index.get("files", {})
+
+
+def _signatures_from_json(signatures):
+    return [Signature(kind, return_type, name, tuple(parameter_types))
+            for kind, return_type, name, parameter_types in signatures]
+
+
+## The Jack OS, which every program can call without its classes being part of the build.
+OS_SIGNATURE_INDEX = SignatureIndex.from_json({
+    "Math": [["function", "void", "init", []], ["function", "int", "abs", ["int"]],
+             ["function", "int", "multiply", ["int", "int"]], ["function", "int", "divide", ["int", "int"]],
+             ["function", "int", "min", ["int", "int"]], ["function", "int", "max", ["int", "int"]],
+             ["function", "int", "sqrt", ["int"]]],
+    "String": [["constructor", "String", "new", ["int"]], ["method", "void", "dispose", []],
+               ["method", "int", "length", []], ["method", "char", "charAt", ["int"]],
+               ["method", "void", "setCharAt", ["int", "char"]], ["method", "String", "appendChar", ["char"]],
+               ["method", "void", "eraseLastChar", []], ["method", "int", "intValue", []],
+               ["method", "void", "setInt", ["int"]], ["function", "char", "backSpace", []],
+               ["function", "char", "doubleQuote", []], ["function", "char", "newLine", []]],
+    "Array": [["function", "Array", "new", ["int"]], ["method", "void", "dispose", []]],
+    "Output": [["function", "void", "init", []], ["function", "void", "moveCursor", ["int", "int"]],
+               ["function", "void", "printChar", ["char"]], ["function", "void", "printString", ["String"]],
+               ["function", "void", "printInt", ["int"]], ["function", "void", "println", []],
+               ["function", "void", "backSpace", []]],
+    "Screen": [["function", "void", "init", []], ["function", "void", "clearScreen", []],
+               ["function", "void", "setColor", ["boolean"]], ["function", "void", "drawPixel", ["int", "int"]],
+               ["function", "void", "drawLine", ["int", "int", "int", "int"]],
+               ["function", "void", "drawRectangle", ["int", "int", "int", "int"]],
+               ["function", "void", "drawCircle", ["int", "int", "int"]]],
+    "Keyboard": [["function", "void", "init", []], ["function", "char", "keyPressed", []],
+                 ["function", "char", "readChar", []], ["function", "String", "readLine", ["String"]],
+                 ["function", "int", "readInt", ["String"]]],
+    "Memory": [["function", "void", "init", []], ["function", "int", "peek", ["int"]],
+               ["function", "void", "poke", ["int", "int"]], ["function", "Array", "alloc", ["int"]],
+               ["function", "void", "deAlloc", ["Array"]]],
+    "Sys": [["function", "void", "init", []], ["function", "void", "halt", []],
+            ["function", "void", "error", ["int"]], ["function", "void", "wait", ["int"]]],
+})
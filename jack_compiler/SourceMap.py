@@ -0,0 +1,49 @@
+__author__ = 'paulpatterson'
+
+## A source map records, for every command of a .vm file, where in the .jack file the construct that produced it
+## begins, so that a profile of the vm code can be read in terms of the jack code. It is written alongside the .vm file,
+## with MAP_SUFFIX appended to the name (Main.vm.map), in json lines: a header object naming the two files, then one
+## [instruction, line, column] array per command, in order, with instructions counted from 0 and lines and columns
+## from 1. A command that no construct claims (one written before the engine's first mark) has line and column 0,
+## meaning it has no source position.
+##
+##   {"source": "Main.jack", "vm": "Main.vm"}
+##   [0, 2, 5]
+##   [1, 4, 13]
+##
+## The source is named relative to the directory of the vm file. Maps describe the vm code as the engine writes it, so
+## they cannot be made for optimized or whole-program builds, which rewrite that code.
+
+from collections import namedtuple
+import json
+import os
+
+MAP_SUFFIX = ".map"
+
+SourceLocation = namedtuple("SourceLocation", "instruction line column")
+
+
+def source_map_path(vm_file_path):
+    """ Returns the path of the source map for the vm file at vm_file_path. """
+    return vm_file_path.with_name(vm_file_path.name + MAP_SUFFIX)
+
+
+def write_source_map(jack_file, vm_file_path, source_offsets, position):
+    """ Writes the source map of vm_file_path, the vm code compiled from jack_file. source_offsets holds the source
+    offset of each command (-1 if it has none, which is written as line and column 0), and position maps an offset to
+    its (line, column). """
+    header = {"source": os.path.relpath(jack_file.as_posix(), vm_file_path.parent.as_posix()),
+              "vm": vm_file_path.name}
+    lines = [json.dumps(header, sort_keys=True)]
+    for instruction, offset in enumerate(source_offsets):
+        line, column = position(offset) if offset >= 0 else (0, 0)
+        lines.append("[{}, {}, {}]".format(instruction, line, column))
+    with open(source_map_path(vm_file_path).as_posix(), "w") as map_file:
+        map_file.write("\n".join(lines) + "\n")
+
+
+def read_source_map(map_file_path):
+    """ Returns the header of the source map at map_file_path, as a dictionary, and a list of its SourceLocations. """
+    with open(map_file_path.as_posix()) as map_file:
+        header = json.loads(map_file.readline())
+        return header, [SourceLocation(*json.loads(line)) for line in map_file if line.strip()]
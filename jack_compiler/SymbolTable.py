@@ -8,36 +8,69 @@ __author__ = 'paulpatterson'
 ##
 ## Each time we start compiling a new class, we can start to compile a new class-level symbol table. Likewise, when
 ## we start to compile a new subroutine, we can discard the previous sub-routine level symbol table, and start afresh.
+##
+## Scopes are kept as a stack: the class scope at the bottom, then the subroutine's scope, then (should the language
+## ever need them) any nested scopes pushed with push_scope. Every symbol visible from the innermost scope is kept in a
+## single dictionary, so looking a name up is one probe whatever the depth of the stack; each scope records the
+## symbols it shadowed, so that popping it restores them. The running index of each kind is a counter, so defining a
+## symbol, and counting the symbols of a kind, take constant time.
 
 from collections import namedtuple
-from collections import OrderedDict
 Symbol = namedtuple("Symbol", "type kind index")
 
+CLASS_KINDS = frozenset(["STATIC", "FIELD"])
+SUBROUTINE_KINDS = frozenset(["ARG", "VAR"])
+
+
 class SymbolTable():
 
     def __init__(self):
         """ Creates a new SymbolTable instance. """
-        self._class_symbols = OrderedDict()
-        self._subroutine_symbols = OrderedDict()
+        self._symbols = {}
+        self._counts = dict.fromkeys(CLASS_KINDS | SUBROUTINE_KINDS, 0)
+        self._scopes = [[]]
 
     def start_subroutine(self):
-        """ Empties the symbol table storing subroutine symbols. """
-        self._subroutine_symbols.clear()
+        """ Discards the symbols of the previous subroutine (and of any scope nested within it), and starts a new
+        subroutine scope. """
+        while len(self._scopes) > 1:
+            self.pop_scope()
+        for kind in SUBROUTINE_KINDS:
+            self._counts[kind] = 0
+        self.push_scope()
+
+    def push_scope(self):
+        """ Starts a new scope, nested within the current one. Its symbols shadow any of the same name outside it. """
+        self._scopes.append([])
+
+    def pop_scope(self):
+        """ Discards the innermost scope, and its symbols, making visible again the symbols they shadowed. (Indices are
+        not reused.) """
+        assert len(self._scopes) > 1, "the class scope cannot be popped"
+        for name, _, shadowed in reversed(self._scopes.pop()):
+            if shadowed is None:
+                del self._symbols[name]
+            else:
+                self._symbols[name] = shadowed
 
     def define(self, name, var_type, kind):
         """Defines a new identifier of the given name, type, and kind and assigns it a running index.
 
         STATIC and FIELD identifiers have a class scope, while ARG and VAR identifiers have a subroutine scope."""
-        symbol_table = self._class_symbols if kind in ["STATIC", "FIELD"] else self._subroutine_symbols
-        symbol_table[name] = Symbol(var_type, kind, self.var_count(kind))
+        if kind in CLASS_KINDS:
+            assert len(self._scopes) == 1, "'{}' is a class variable, but is declared after a subroutine".format(name)
+        else:
+            assert len(self._scopes) > 1, "'{}' is declared outside a subroutine".format(name)
+        symbol = Symbol(var_type, kind, self._counts[kind])
+        self._counts[kind] += 1
+        self._scopes[-1].append((name, symbol, self._symbols.get(name)))
+        self._symbols[name] = symbol
 
     def var_count(self, kind):
         """Returns the number of variables of the given kind already defined in the current scope.
 
         [kind] should be one of field, static, arg, or var"""
-        symbol_table = self._class_symbols if kind in ["STATIC", "FIELD"] else self._subroutine_symbols
-        return len(list(filter(lambda x: x.kind == kind, symbol_table.values())))
-
+        return self._counts[kind]
 
     def kind_of(self, name):
         """Returns the kind of the named identifier in the current scope. If the identifier is unknown in the current
@@ -45,48 +78,36 @@ class SymbolTable():
 
         [name] should be one of static, field, arg, var or none
         """
-        if name in self._subroutine_symbols.keys():
-            return self._subroutine_symbols[name].kind
-        elif name in self._class_symbols.keys():
-            return self._class_symbols[name].kind
-        else:
-            return None
+        symbol = self._symbols.get(name)
+        return None if symbol is None else symbol.kind
 
     def type_of(self, name):
         """Returns the type of the named identifier in the current scope"""
-        if name in self._subroutine_symbols.keys():
-            return self._subroutine_symbols[name].type
-        elif name in self._class_symbols.keys():
-            return self._class_symbols[name].type
-        else:
-            return None
+        symbol = self._symbols.get(name)
+        return None if symbol is None else symbol.type
 
     def index_of(self, name):
         """ Returns the index assigned to the named identifier. """
-        if name in self._subroutine_symbols.keys():
-            return self._subroutine_symbols[name].index
-        elif name in self._class_symbols.keys():
-            return self._class_symbols[name].index
-        else:
-            return None
+        symbol = self._symbols.get(name)
+        return None if symbol is None else symbol.index
 
     def info_for_symbol(self, name):
-        """ Returns the type, kind and index of name if name is found in either scope. """
-        if self.recognises_symbol(name):
-            return Symbol(self.type_of(name), self.kind_of(name), self.index_of(name))
+        """ Returns the Symbol (type, kind and index) for name if name is found in any scope, otherwise None. """
+        return self._symbols.get(name)
 
     def recognises_symbol(self, name):
-        """ Returns True if name is found in either scope (class/subroutine), otherwise returns False. """
-        return name in self._class_symbols.keys() or name in self._subroutine_symbols.keys()
+        """ Returns True if name is found in any scope, otherwise returns False. """
+        return name in self._symbols
 
     def __str__(self):
         """ Generates a string containing all stored information about all available symbols. """
         lines = ["class-level symbols"]
-        for k, v in self._class_symbols.items():
-            lines.append("{}:{}, {}, {}".format(k, v.type, v.kind, v.index))
+        for name, symbol, _ in self._scopes[0]:
+            lines.append("{}:{}, {}, {}".format(name, symbol.type, symbol.kind, symbol.index))
 
         lines.append("\nsubroutine symbols")
-        for k, v in self._subroutine_symbols.items():
-            lines.append("{}:{}, {}, {}".format(k, v.type, v.kind, v.index))
+        for scope in self._scopes[1:]:
+            for name, symbol, _ in scope:
+                lines.append("{}:{}, {}, {}".format(name, symbol.type, symbol.kind, symbol.index))
 
-        return "\n".join(lines)
\ No newline at end of file
+        return "\n".join(lines)
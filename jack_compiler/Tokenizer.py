@@ -1,7 +1,10 @@
 __author__ = 'paulpatterson'
 
+from bisect import bisect_right
 from collections import namedtuple
+import mmap
 import re
+import sys
 from lxml import etree
 
 SYMBOLS = "{ } ( ) [ ] . , ; + - * / & | < > = ~"
@@ -11,43 +14,367 @@ KEYWORDS = "class constructor function method field static var int char boolean
 else while return"
 
 
-RE_KEYWORD = re.compile("(?:\s*)(?P<keyword>{})(?![A-Za-z_])".format("|".join(KEYWORDS.split())))
+RE_KEYWORD = re.compile(r"(?:\s*)(?P<keyword>{})(?![A-Za-z_])".format("|".join(KEYWORDS.split())))
 
-RE_SYMBOL = re.compile("(?:\s*)(?P<symbol>{})".format("|".join(ESCAPED_SYMBOLS)))
+RE_SYMBOL = re.compile(r"(?:\s*)(?P<symbol>{})".format("|".join(ESCAPED_SYMBOLS)))
 
-RE_INT_CONST = re.compile("(?:\s*)(?P<integerConstant>[0-9]+)")
+RE_INT_CONST = re.compile(r"(?:\s*)(?P<integerConstant>[0-9]+)")
 
-RE_IDENTIFIER = re.compile("(?:\s*)(?P<identifier>[a-zA-Z_][a-zA-Z0-9_]*)")
+RE_IDENTIFIER = re.compile(r"(?:\s*)(?P<identifier>[a-zA-Z_][a-zA-Z0-9_]*)")
 
-RE_STRING_CONST = re.compile("(?:\s*)(?P<stringConstant>\"[^\"\n]+\")")
+RE_STRING_CONST = re.compile(r"(?:\s*)(?P<stringConstant>\"[^\"\n]+\")")
 
 RE_COMMENT = re.compile(r"""(?:\s*)/\*\*.*?\*/                          # /** lorem ipsum... */
                             |
                             (?:\s*)//[^\n]+""", re.VERBOSE | re.DOTALL) # // lorem ipsum...
 
+
+
+def _factored_alternation(words):
+    """ Returns a regex alternation matching any of words, with the words that share a first letter grouped under it
+    (c(?:lass|har)|...), so that a word starting with any other letter is ruled out by a single comparison. Words are
+    tried in their original order. """
+    rests_by_first_letter = {}
+    for word in words:
+        rests_by_first_letter.setdefault(word[0], []).append(re.escape(word[1:]))
+    return "|".join(first + (rests[0] if len(rests) == 1 else "(?:{})".format("|".join(rests)))
+                    for first, rests in rests_by_first_letter.items())
+
+
+## The master regex tries every token category at once. Python's alternation is ordered, and the alternatives can only
+## compete when they start with the same character: a comment and the symbol '/' (the comment is tried first, as in the
+## cascade of regexes above), and a keyword and an identifier (the keyword is tried first, as in the cascade). So for
+## any input both lexers agree on which category wins, and the remaining categories are free to be ordered by how
+## cheaply they fail - symbols, the most common tokens, are a single character class.
+RE_TOKEN = re.compile(r"\s*(?:"
+                      r"(?P<comment>/\*\*.*?\*/|//[^\n]+)"
+                      r"|(?P<symbol>[{}])"
+                      r"|(?P<keyword>{})(?![A-Za-z_])"
+                      r"|(?P<identifier>[a-zA-Z_][a-zA-Z0-9_]*)"
+                      r"|(?P<integerConstant>[0-9]+)"
+                      r"|(?P<stringConstant>\"[^\"\n]+\"))".format("".join(ESCAPED_SYMBOLS),
+                                                                 _factored_alternation(KEYWORDS.split())), re.DOTALL)
+
+## The tag of each of RE_TOKEN's groups, by group number.
+TOKEN_GROUP_TAGS = (None,) + tuple(sorted(RE_TOKEN.groupindex, key=RE_TOKEN.groupindex.get))
+COMMENT_GROUP = RE_TOKEN.groupindex["comment"]
+STRING_CONST_GROUP = RE_TOKEN.groupindex["stringConstant"]
+
+## The same regex, for running directly over the bytes of a memory-mapped file.
+RE_TOKEN_BYTES = re.compile(RE_TOKEN.pattern.encode("ascii"), re.DOTALL)
+
+MASTER_LEXER = "master"
+CASCADE_LEXER = "cascade"
+
 Span = namedtuple("Span", "start end")
 JackMatch = namedtuple("JackMatch", "tag text span")
 
 
+def master_matches(jack_code, pos=0):
+    """ Yields a (tag, text, span) tuple for every token in jack_code, beginning at pos, in a single left-to-right pass.
+
+    Each step is one match of RE_TOKEN, resumed from where the previous one ended; comments are matched like any other
+    token and then dropped; groups are looked up by number, which is cheaper than by name. The tuples compare equal to
+    the JackMatch instances produced by cascade_matches. """
+    token_match = None
+    for token_match in iter(RE_TOKEN.scanner(jack_code, pos).match, None):
+        group = token_match.lastindex
+        if group != COMMENT_GROUP:
+            if group != STRING_CONST_GROUP:
+                yield TOKEN_GROUP_TAGS[group], token_match[group], token_match.span(group)
+            else:
+                yield "stringConstant", token_match[group][1:-1], token_match.span(group)
+    _warn_if_unmatched(jack_code, token_match.end() if token_match is not None else pos)
+
+
+def cascade_matches(jack_code, pos=0):
+    """ Yields a JackMatch for every token in jack_code, beginning at pos. A match's span covers the token itself
+    (quotes included, for string constants) but not any whitespace or comments preceding it.
+
+    At each position the regex for each token category is tried in turn until one of them matches. """
+    jack_match = _cascade_lookahead(jack_code, pos)
+    while jack_match is not None:
+        yield jack_match
+        jack_match = _cascade_lookahead(jack_code, jack_match.span.end)
+
+
+def _cascade_lookahead(jack_code, pos):
+    """ Looks for the next valid token, starting from jack_code[pos]. """
+    def unpack_match(token_match):
+        group_names = list(token_match.groupdict().keys())
+
+        assert len(group_names) in [1,0], \
+            "Expected one named group, but got {} ({})".format(len(group_names), group_names)
+
+        if len(group_names) == 0:
+            tag = "comment"
+            text = ""
+        else:
+            tag = group_names[0]
+            text = token_match.groups(tag)[0]
+        return JackMatch(tag, text, Span(*token_match.span(tag)))
+
+    match_args = jack_code, pos
+
+    comment_match = RE_COMMENT.match(*match_args)
+    while comment_match is not None:
+        pos = comment_match.end()
+        match_args = jack_code, pos
+        comment_match = RE_COMMENT.match(*match_args)
+
+    keyword_match = RE_KEYWORD.match(*match_args)
+    if keyword_match:
+        return unpack_match(keyword_match)
+
+    symbol_match = RE_SYMBOL.match(*match_args)
+    if symbol_match:
+        return unpack_match(symbol_match)
+
+    identifier_match = RE_IDENTIFIER.match(*match_args)
+    if identifier_match:
+        return unpack_match(identifier_match)
+
+    int_match = RE_INT_CONST.match(*match_args)
+    if int_match:
+        return unpack_match(int_match)
+
+    string_match = RE_STRING_CONST.match(*match_args)
+    if string_match:
+        jack_match = unpack_match(string_match)
+        unquoted_string = jack_match.text.strip('"')
+        return jack_match._replace(text=unquoted_string)
+
+    _warn_if_unmatched(jack_code, pos)
+
+
+def _warn_if_unmatched(jack_code, pos):
+    """ Prints a warning if anything other than whitespace remains in jack_code beyond pos. """
+    if len(jack_code[pos:].strip()) != 0:
+        print("warning! failed to match string beginning '{}'".format(jack_code[pos:pos+10]))
+
+
+LEXERS = {MASTER_LEXER: master_matches, CASCADE_LEXER: cascade_matches}
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+def streamed_matches(jack_stream, chunk_size=DEFAULT_CHUNK_SIZE):
+    """ Yields the same (tag, text, span) tuples as master_matches, but reads jack_stream chunk_size characters at a
+    time rather than all at once.
+
+    Only a small window onto the input is held: whatever is left of the previous chunk (at most one partially read
+    token or comment) followed by the newest chunk. Spans are offsets into the stream as a whole. """
+    window = ""
+    window_start = 0
+    pos = 0
+    at_eof = False
+    match = RE_TOKEN.match
+    while True:
+        token_match = match(window, pos)
+        if not at_eof and _needs_more_input(window, token_match):
+            chunk = jack_stream.read(chunk_size)
+            at_eof = len(chunk) == 0
+            window = window[pos:] + chunk
+            window_start += pos
+            pos = 0
+            continue
+
+        if token_match is None:
+            _warn_if_unmatched(window, pos)
+            return
+
+        pos = token_match.end()
+        tag = token_match.lastgroup
+        if tag != "comment":
+            text = token_match[tag]
+            start, end = token_match.span(tag)
+            yield tag, text if tag != "stringConstant" else text[1:-1], (window_start + start, window_start + end)
+
+
+def mapped_matches(jack_buffer, pos=0):
+    """ Yields a (tag, start, end) tuple for every token in jack_buffer, a bytes-like object such as a memory map,
+    beginning at pos.
+
+    Like master_matches, but the text of a token is not extracted; start and end delimit the token (quotes included,
+    for string constants) within jack_buffer. """
+    end = pos
+    for token_match in iter(RE_TOKEN_BYTES.scanner(jack_buffer, pos).match, None):
+        tag = token_match.lastgroup
+        if tag != "comment":
+            start, token_end = token_match.span(tag)
+            yield tag, start, token_end
+        end = token_match.end()
+    _warn_if_unmatched(jack_buffer[end:].decode("ascii", "replace"), 0)
+
+
+def _needs_more_input(window, token_match):
+    """ Returns True if token_match might have turned out differently had more input been available.
+
+    That is the case when nothing matched, when the match runs up to (or to within two characters of) the end of the
+    window - a longer token, or a comment, could start there - and when the match is a '/' that opens a block comment
+    whose end has not been read yet. """
+    if token_match is None or token_match.end() + 2 > len(window):
+        return True
+    return token_match.lastgroup == "symbol" and window.startswith("/**", token_match.start("symbol"))
+
+## Token kinds. TOKEN_TAGS[kind] is the tag used for a token of that kind in xml output.
+KEYWORD, SYMBOL, IDENTIFIER, INT_CONST, STRING_CONST = range(5)
+TOKEN_TAGS = ("keyword", "symbol", "identifier", "integerConstant", "stringConstant")
+TOKEN_KINDS = {tag: kind for kind, tag in enumerate(TOKEN_TAGS)}
+
+
+class Token():
+    """ A single token: its kind (one of KEYWORD, SYMBOL, IDENTIFIER, INT_CONST, STRING_CONST), its value, and the
+    offset in the source of its first character.
+
+    The values of keywords and symbols are interned, so they can be compared cheaply against string literals. String
+    constants are stored without their enclosing quotes. """
+
+    __slots__ = ("kind", "value", "offset")
+
+    def __init__(self, kind, value, offset):
+        self.kind = kind
+        self.value = value
+        self.offset = offset
+
+    @property
+    def tag(self):
+        """ Returns the xml tag for this token's kind. """
+        return TOKEN_TAGS[self.kind]
+
+    def __repr__(self):
+        return "Token({}, {!r}, {})".format(self.tag, self.value, self.offset)
+
+
+## Keyword and symbol values, keyed by their encoded form, so that tokens read from bytes get the same interned values
+## as tokens read from text without anything being decoded.
+ENCODED_VALUES = {value.encode("ascii"): sys.intern(value) for value in KEYWORDS.split() + SYMBOLS.split()}
+
+
+class MappedToken():
+    """ A token read from a memory-mapped file. It behaves like a Token, but its value is only decoded from the
+    mapped bytes (and then kept) the first time it is asked for. """
+
+    __slots__ = ("kind", "offset", "_end", "_buffer", "_value")
+
+    def __init__(self, kind, offset, end, buffer):
+        self.kind = kind
+        self.offset = offset
+        self._end = end
+        self._buffer = buffer
+        self._value = None
+
+    @property
+    def value(self):
+        """ Returns the token's value, decoding it from the mapped bytes if this has not been done already. """
+        if self._value is None:
+            if self.kind == STRING_CONST:
+                self._value = self._buffer[self.offset + 1:self._end - 1].decode("ascii")
+            else:
+                self._value = self._buffer[self.offset:self._end].decode("ascii")
+            self._buffer = None
+        return self._value
+
+    @property
+    def tag(self):
+        """ Returns the xml tag for this token's kind. """
+        return TOKEN_TAGS[self.kind]
+
+    def __repr__(self):
+        return "MappedToken({}, {!r}, {})".format(self.tag, self.value, self.offset)
+
+
+## Newlines, for finding the start of every line of a source held as text, or as bytes (including a memory map).
+RE_NEWLINE = re.compile("\n")
+RE_NEWLINE_BYTES = re.compile(b"\n")
+
+
+class SourcePositions():
+    """ Maps offsets in a source (a string, or a bytes-like object such as a memory map) to (line, column) positions.
+
+    Nothing is done until the first position is asked for: the source is then scanned once for the offset at which
+    each line starts, and the source is let go of. Each position is found by binary search of those offsets, so tokens
+    need keep nothing but their own offset. """
+
+    __slots__ = ("_source", "_line_starts")
+
+    def __init__(self, source):
+        self._source = source
+        self._line_starts = None
+
+    def position(self, offset):
+        """ Returns the (line, column) of offset, both counted from 1. """
+        if self._line_starts is None:
+            newline = RE_NEWLINE if isinstance(self._source, str) else RE_NEWLINE_BYTES
+            self._line_starts = [0]
+            self._line_starts.extend(newline_match.end() for newline_match in newline.finditer(self._source))
+            self._source = None
+        line = bisect_right(self._line_starts, offset)
+        return line, offset - self._line_starts[line - 1] + 1
+
+
 class Tokenizer():
 
-    def __init__(self, jack_filepath):
-        """ Creates a Tokenizer, ready to tokenize a jack string or a jack file.
+    def __init__(self, jack_filepath=None, lexer=MASTER_LEXER, jack_stream=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                 memory_map=False, jack_code=None):
+        """ Creates a Tokenizer, ready to tokenize a jack file, a string of jack code or a stream of jack code.
 
-        Exactly one argument is expected; if two are received the file path argument is used to create the Tokenizer's
-        input, and the jack_code argument is ignored.
+        Exactly one of jack_filepath, jack_code and jack_stream is expected; if more are received the first of them
+        (in that order) is used to create the Tokenizer's input, and the others are ignored.
+
+        A file is read in one go, unless memory_map is set, in which case the file is memory-mapped and tokens are
+        found by running the master regex directly over the mapped bytes; the values of identifiers, integer and
+        string constants are then only decoded when they are used. A stream is read incrementally, chunk_size
+        characters at a time, and in this (streaming) mode the tokenizer does not keep the tokens it has consumed, so
+        its memory use does not grow with the size of its input.
 
-        :param jack_code: a string representing error-free .jack code
-        :type jack_code: str
         :param jack_filepath: a pathlib.Path object representing an error-free .jack file
         :type jack_filepath: pathlib.Path
+        :param lexer: the lexer engine used to find tokens, either MASTER_LEXER (the default) or CASCADE_LEXER
+        :type lexer: str
+        :param jack_stream: a file-like object, open for reading text, whose contents are error-free .jack code
+        :param chunk_size: the number of characters read from jack_stream at a time
+        :type chunk_size: int
+        :param memory_map: if True, jack_filepath is memory-mapped rather than read
+        :type memory_map: bool
+        :param jack_code: a string representing error-free .jack code
+        :type jack_code: str
          """
-        with open(jack_filepath.as_posix(), 'r') as jack_file:
-            self._input = jack_file.read()
-
-        self.tokens = etree.Element("tokens")
-        self._pos = 0
+        assert lexer in LEXERS, "unknown lexer '{}', expected one of {}".format(lexer, sorted(LEXERS))
+        assert jack_filepath is not None or jack_code is not None or jack_stream is not None, \
+            "expected a jack file path, a string of jack code or a stream"
+
+        self._current_token = None
+        self._tokens = None
+        self._positions = None
+
+        self._memory_mapped = False
+
+        if jack_filepath is not None and memory_map:
+            assert lexer == MASTER_LEXER, "memory-mapped input can only be tokenized by the master lexer"
+            self._input = b""
+            with open(jack_filepath.as_posix(), 'rb') as jack_file:
+                if jack_filepath.stat().st_size > 0:  # an empty file cannot be mapped
+                    self._input = mmap.mmap(jack_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._consumed_tokens = []
+            self._matches = mapped_matches(self._input)
+            self._memory_mapped = True
+        elif jack_filepath is not None or jack_code is not None:
+            if jack_filepath is not None:
+                with open(jack_filepath.as_posix(), 'r') as jack_file:
+                    jack_code = jack_file.read()
+            self._input = jack_code
+            self._consumed_tokens = []
+            self._matches = LEXERS[lexer](self._input)
+        else:
+            assert lexer == MASTER_LEXER, "streamed input can only be tokenized by the master lexer"
+            self._consumed_tokens = None
+            self._matches = streamed_matches(jack_stream, chunk_size)
 
+    @property
+    def streaming(self):
+        """ Returns True if this tokenizer reads its input incrementally (and so keeps no record of past tokens). """
+        return self._consumed_tokens is None
 
     def tokenize(self):
         """ Tokenizes the entire input string in one go (useful for testing).
@@ -57,91 +384,94 @@ class Tokenizer():
          childless elements each of which represent one token. The tag of each token denotes the token type (one of
          (symbol, identifier, stringConstant, integerConstant, keyword), whilst the 'text' attribute stores the token's
          value
+
+         In streaming mode the returned object holds only the tokens consumed by this call.
          """
+        if self.streaming:
+            tokens = etree.Element("tokens")
+            next_token = self.advance()
+            while next_token is not None:
+                _append_token_element(tokens, next_token)
+                next_token = self.advance()
+            return tokens
+
         next_token = self.advance()
         while next_token is not None:
             next_token = self.advance()
 
         return self.tokens
 
-    def _lookahead(self):
-        """ Looks for next valid token, starting from self._input[self._pos].
-
-        This method differs from advance in that it never alters the value of self._pos, even if a match is found. """
-        def unpack_match(token_match):
-            span = Span(token_match.span()[0], token_match.span()[1])
-            group_names = list(token_match.groupdict().keys())
-
-            assert len(group_names) in [1,0], \
-                "Expected one named group, but got {} ({})".format(len(group_names), group_names)
-
-            if len(group_names) == 0:
-                tag = "comment"
-                text = ""
-            else:
-                tag = group_names[0]
-                text = token_match.groups(tag)[0]
-            return JackMatch(tag, text, span)
-
-        match_args = self._input, self._pos
-
-        comment_match = RE_COMMENT.match(*match_args)
-        while comment_match is not None:
-            unpacked = unpack_match(comment_match)
-            self._pos = unpacked.span.end
-            match_args = self._input, self._pos
-            comment_match = RE_COMMENT.match(*match_args)
-
-        if comment_match:
-            return unpack_match(comment_match)
-
-        keyword_match = RE_KEYWORD.match(*match_args)
-        if keyword_match:
-            return unpack_match(keyword_match)
-
-        symbol_match = RE_SYMBOL.match(*match_args)
-        if symbol_match:
-            return unpack_match(symbol_match)
-
-        identifier_match = RE_IDENTIFIER.match(*match_args)
-        if identifier_match:
-            return unpack_match(identifier_match)
+    @property
+    def current_token(self):
+        """
+        Returns the current token in the form of a Token.
 
-        int_match = RE_INT_CONST.match(*match_args)
-        if int_match:
-            return unpack_match(int_match)
+        Use the 'kind' and 'value' attributes of this token to return the token's type and value respectively.
+        """
+        return self._current_token
 
-        string_match = RE_STRING_CONST.match(*match_args)
-        if string_match:
-            jack_match = unpack_match(string_match)
-            unquoted_string = jack_match.text.strip('"')
-            return jack_match._replace(text=unquoted_string)
+    def position(self, offset):
+        """ Returns the (line, column) of offset in the input, both counted from 1. Lines are only indexed the first
+        time a position is asked for (see SourcePositions), so tokenizing costs nothing extra.
 
-        if len(self._input[self._pos:].strip()) != 0:
-            print("warning! failed to match string beginning '{}'".format(self._input[self._pos:self._pos+10]))
+        Not available in streaming mode, where the input is not kept. """
+        assert not self.streaming, "a streaming tokenizer does not keep its input"
+        if self._positions is None:
+            self._positions = SourcePositions(self._input)
+        return self._positions.position(offset)
 
     @property
-    def current_token(self):
-        """
-        Returns the current token in the form of an xml element.
+    def tokens(self):
+        """ Returns an xml element whose children represent every token consumed so far.
 
-        Use the 'tag' and 'text' properties of this element to return the token's type and value respectively.
-        """
-        tokens = self.tokens.findall("*/.[last()]")
-        if len(tokens) > 0:
-            return tokens[-1]
-        else:
-            return None
+        The element is only built when it is asked for (by tokenize, or by a test) and is extended, rather than
+        rebuilt, on subsequent requests; advancing through the input never touches it.
+
+        Not available in streaming mode, where consumed tokens are not kept. """
+        assert not self.streaming, "a streaming tokenizer does not keep the tokens it has consumed"
+        if self._tokens is None:
+            self._tokens = etree.Element("tokens")
+        for token in self._consumed_tokens[len(self._tokens):]:
+            _append_token_element(self._tokens, token)
+        return self._tokens
 
     def advance(self):
         """ Gets the next token from the input and makes it the current token. Initially there is no current token. """
-        jack_match = self._lookahead()
+        # (not a bound method kept on self, which would make every tokenizer, and its tokens, part of a reference
+        # cycle that only the garbage collector can reclaim)
+        token = self._next_mapped_token() if self._memory_mapped else self._next_text_token()
+        if token is not None:
+            self._current_token = token
+            if self._consumed_tokens is not None:
+                self._consumed_tokens.append(token)
+            return token
+
+    def _next_text_token(self):
+        """ Returns a Token for the next match found in textual input, or None if the input is exhausted. """
+        jack_match = next(self._matches, None)
+        if jack_match is not None:
+            tag, text, span = jack_match
+            kind = TOKEN_KINDS[tag]
+            return Token(kind, sys.intern(text) if kind in (KEYWORD, SYMBOL) else text, span[0])
+
+    def _next_mapped_token(self):
+        """ Returns a token for the next match found in memory-mapped input, or None if the input is exhausted.
+
+        Keywords and symbols are looked up rather than decoded; anything else becomes a MappedToken. """
+        jack_match = next(self._matches, None)
         if jack_match is not None:
-            token_element = etree.SubElement(self.tokens, jack_match.tag)
-            token_element.text = " {} ".format(jack_match.text)
-            self._pos = jack_match.span.end
-            return token_element
+            tag, start, end = jack_match
+            kind = TOKEN_KINDS[tag]
+            if kind in (KEYWORD, SYMBOL):
+                return Token(kind, ENCODED_VALUES[self._input[start:end]], start)
+            return MappedToken(kind, start, end, self._input)
 
     def __str__(self):
         """ Outputs the type and value of all tokens processed so far. """
         return "\n".join(["{}, {}".format(child.tag, child.text) for child in self.tokens])
+
+
+def _append_token_element(tokens, token):
+    """ Appends an element representing token to the children of tokens. """
+    token_element = etree.SubElement(tokens, token.tag)
+    token_element.text = " {} ".format(token.value)
@@ -0,0 +1,104 @@
+__author__ = 'paulpatterson'
+
+## VMCode is the compiler's intermediate representation of a class's vm code: a list of vm instructions, each one an
+## opcode, a segment, a name (a label, or the name of a function) and an integer argument (an index, or a number of
+## arguments or locals). The list is held column-wise, in four parallel arrays; names are stored once, in a table, and
+## referred to by their position in it.
+##
+## serialize turns a VMCode into the text of a .vm file.
+
+from array import array
+from collections import namedtuple
+
+# Opcodes
+PUSH, POP, ADD, SUB, NEG, EQ, GT, LT, AND, OR, NOT, LABEL, GOTO, IF_GOTO, CALL, FUNCTION, RETURN = range(17)
+
+OPCODE_NAMES = ["push", "pop", "add", "sub", "neg", "eq", "gt", "lt", "and", "or", "not", "label", "goto", "if-goto",
+                "call", "function", "return"]
+ARITHMETIC_OPCODES = {"ADD": ADD, "SUB": SUB, "NEG": NEG, "EQ": EQ, "GT": GT, "LT": LT, "AND": AND, "OR": OR,
+                      "NOT": NOT}
+
+# Segments
+NO_SEGMENT, CONSTANT, ARGUMENT, LOCAL, STATIC, THIS, THAT, POINTER, TEMP = range(9)
+
+SEGMENT_NAMES = [None, "constant", "argument", "local", "static", "this", "that", "pointer", "temp"]
+SEGMENTS = {"CONST": CONSTANT, "ARG": ARGUMENT, "VAR": LOCAL, "STATIC": STATIC, "THIS": THIS, "THAT": THAT,
+            "POINTER": POINTER, "TEMP": TEMP, "FIELD": THIS}
+
+NO_NAME = -1
+
+Instruction = namedtuple("Instruction", "opcode segment name arg")
+
+
+class VMCode():
+
+    __slots__ = ("opcodes", "segments", "name_indices", "args", "names", "_name_table")
+
+    def __init__(self, instructions=()):
+        """ Creates a VMCode holding instructions (an iterable of Instruction tuples, if set). """
+        self.opcodes = array("B")
+        self.segments = array("B")
+        self.name_indices = array("i")
+        self.args = array("i")
+        self.names = []
+        self._name_table = {}
+        for instruction in instructions:
+            self.append(*instruction)
+
+    def __len__(self):
+        return len(self.opcodes)
+
+    def __getitem__(self, index):
+        """ Returns the instruction at index, as an Instruction. """
+        name_index = self.name_indices[index]
+        return Instruction(self.opcodes[index], self.segments[index],
+                           self.names[name_index] if name_index != NO_NAME else None, self.args[index])
+
+    def __iter__(self):
+        names = self.names
+        for opcode, segment, name_index, arg in zip(self.opcodes, self.segments, self.name_indices, self.args):
+            yield Instruction(opcode, segment, names[name_index] if name_index != NO_NAME else None, arg)
+
+    def __eq__(self, other):
+        return isinstance(other, VMCode) and list(self) == list(other)
+
+    def append(self, opcode, segment=NO_SEGMENT, name=None, arg=0):
+        """ Appends one instruction. """
+        self.opcodes.append(opcode)
+        self.segments.append(segment)
+        self.name_indices.append(NO_NAME if name is None else self._name_index(name))
+        self.args.append(arg)
+
+    def _name_index(self, name):
+        """ Returns the position of name in the name table, adding it if necessary. """
+        name_index = self._name_table.get(name)
+        if name_index is None:
+            name_index = self._name_table[name] = len(self.names)
+            self.names.append(name)
+        return name_index
+
+
+PUSH_PREFIXES = ["push {} ".format(segment_name) for segment_name in SEGMENT_NAMES]
+POP_PREFIXES = ["pop {} ".format(segment_name) for segment_name in SEGMENT_NAMES]
+COMMAND_LINES = [opcode_name + "\n" for opcode_name in OPCODE_NAMES]
+NAME_PREFIXES = [opcode_name + " " for opcode_name in OPCODE_NAMES]
+
+
+def serialize(vm_code):
+    """ Returns the text of the .vm file that holds vm_code. """
+    names = vm_code.names
+    lines = []
+    append = lines.append
+    for opcode, segment, name_index, arg in zip(vm_code.opcodes, vm_code.segments, vm_code.name_indices,
+                                                vm_code.args):
+        if opcode == PUSH:
+            append(PUSH_PREFIXES[segment] + str(arg) + "\n")
+        elif opcode == POP:
+            append(POP_PREFIXES[segment] + str(arg) + "\n")
+        elif opcode <= NOT or opcode == RETURN:
+            append(COMMAND_LINES[opcode])
+        elif opcode <= IF_GOTO:
+            append(NAME_PREFIXES[opcode] + names[name_index] + "\n")
+        else:
+            append(NAME_PREFIXES[opcode] + names[name_index] + " " + str(arg) + "\n")
+    return "".join(lines)
@@ -1,15 +1,85 @@
 __author__ = 'paulpatterson'
 
-SEGMENT_NAMES_MAP = {"CONST" : "constant", "ARG" : "argument", "VAR" : "local", "STATIC" : "static", "THIS" : "this",
-                     "THAT": "that", "POINTER" : "pointer", "TEMP" : "temp", "FIELD" : "this"}
+## VMWriter records the commands of a class as a VMCode (see VMCode.py) and only turns them into text when it is
+## closed, at which point the vm file is opened and the whole class is written out with a single bulk write. Until then
+## the instructions can be inspected (or rewritten) through the writer's vm_instructions, and any existing vm file is
+## left as it was. Use it as a context manager so the file is written deterministically; if the block raises, nothing
+## is written, so a failed compilation never replaces a good vm file with partial code:
+##
+##   with VMWriter(vm_file_path) as vm_writer:
+##       ...
+##
+## A writer created with source_map set also records where in the jack source each command came from: the engine calls
+## mark_source as it starts each construct, and the writer notes the offset alongside the number of commands written so
+## far. Only these marks are kept, one per construct rather than one per command; source_offsets expands them. Without
+## source_map, mark_source does nothing.
+
+from array import array
+
+from jack_compiler.VMCode import VMCode, serialize, SEGMENTS, ARITHMETIC_OPCODES, PUSH, POP, CONSTANT, NO_SEGMENT, \
+    LABEL, GOTO, IF_GOTO, CALL, FUNCTION, RETURN
 
 
 class VMWriter():
 
-    def __init__(self, vm_file_path):
-        """ Creates a new output.vm file and prepares it for writing. """
+    def __init__(self, vm_file_path=None, source_map=False):
+        """ Prepares a writer for the vm file at vm_file_path.
+
+        Commands are buffered until close is called, and only then is the file created (or overwritten). If
+        vm_file_path is None the vm code is kept in memory instead, and can be read back from vm_code. If source_map is
+        True the source offset of every command is recorded (see mark_source). """
         self.vm_file_path = vm_file_path
-        self.outfile = open(self.vm_file_path.as_posix(), mode="w+")
+        self.vm_instructions = VMCode()
+        self._source_marks = [] if source_map else None
+        self._unwritten = vm_file_path is not None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        return False
+
+    @property
+    def vm_code(self):
+        """ Returns the vm code written so far by an in-memory VMWriter. """
+        assert self.vm_file_path is None, "vm code is only kept in memory when no vm file path is given"
+        return serialize(self.vm_instructions)
+
+    @property
+    def source_offsets(self):
+        """ Returns an array holding, for each command written, the offset in the jack source of the construct that
+        produced it (-1 for commands written before the first mark). Only available if source_map was set. """
+        assert self._source_marks is not None, "source offsets are only recorded when source_map is set"
+        offsets = array("i")
+        start, offset = 0, -1
+        for next_start, next_offset in self._source_marks + [(len(self.vm_instructions), -1)]:
+            offsets.extend([offset] * (next_start - start))
+            start, offset = next_start, next_offset
+        return offsets
+
+    def mark_source(self, offset):
+        """ Records that the commands written from now on come from the jack construct at offset in the source. """
+        if self._source_marks is not None:
+            self._source_marks.append((len(self.vm_instructions), offset))
+
+    def close(self):
+        """ Writes every buffered command to the vm file, in one go. Only the first call writes anything. """
+        if self._unwritten:
+            self._unwritten = False
+            with self._open_vm_file() as outfile:
+                outfile.write(serialize(self.vm_instructions))
+
+    def discard(self):
+        """ Removes the vm file, if there is one, and makes sure close will not write it again. """
+        if self._unwritten:
+            self._unwritten = False
+            if self.vm_file_path.exists():
+                self.vm_file_path.unlink()
+
+    def _open_vm_file(self):
+        return open(self.vm_file_path.as_posix(), mode="w")
 
     def write_push(self, segment, index):
         """ Writes a vm push command.
@@ -17,53 +87,51 @@ class VMWriter():
         Segment: one of CONST, ARG, LOCAL, STATIC, THIS, THAT, POINTER, TEMP
         Index: an integer
         """
-        self.outfile.write("push {} {}\n".format(SEGMENT_NAMES_MAP[segment], index))
+        self.vm_instructions.append(PUSH, SEGMENTS[segment], None, index)
 
     def write_pop(self, segment, index):
         """ Writes a vm pop command.
 
         Segment: one of CONST, ARG, LOCAL, STATIC, THIS, THAT, POINTER, TEMP
         Index: an integer"""
-        self.outfile.write("pop {} {}\n".format(SEGMENT_NAMES_MAP[segment], index))
+        self.vm_instructions.append(POP, SEGMENTS[segment], None, index)
 
     def write_arithmetic(self, command):
         """ Writes a vm arithmetic logical command.
 
         command: one of ADD, SUB, NEG, EQ, GT, LT, AND, OR, NOT
         """
-        self.outfile.write(command.lower() + "\n")
+        self.vm_instructions.append(ARITHMETIC_OPCODES[command])
 
     def write_label(self, label):
         """ Writes a vm label command. """
-        self.outfile.write("label {}\n".format(label))
+        self.vm_instructions.append(LABEL, NO_SEGMENT, label)
 
     def write_goto(self, label):
         """ Writes a vm goto command. """
-        self.outfile.write("goto {}\n".format(label))
+        self.vm_instructions.append(GOTO, NO_SEGMENT, label)
 
     def write_if_goto(self, label):
         """ Writes a vm if-goto command. """
-        self.outfile.write("if-goto {}\n".format(label))
+        self.vm_instructions.append(IF_GOTO, NO_SEGMENT, label)
 
     def write_call(self, name, num_args):
         """ Writes a vm call command. """
-        self.outfile.write("call {} {}\n".format(name, num_args))
+        self.vm_instructions.append(CALL, NO_SEGMENT, name, num_args)
 
     def write_function(self, name, num_locals):
         """ Writes a vm function command. """
-        self.outfile.write("function {} {}\n".format(name, num_locals))
+        self.vm_instructions.append(FUNCTION, NO_SEGMENT, name, num_locals)
 
     def write_return(self):
         """ Writes a vm return command. """
-        self.outfile.write("return\n")
+        self.vm_instructions.append(RETURN)
 
     def write_string(self, string):
-        """ Writes a string constant. """
-        trimmed_string = string[1:-1]
-        self.write_push("CONST", len(trimmed_string))
-        self.write_call("String.new", 1)
-        for ascii_code in [ord(character) for character in trimmed_string]:
-            self.write_push("CONST", ascii_code)
-            self.write_call("String.appendChar", 2)
-
-
+        """ Writes a string constant (string should not include the enclosing quotes). """
+        append = self.vm_instructions.append
+        append(PUSH, CONSTANT, None, len(string))
+        append(CALL, NO_SEGMENT, "String.new", 1)
+        for character in string:
+            append(PUSH, CONSTANT, None, ord(character))
+            append(CALL, NO_SEGMENT, "String.appendChar", 2)
@@ -1,11 +1,65 @@
 __author__ = 'paulpatterson'
 
+from argparse import ArgumentParser
 from pathlib import Path
-from jack_compiler.JackCompiler import JackCompiler
-import sys
+from jack_compiler.JackCompiler import JackCompiler, DEFAULT_POLL_INTERVAL
+from jack_compiler.Optimizer import OPTIMIZATION_LEVELS
+from jack_compiler.Inliner import DEFAULT_INLINE_THRESHOLD
 import os
 
+
+def parse_arguments():
+    parser = ArgumentParser(description="Compiles a .jack file, or every .jack file in a directory, to vm code.")
+    parser.add_argument("path", help="a .jack file, or a directory containing .jack files")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="the number of files to compile in parallel (default: 1)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="recompile every file, without reading or updating the build cache")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running, recompiling files as they change (stop with Ctrl-C)")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL,
+                        help="seconds between checks for changes in watch mode (default: %(default)s)")
+    parser.add_argument("-O", dest="optimization_level", type=int, choices=OPTIMIZATION_LEVELS, default=0,
+                        help="the vm optimization level: -O0 (none, the default) or -O1 (peephole rewrites)")
+    parser.add_argument("--whole-program", action="store_true",
+                        help="treat the files as a complete program, leaving out functions Main.main never reaches")
+    parser.add_argument("--inline", dest="inline_threshold", type=int, nargs="?", const=DEFAULT_INLINE_THRESHOLD,
+                        help="inline calls to leaf functions of at most INLINE_THRESHOLD vm instructions "
+                             "(default: %(const)s); needs --whole-program")
+    parser.add_argument("--check", action="store_true",
+                        help="run semantic checks (undeclared names, argument counts, 'this' in functions), reporting "
+                             "every error found; classes outside the compiled files count as undeclared")
+    parser.add_argument("--source-maps", action="store_true",
+                        help="write a .vm.map file alongside each .vm file, giving the jack line and column of every "
+                             "vm command; needs -O0 and cannot be combined with --whole-program")
+    arguments = parser.parse_args()
+    if arguments.watch and arguments.whole_program:
+        parser.error("--watch cannot be combined with --whole-program")
+    if arguments.inline_threshold is not None and not arguments.whole_program:
+        parser.error("--inline needs --whole-program")
+    if arguments.source_maps and (arguments.optimization_level > 0 or arguments.whole_program):
+        parser.error("--source-maps needs -O0 and cannot be combined with --whole-program")
+    return arguments
+
+
 if __name__ == "__main__":
-    path = Path(os.getcwd()) / sys.argv[1]
-    compiler = JackCompiler(path=path)
-    compiler.compile()
+    arguments = parse_arguments()
+    path = Path(os.getcwd()) / arguments.path
+    compiler = JackCompiler(path=path, jobs=arguments.jobs, use_cache=not arguments.no_cache,
+                            optimization_level=arguments.optimization_level, whole_program=arguments.whole_program,
+                            inline_threshold=arguments.inline_threshold, build_syntax_trees=False,
+                            check=arguments.check, source_maps=arguments.source_maps)
+    if arguments.watch:
+        try:
+            compiler.watch(poll_interval=arguments.poll_interval)
+        except KeyboardInterrupt:
+            pass
+    else:
+        compiler.compile()
+        if arguments.optimization_level > 0:
+            for jack_file_name, num_instructions_removed in compiler.instructions_removed.items():
+                print("{}: {} vm instruction(s) removed".format(jack_file_name, num_instructions_removed))
+        if arguments.whole_program:
+            for (caller, callee), num_calls in sorted(compiler.inlined_calls.items()):
+                print("{} inlined into {} ({} call(s))".format(callee, caller, num_calls))
+            print("{} unreachable function(s) removed".format(len(compiler.removed_functions)))
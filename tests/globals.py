@@ -1,8 +1,25 @@
 __author__ = 'paulpatterson'
 
+import unittest
+import shutil
+import tempfile
 from pathlib import Path
 
 NAND_2_TETRIS = Path("/Users/paulpatterson/Documents/MacProgramming/Nand2Tetris")
 PROJ_10_DIR = NAND_2_TETRIS / "nand2tetris" / "projects" / "10"
 ACTUAL_COMPARE = NAND_2_TETRIS / "actual.txt"
-EXPECTED_COMPARE = NAND_2_TETRIS / "expected.txt"
\ No newline at end of file
+EXPECTED_COMPARE = NAND_2_TETRIS / "expected.txt"
+
+
+class JackDirectoryTestCase(unittest.TestCase):
+    """ A test case that gets a fresh temporary directory, jack_dir, for its jack classes, removed after each test. """
+
+    def setUp(self):
+        self.jack_dir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.jack_dir.as_posix())
+
+    def write_jack_class(self, class_name, jack_code):
+        with open((self.jack_dir / (class_name + ".jack")).as_posix(), "w") as jack_file:
+            jack_file.write(jack_code)
@@ -0,0 +1,77 @@
+__author__ = 'paulpatterson'
+
+import pickle
+import unittest
+
+from jack_compiler.AbstractSyntaxTree import SubroutineDec, LetStatement, Expression, Term
+from jack_compiler.JackCompiler import compile_jack_code
+
+POINT_CLASS = """
+class Point {
+    field int x, y;
+    static int count;
+
+    constructor Point new(int ax, int ay) {
+        let x = ax;
+        let y = ay;
+        return this;
+    }
+
+    method int sum() {
+        var int total;
+        var boolean a, b;
+        let total = x + y - 1;
+        return total;
+    }
+}
+"""
+
+
+class AbstractSyntaxTreeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.ast = compile_jack_code(POINT_CLASS).ast
+
+    def test_declarations_are_recorded_on_their_nodes(self):
+        class_dec = self.ast.root
+        self.assertEqual(class_dec.name, "Point")
+        self.assertEqual(self.ast.class_name, "Point")
+
+        class_var_decs = [child for child in class_dec.children if child.tag == "classVarDec"]
+        self.assertListEqual([(dec.kind, dec.type, dec.names) for dec in class_var_decs],
+                             [("field", "int", ["x", "y"]), ("static", "int", ["count"])])
+
+        subroutine_decs = [child for child in class_dec.children if isinstance(child, SubroutineDec)]
+        self.assertListEqual([(dec.kind, dec.return_type, dec.name, dec.num_parameters, dec.num_locals)
+                              for dec in subroutine_decs],
+                             [("constructor", "Point", "new", 2, 0), ("method", "int", "sum", 0, 3)])
+
+    def test_nodes_know_their_parent(self):
+        let_stmt = self._find(self.ast.root, LetStatement)[-1]
+        expression = self._find(let_stmt, Expression)[0]
+        term = self._find(expression, Term)[0]
+
+        self.assertEqual(let_stmt.var_name, "total")
+        self.assertListEqual(expression.operators, ["+", "-"])
+        self.assertIs(term.parent, expression)
+        self.assertIs(expression.parent, let_stmt)
+        self.assertIsNone(self.ast.root.parent)
+
+    def test_xml_export(self):
+        xml = str(self.ast)
+        self.assertTrue(xml.startswith("<class>\n  <keyword> class </keyword>\n  <identifier> Point </identifier>"))
+        self.assertIn("<letStatement>", xml)
+
+    def test_pickled_tree_is_unchanged(self):
+        unpickled = pickle.loads(pickle.dumps(self.ast))
+        self.assertEqual(str(unpickled), str(self.ast))
+        self.assertEqual(unpickled.class_name, "Point")
+
+    def _find(self, node, node_class):
+        """ Returns every descendant of node that is an instance of node_class, in source order. """
+        found = []
+        for child in getattr(node, "children", ()):
+            if isinstance(child, node_class):
+                found.append(child)
+            found.extend(self._find(child, node_class))
+        return found
@@ -0,0 +1,67 @@
+__author__ = 'paulpatterson'
+
+from jack_compiler.JackCompiler import JackCompiler
+from jack_compiler.BuildCache import BuildCache, MANIFEST_NAME
+from tests.globals import JackDirectoryTestCase
+
+MAIN_CLASS = """
+class Main {
+    function void main() {
+        do Output.printInt(Helper.twice(21));
+        return;
+    }
+}
+"""
+
+HELPER_CLASS = """
+class Helper {
+    function int twice(int x) {
+        return x + x;
+    }
+}
+"""
+
+
+class BuildCacheTest(JackDirectoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.write_jack_class("Main", MAIN_CLASS)
+        self.write_jack_class("Helper", HELPER_CLASS)
+
+    def compile(self, use_cache=True, optimization_level=0):
+        compiler = JackCompiler(path=self.jack_dir, use_cache=use_cache, optimization_level=optimization_level)
+        compiler.compile()
+        return sorted(jack_file.name for jack_file in compiler.compiled_file_paths)
+
+    def test_unchanged_files_are_skipped(self):
+        self.assertListEqual(self.compile(), ["Helper.jack", "Main.jack"])
+        self.assertTrue((self.jack_dir / MANIFEST_NAME).exists())
+        self.assertListEqual(self.compile(), [])
+
+    def test_changed_file_is_recompiled(self):
+        self.compile()
+        self.write_jack_class("Helper", HELPER_CLASS.replace("x + x", "x * 2"))
+        self.assertListEqual(self.compile(), ["Helper.jack"])
+
+    def test_missing_or_edited_output_is_recompiled(self):
+        self.compile()
+        (self.jack_dir / "Main.vm").unlink()
+        with open((self.jack_dir / "Helper.vm").as_posix(), "a") as vm_file:
+            vm_file.write("push constant 0\n")
+        self.assertListEqual(self.compile(), ["Helper.jack", "Main.jack"])
+
+    def test_new_compiler_version_invalidates_cache(self):
+        self.compile()
+        cache = BuildCache(self.jack_dir, compiler_version="a different compiler")
+        self.assertFalse(cache.is_fresh(self.jack_dir / "Main.jack", self.jack_dir / "Main.vm"))
+        self.assertTrue(BuildCache(self.jack_dir).is_fresh(self.jack_dir / "Main.jack", self.jack_dir / "Main.vm"))
+
+    def test_optimization_level_invalidates_cache(self):
+        self.compile()
+        self.assertListEqual(self.compile(optimization_level=1), ["Helper.jack", "Main.jack"])
+        self.assertListEqual(self.compile(optimization_level=1), [])
+
+    def test_cache_can_be_bypassed(self):
+        self.compile()
+        self.assertListEqual(self.compile(use_cache=False), ["Helper.jack", "Main.jack"])
@@ -0,0 +1,111 @@
+__author__ = 'paulpatterson'
+
+import unittest
+
+from jack_compiler.CallGraph import build_call_graph, reachable_functions
+from jack_compiler.JackCompiler import JackCompiler, compile_jack_code
+from tests.globals import JackDirectoryTestCase
+from tests.vm_emulator import VMEmulator
+
+MAIN_CLASS = """
+class Main {
+    function void main() {
+        var Counter counter;
+        var int value;
+        let counter = Counter.new(40);
+        do counter.increment();
+        let value = counter.value();
+        do Output.printInt(value);
+        return;
+    }
+
+    function void unused() {
+        do Main.alsoUnused();
+        return;
+    }
+
+    function void alsoUnused() {
+        do Main.unused();
+        return;
+    }
+}
+"""
+
+COUNTER_CLASS = """
+class Counter {
+    field int count;
+
+    constructor Counter new(int start) {
+        let count = start;
+        return this;
+    }
+
+    method void increment() {
+        do add(2);
+        return;
+    }
+
+    method void add(int amount) {
+        let count = count + amount;
+        return;
+    }
+
+    method int value() {
+        return count;
+    }
+
+    method void dispose() {
+        do Memory.deAlloc(this);
+        return;
+    }
+}
+"""
+
+
+class CallGraphTest(unittest.TestCase):
+
+    def test_call_graph_follows_resolved_calls(self):
+        vm_codes = [compile_jack_code(MAIN_CLASS).vm_instructions, compile_jack_code(COUNTER_CLASS).vm_instructions]
+        call_graph = build_call_graph(vm_codes)
+        self.assertSetEqual(call_graph["Main.main"],
+                            {"Counter.new", "Counter.increment", "Counter.value", "Output.printInt"})
+        self.assertSetEqual(call_graph["Counter.increment"], {"Counter.add"})
+        self.assertSetEqual(reachable_functions(call_graph),
+                            {"Main.main", "Counter.new", "Counter.increment", "Counter.add", "Counter.value"})
+
+
+class WholeProgramCompilationTest(JackDirectoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for class_name, jack_code in [("Main", MAIN_CLASS), ("Counter", COUNTER_CLASS)]:
+            self.write_jack_class(class_name, jack_code)
+
+    def compile_whole_program(self, jobs=1):
+        compiler = JackCompiler(path=self.jack_dir, jobs=jobs, use_cache=True, whole_program=True)
+        compiler.compile()
+        vm_sources = {}
+        for class_name in ["Main", "Counter"]:
+            with open((self.jack_dir / (class_name + ".vm")).as_posix()) as vm_file:
+                vm_sources[class_name] = vm_file.read()
+        return compiler, vm_sources
+
+    def test_unreachable_functions_are_removed(self):
+        compiler, vm_sources = self.compile_whole_program()
+        self.assertListEqual(sorted(compiler.removed_functions),
+                             ["Counter.dispose", "Main.alsoUnused", "Main.unused"])
+        self.assertNotIn("function Main.unused", vm_sources["Main"])
+        self.assertIn("function Counter.add", vm_sources["Counter"])
+        self.assertFalse(any(path.name.startswith(".") for path in self.jack_dir.iterdir()))
+
+        emulator = VMEmulator(vm_sources)
+        emulator.run()
+        self.assertEqual(emulator.printed, "42")
+
+    def test_parallel_whole_program(self):
+        self.assertEqual(self.compile_whole_program(jobs=2)[1], self.compile_whole_program()[1])
+
+    def test_whole_program_needs_main(self):
+        (self.jack_dir / "Main.jack").unlink()
+        compiler = JackCompiler(path=self.jack_dir, whole_program=True)
+        self.assertRaises(AssertionError, compiler.compile)
@@ -1,9 +1,12 @@
 
 import unittest
-from jack_compiler.JackCompiler import JackCompiler
+import shutil
+import tempfile
+import xml.etree.ElementTree as ET
+from jack_compiler.JackCompiler import JackCompiler, compile_jack_code
 from pathlib import Path
 
-from tests.globals import PROJ_10_DIR
+from tests.globals import PROJ_10_DIR, JackDirectoryTestCase
 
 class CompilerSetUpTest(unittest.TestCase):
 
@@ -28,3 +31,107 @@ class CompilerSetUpTest(unittest.TestCase):
         analyzer = JackCompiler(path=Path(jack_dir ))
         actual_jack_paths = sorted([path.as_posix() for path in analyzer.jack_file_paths])
         self.assertListEqual(expected_jack_paths, actual_jack_paths, "contents of 'jack_file_paths' is unexpected.")
+
+
+class ParallelCompilationTest(JackDirectoryTestCase):
+
+    PONG_CLASSES = {"Main": "Pong-Main", "PongGame": "Pong-PongGame", "Bat": "Pong-Bat", "Ball": "Pong-Ball"}
+
+    def setUp(self):
+        super().setUp()
+        tests = ET.parse((Path(__file__).parent / "CompilationTests.xml").as_posix()).getroot()
+        for class_name, test_id in self.PONG_CLASSES.items():
+            jack_code = tests.find("*[@id='{}']/jack_class".format(test_id)).text
+            self.write_jack_class(class_name, jack_code)
+
+    def read_vm_files(self):
+        vm_files = {}
+        for vm_file_path in sorted(self.jack_dir.glob("*.vm")):
+            with open(vm_file_path.as_posix(), "rb") as vm_file:
+                vm_files[vm_file_path.name] = vm_file.read()
+            vm_file_path.unlink()
+        return vm_files
+
+    def test_parallel_output_matches_sequential_output(self):
+        sequential_compiler = JackCompiler(path=self.jack_dir)
+        sequential_compiler.compile()
+        sequential_output = self.read_vm_files()
+
+        parallel_compiler = JackCompiler(path=self.jack_dir, jobs=2)
+        parallel_compiler.compile()
+        parallel_output = self.read_vm_files()
+
+        self.assertEqual(len(parallel_output), len(self.PONG_CLASSES))
+        self.assertDictEqual(parallel_output, sequential_output)
+        self.assertListEqual([str(ast) for ast in parallel_compiler.abstract_syntax_trees],
+                             [str(ast) for ast in sequential_compiler.abstract_syntax_trees])
+
+    def test_parallel_errors_are_collected_in_file_order(self):
+        self.write_jack_class("Broken", "class Broken { function void f() { let = 1; } }")
+        self.write_jack_class("Alsobroken", "klass Alsobroken { }")
+
+        compiler = JackCompiler(path=self.jack_dir, jobs=3)
+        with self.assertRaises(AssertionError) as context:
+            compiler.compile()
+
+        message = str(context.exception)
+        self.assertIn("2 file(s)", message)
+        self.assertLess(message.index("Alsobroken.jack"), message.index("Broken.jack"))
+        vm_files = self.read_vm_files()
+        for class_name in self.PONG_CLASSES:
+            self.assertIn(class_name + ".vm", vm_files)
+
+
+class InMemoryCompilationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tests = ET.parse((Path(__file__).parent / "CompilationTests.xml").as_posix()).getroot()
+
+    def test_compile_jack_code(self):
+        test = self.tests.find("*[@id='Seven']")
+        result = compile_jack_code(test.find("jack_class").text)
+
+        expected_vm = [line.strip() for line in test.find("expected_vm").text.strip().splitlines()]
+        self.assertListEqual(result.vm_code.splitlines(), expected_vm)
+        self.assertEqual(result.ast.class_name, "Main")
+
+    def test_compiler_for_jack_string_writes_no_files(self):
+        jack_dir = Path(tempfile.mkdtemp())
+        try:
+            compiler = JackCompiler.compiler_for_jack_string(self.tests.find("*[@id='Seven']/jack_class").text,
+                                                            jack_dir / "Main.vm")
+            compiler.compile()
+            self.assertIn("call Output.printInt 1", compiler.vm_code)
+            self.assertEqual(len(compiler.abstract_syntax_trees), 1)
+            self.assertListEqual(list(jack_dir.iterdir()), [])
+        finally:
+            shutil.rmtree(jack_dir.as_posix())
+
+    def test_compiling_without_syntax_trees(self):
+        for test in self.tests.iter("test"):
+            jack_class = test.find("jack_class")
+            if jack_class is None:
+                continue
+            with self.subTest(test=test.get("id")):
+                result = compile_jack_code(jack_class.text, build_ast=False)
+                self.assertIsNone(result.ast)
+                self.assertEqual(result.vm_code, compile_jack_code(jack_class.text).vm_code)
+
+    def test_only_the_results_of_do_statements_are_discarded(self):
+        jack_code = """
+        class Main {
+            function int twice(int x) { return x + x; }
+            function int main() {
+                do Output.printInt(Main.twice(Main.twice(3)));
+                if (Main.twice(1) = 2) { return Main.twice(5); }
+                return 0;
+            }
+        }"""
+        vm_code = compile_jack_code(jack_code).vm_code.splitlines()
+        self.assertEqual(vm_code.count("pop temp 0"), 1)
+        self.assertEqual(vm_code[vm_code.index("call Output.printInt 1") + 1], "pop temp 0")
+
+    def test_type_must_be_primitive_or_a_class_name(self):
+        jack_code = "class Main { function void main() { var %s x; return; } }"
+        self.assertIn("push constant 0", compile_jack_code(jack_code % "Array", build_ast=False).vm_code)
+        self.assertRaises(AssertionError, compile_jack_code, jack_code % "while")
@@ -0,0 +1,108 @@
+__author__ = 'paulpatterson'
+
+from jack_compiler.Inliner import inline_calls
+from jack_compiler.JackCompiler import JackCompiler, compile_jack_code
+from jack_compiler.VMCode import serialize
+from tests.globals import JackDirectoryTestCase
+from tests.vm_emulator import VMEmulator
+
+MAIN_CLASS = """
+class Main {
+    function void main() {
+        var Point p, q;
+        var int i, x, y, total;
+        let p = Point.new(3, 4);
+        let q = Point.new(10, 20);
+        let i = 0;
+        while (i < 5) {
+            let x = p.getX();
+            let y = q.getY();
+            let total = total + Point.sum(x, y) + p.getY();
+            do p.moveBy(i);
+            let i = i + 1;
+        }
+        let total = total * Point.count();
+        do Output.printInt(total);
+        return;
+    }
+}
+"""
+
+POINT_CLASS = """
+class Point {
+    field int x, y;
+    static int created;
+
+    constructor Point new(int ax, int ay) {
+        let x = ax;
+        let y = ay;
+        let created = created + 1;
+        return this;
+    }
+
+    method int getX() { return x; }
+    method int getY() { return y; }
+    method void moveBy(int dx) { let x = x + dx; return; }
+
+    function int sum(int a, int b) {
+        var int s;
+        let s = a + b;
+        return s;
+    }
+
+    function int count() { return created; }
+}
+"""
+
+
+class InlinerTest(JackDirectoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for class_name, jack_code in [("Main", MAIN_CLASS), ("Point", POINT_CLASS)]:
+            self.write_jack_class(class_name, jack_code)
+
+    def run_program(self, **options):
+        compiler = JackCompiler(path=self.jack_dir, whole_program=True, **options)
+        compiler.compile()
+        vm_sources = {}
+        for class_name in ["Main", "Point"]:
+            with open((self.jack_dir / (class_name + ".vm")).as_posix()) as vm_file:
+                vm_sources[class_name] = vm_file.read()
+        emulator = VMEmulator(vm_sources)
+        emulator.run()
+        return compiler, vm_sources, emulator
+
+    def test_inlined_program_behaves_like_original(self):
+        _, _, original = self.run_program()
+        compiler, vm_sources, inlined = self.run_program(inline_threshold=8)
+
+        self.assertEqual(inlined.printed, original.printed)
+        self.assertEqual(inlined.printed, "290")
+        self.assertEqual(original.calls - inlined.calls, 5 * 5)
+        self.assertDictEqual(dict(compiler.inlined_calls),
+                             {("Main.main", "Point.getX"): 1, ("Main.main", "Point.getY"): 2,
+                              ("Main.main", "Point.moveBy"): 1, ("Main.main", "Point.sum"): 1})
+        self.assertNotIn("call Point.get", vm_sources["Main"])
+        self.assertIn("call Point.count", vm_sources["Main"])
+        self.assertListEqual(sorted(compiler.removed_functions),
+                             ["Point.getX", "Point.getY", "Point.moveBy", "Point.sum"])
+
+    def test_threshold(self):
+        compiler, _, _ = self.run_program(inline_threshold=3)
+        self.assertSetEqual({callee for _, callee in compiler.inlined_calls}, {"Point.getX", "Point.getY"})
+
+    def test_optimized_program_can_be_inlined(self):
+        _, _, original = self.run_program()
+        _, _, inlined = self.run_program(inline_threshold=8, optimization_level=1)
+        self.assertEqual(inlined.printed, original.printed)
+
+    def test_new_locals_are_shared_between_call_sites(self):
+        vm_codes, inlined_calls = inline_calls([compile_jack_code(MAIN_CLASS).vm_instructions,
+                                                compile_jack_code(POINT_CLASS).vm_instructions])
+        main_vm = serialize(vm_codes[0]).splitlines()
+        self.assertEqual(main_vm[0], "function Main.main 9")
+        self.assertEqual(sum(inlined_calls.values()), 5)
+
+    def test_inlining_needs_whole_program(self):
+        self.assertRaises(AssertionError, JackCompiler, self.jack_dir, inline_threshold=8)
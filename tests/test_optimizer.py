@@ -0,0 +1,254 @@
+__author__ = 'paulpatterson'
+
+import unittest
+from pathlib import Path
+import xml.etree.ElementTree as ET
+
+from jack_compiler.JackCompiler import compile_jack_code
+from jack_compiler.Optimizer import optimize, eliminate_dead_code, PeepholeOptimizer
+from jack_compiler.VMCode import VMCode, serialize, OPCODE_NAMES, SEGMENT_NAMES, LABEL, GOTO, IF_GOTO, CALL, \
+    FUNCTION, PUSH, POP, NO_SEGMENT
+from tests.vm_emulator import VMEmulator
+
+TESTS = ET.parse((Path(__file__).parent / "CompilationTests.xml").as_posix()).getroot()
+
+
+def parse_vm(vm_text):
+    """ Returns the VMCode for vm_text (a sequence of vm commands, one per line). """
+    vm_code = VMCode()
+    for line in vm_text.strip().splitlines():
+        words = line.split()
+        opcode = OPCODE_NAMES.index(words[0])
+        if opcode in (PUSH, POP):
+            vm_code.append(opcode, SEGMENT_NAMES.index(words[1]), None, int(words[2]))
+        elif opcode in (LABEL, GOTO, IF_GOTO):
+            vm_code.append(opcode, NO_SEGMENT, words[1])
+        elif opcode in (CALL, FUNCTION):
+            vm_code.append(opcode, NO_SEGMENT, words[1], int(words[2]))
+        else:
+            vm_code.append(opcode)
+    return vm_code
+
+
+class PeepholeOptimizerTest(unittest.TestCase):
+
+    def assertOptimizesTo(self, vm_text, expected_vm_text):
+        optimized = PeepholeOptimizer(list(parse_vm("function Main.f 0\n" + vm_text))).optimize()
+        self.assertEqual(serialize(VMCode(optimized)), serialize(parse_vm("function Main.f 0\n" + expected_vm_text)))
+
+    def test_level_zero_copies_code(self):
+        vm_code = parse_vm("function Main.f 0\npush constant 0\nnot\nnot\nreturn")
+        self.assertEqual(optimize(vm_code, 0), vm_code)
+
+    def test_double_not(self):
+        self.assertOptimizesTo("push local 0\nnot\nnot\nreturn", "push local 0\nreturn")
+
+    def test_if_branches_are_inverted(self):
+        self.assertOptimizesTo("push local 0\npush local 1\nlt\nif-goto IF_TRUE0\ngoto IF_FALSE0\nlabel IF_TRUE0\n"
+                               "push constant 1\npop local 1\nlabel IF_FALSE0\nreturn",
+                               "push local 0\npush local 1\nlt\nnot\nif-goto IF_FALSE0\npush constant 1\npop local 1\n"
+                               "label IF_FALSE0\nreturn")
+
+    def test_inverted_branch_cancels_negated_condition(self):
+        self.assertOptimizesTo("push local 0\npush constant 3\neq\nnot\nif-goto IF_TRUE0\ngoto IF_FALSE0\n"
+                               "label IF_TRUE0\nlabel IF_FALSE0\nreturn",
+                               "push local 0\npush constant 3\neq\nif-goto IF_FALSE0\nlabel IF_FALSE0\nreturn")
+
+    def test_branches_on_integer_conditions_are_not_inverted(self):
+        for condition in ["push local 0", "push local 0\nnot", "push local 0\nneg", "push local 0\npush local 1\nand"]:
+            vm_text = condition + "\nif-goto IF_TRUE0\ngoto IF_FALSE0\nlabel IF_TRUE0\npush constant 1\npop local 1\n" \
+                                  "label IF_FALSE0\nreturn"
+            with self.subTest(condition=condition):
+                self.assertOptimizesTo(vm_text, vm_text)
+
+    def test_shared_label_is_kept(self):
+        vm_text = "push local 0\nif-goto A\ngoto B\nlabel A\npush local 1\nif-goto A\nlabel B\nreturn"
+        self.assertOptimizesTo(vm_text, vm_text)
+
+    def test_constant_conditions(self):
+        self.assertOptimizesTo("push constant 0\nif-goto L\npush constant 3\nif-goto L\nlabel L\nreturn",
+                               "label L\nreturn")
+        self.assertOptimizesTo("label WHILE_EXP0\npush constant 0\nnot\nnot\nif-goto WHILE_END0\ngoto WHILE_EXP0\n"
+                               "label WHILE_END0\nreturn",
+                               "label WHILE_EXP0\ngoto WHILE_EXP0\nlabel WHILE_END0\nreturn")
+
+    def test_array_store_of_simple_value(self):
+        self.assertOptimizesTo("push local 0\npush constant 2\nadd\npush argument 1\npop temp 0\npop pointer 1\n"
+                               "push temp 0\npop that 0\nreturn",
+                               "push local 0\npush constant 2\nadd\npop pointer 1\npush argument 1\npop that 0\n"
+                               "return")
+
+    def test_array_store_of_array_element_is_kept(self):
+        vm_text = "push local 0\npush local 1\nadd\npush that 0\npop temp 0\npop pointer 1\npush temp 0\n" \
+                  "pop that 0\nreturn"
+        self.assertOptimizesTo(vm_text, vm_text)
+
+    def test_labels_are_local_to_functions(self):
+        vm_code = parse_vm("function Main.f 0\npush local 0\npush local 1\ngt\nif-goto L\ngoto M\nlabel L\nlabel M\n"
+                           "return\nfunction Main.g 0\ngoto L\nlabel L\nreturn")
+        self.assertEqual(serialize(optimize(vm_code)),
+                         "function Main.f 0\npush local 0\npush local 1\ngt\nnot\nif-goto M\nlabel M\nreturn\n"
+                         "function Main.g 0\nreturn\n")
+
+
+class DeadCodeEliminationTest(unittest.TestCase):
+
+    def assertEliminatesTo(self, vm_text, expected_vm_text):
+        remaining = eliminate_dead_code(list(parse_vm("function Main.f 0\n" + vm_text)))
+        self.assertEqual(serialize(VMCode(remaining)), serialize(parse_vm("function Main.f 0\n" + expected_vm_text)))
+
+    def test_code_after_return(self):
+        self.assertEliminatesTo("push constant 0\nreturn\npush constant 1\nreturn", "push constant 0\nreturn")
+
+    def test_code_after_goto_up_to_used_label(self):
+        self.assertEliminatesTo("label L\npush local 0\nif-goto E\ngoto L\npush local 1\nlabel U\npop local 0\n"
+                                "label E\npush constant 0\nreturn",
+                                "label L\npush local 0\nif-goto E\ngoto L\nlabel E\npush constant 0\nreturn")
+
+    def test_unused_labels_and_jumps_to_next_instruction(self):
+        self.assertEliminatesTo("label A\ngoto B\nlabel B\nlabel C\npush constant 0\nreturn",
+                                "push constant 0\nreturn")
+
+    def test_infinite_loop_keeps_its_label(self):
+        self.assertEliminatesTo("label W\ncall Main.g 0\npop temp 0\ngoto W\nlabel E\npush constant 0\nreturn",
+                                "label W\ncall Main.g 0\npop temp 0\ngoto W")
+
+    def test_constant_branches_collapse(self):
+        jack_code = """
+        class Main {
+            function int main() {
+                var int x;
+                if (false) { let x = 1; } else { let x = 2; }
+                if (true) { let x = x + 3; }
+                while (false) { let x = 0; }
+                while (true) {
+                    if (x > 4) { return x; }
+                    let x = x + 1;
+                }
+                return 0;
+            }
+        }"""
+        optimized = compile_jack_code(jack_code, 1)
+        labels = [line for line in optimized.vm_code.splitlines() if line.startswith("label")]
+        self.assertListEqual(labels, ["label WHILE_EXP1", "label IF_FALSE2"])
+        self.assertEqual(optimized.vm_code.count("return"), 1)
+        self.assertEqual(VMEmulator({"Main": optimized.vm_code}).run(), 5)
+        self.assertEqual(VMEmulator({"Main": compile_jack_code(jack_code).vm_code}).run(), 5)
+
+
+class ConstantFoldingTest(unittest.TestCase):
+
+    def assertOptimizesTo(self, vm_text, expected_vm_text):
+        optimized = optimize(parse_vm("function Main.f 0\n" + vm_text))
+        self.assertEqual(serialize(optimized), serialize(parse_vm("function Main.f 0\n" + expected_vm_text)))
+
+    def test_numbers(self):
+        jack_code = TESTS.find("*[@id='Numbers']/jack_class").text
+        vm_lines = compile_jack_code(jack_code, 1).vm_code.splitlines()
+        self.assertListEqual(vm_lines[1:7], ["push constant 7", "push constant 90", "push constant 5",
+                                             "push constant 2", "not", "call Main.random 4"])
+
+    def test_wraparound(self):
+        self.assertOptimizesTo("push constant 32767\npush constant 1\nadd", "push constant 32767\nnot")
+        self.assertOptimizesTo("push constant 300\npush constant 300\ncall Math.multiply 2", "push constant 24464")
+        self.assertOptimizesTo("push constant 0\npush constant 32767\nsub\npush constant 2\nsub",
+                               "push constant 32767")
+
+    def test_unary_operators(self):
+        self.assertOptimizesTo("push constant 3\nneg\nneg", "push constant 3")
+        self.assertOptimizesTo("push constant 0\nneg", "push constant 0")
+        self.assertOptimizesTo("push constant 4\nneg\nnot", "push constant 3")
+        self.assertOptimizesTo("push constant 7\nneg\npush constant 2\ncall Math.divide 2", "push constant 3\nneg")
+
+    def test_comparisons(self):
+        self.assertOptimizesTo("push constant 1\npush constant 2\nlt", "push constant 0\nnot")
+        self.assertOptimizesTo("push constant 1\npush constant 2\neq", "push constant 0")
+
+    def test_division_by_zero_is_not_folded(self):
+        self.assertOptimizesTo("push constant 1\npush constant 0\ncall Math.divide 2",
+                               "push constant 1\npush constant 0\ncall Math.divide 2")
+
+    def test_strength_reduction(self):
+        self.assertOptimizesTo("push local 0\npush constant 1\ncall Math.multiply 2", "push local 0")
+        self.assertOptimizesTo("push local 0\npush constant 1\nneg\ncall Math.divide 2", "push local 0\nneg")
+        self.assertOptimizesTo("push local 0\npush constant 0\nadd", "push local 0")
+        self.assertOptimizesTo("push constant 4\npush local 0\ncall Math.multiply 2",
+                               "push local 0\npop temp 0\npush temp 0\npush temp 0\nadd\n"
+                               "pop temp 0\npush temp 0\npush temp 0\nadd")
+        self.assertOptimizesTo("push local 0\npush constant 16\ncall Math.multiply 2",
+                               "push local 0\npush constant 16\ncall Math.multiply 2")
+
+
+class OptimizedProgramTest(unittest.TestCase):
+
+    PROGRAMS = [("Seven", ()), ("Average", (3, 10, 20, 31)), ("ComplexArrays", ()), ("Numbers", ())]
+
+    def test_optimized_programs_behave_like_unoptimized_programs(self):
+        for test_id, keyboard_input in self.PROGRAMS:
+            with self.subTest(test=test_id):
+                jack_code = TESTS.find("*[@id='{}']/jack_class".format(test_id)).text
+                unoptimized, optimized = compile_jack_code(jack_code), compile_jack_code(jack_code, 1)
+                self.assertEqual(len(unoptimized.vm_code.splitlines()) - optimized.num_instructions_removed,
+                                 len(optimized.vm_code.splitlines()))
+
+                runs = []
+                for result in (unoptimized, optimized):
+                    emulator = VMEmulator({"Main": result.vm_code}, keyboard_input)
+                    runs.append((emulator.run(), emulator.printed))
+                self.assertEqual(runs[0], runs[1])
+
+    def test_folded_arithmetic_behaves_like_unfolded_arithmetic(self):
+        jack_code = """
+        class Main {
+            function int main() {
+                var int x, y;
+                let x = 3;
+                do Output.printInt(32767 + 1);
+                do Output.printInt(-(7 - 10) * -(2 + 3));
+                do Output.printInt(~(10 - 8) & 6 | 1);
+                do Output.printInt(-7 / 2);
+                do Output.printInt((x * 8) + (2 * x) + (x * 0) + (x * 1) + (x * -1) + (x / -1) + (x / 1));
+                do Output.printInt(-x * 4);
+                do Output.printInt(x - 0 + 0);
+                let y = (x * 2) * 2;
+                if ((1 + 1) = 2) { do Output.printInt(y); }
+                if (3 < 2) { do Output.printInt(99); }
+                return y + (1000 * 1000);
+            }
+        }"""
+        runs = []
+        for optimization_level in (0, 1):
+            emulator = VMEmulator({"Main": compile_jack_code(jack_code, optimization_level).vm_code})
+            runs.append((emulator.run(), emulator.printed, emulator.steps))
+        self.assertEqual(runs[0][:2], runs[1][:2])
+        self.assertLess(runs[1][2], runs[0][2])
+
+    def test_integer_conditions_behave_like_unoptimized_conditions(self):
+        jack_code = """
+        class Main {
+            function void main() {
+                var int a, b;
+                let a = 5;
+                let b = -5;
+                if (-a) { do Output.printInt(1); }
+                if (~a) { do Output.printInt(2); }
+                if (b) { do Output.printInt(3); }
+                if (~b) { do Output.printInt(4); }
+                if (a & 2) { do Output.printInt(5); }
+                if (~(a = 5)) { do Output.printInt(6); }
+                if (a > 4) { do Output.printInt(7); }
+                return;
+            }
+        }"""
+        runs = []
+        for optimization_level in (0, 1):
+            emulator = VMEmulator({"Main": compile_jack_code(jack_code, optimization_level).vm_code})
+            emulator.run()
+            runs.append(emulator.printed)
+        self.assertEqual(runs[0], "12347")
+        self.assertEqual(runs[1], runs[0])
+
+    def test_instructions_are_removed(self):
+        jack_code = TESTS.find("*[@id='ComplexArrays']/jack_class").text
+        self.assertGreater(compile_jack_code(jack_code, 1).num_instructions_removed, 0)
+        self.assertEqual(compile_jack_code(jack_code).num_instructions_removed, 0)
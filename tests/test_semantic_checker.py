@@ -0,0 +1,152 @@
+__author__ = 'paulpatterson'
+
+import unittest
+
+from jack_compiler.JackCompiler import JackCompiler, compile_jack_code
+from jack_compiler.SemanticChecker import Diagnostic
+from jack_compiler.SignatureIndex import SignatureIndex, scan_signatures
+from tests.globals import JackDirectoryTestCase
+
+POINT_CLASS = """class Point {
+    field int x;
+    static int count;
+
+    constructor Point new(int ax) {
+        let x = ax;
+        let count = count + 1;
+        return this;
+    }
+
+    method int getX() { return x; }
+
+    function int getCount() { return count; }
+}
+"""
+
+
+def check(jack_code, *other_classes):
+    """ Checks jack_code as part of a build holding it and other_classes, returning its diagnostics. """
+    signature_index = SignatureIndex()
+    for code in (jack_code,) + other_classes:
+        signature_index.add_class(*scan_signatures(code))
+    return compile_jack_code(jack_code, signature_index=signature_index, check=True).diagnostics
+
+
+class SemanticCheckerTest(unittest.TestCase):
+
+    def test_a_correct_program_has_no_diagnostics(self):
+        main_class = """class Main {
+            function void main() {
+                var Point p;
+                var Array a;
+                let p = Point.new(3);
+                let a = Array.new(p.getX() + Point.getCount());
+                let a[0] = Math.max(1, 2);
+                do Output.printInt(a[0]);
+                return;
+            }
+        }"""
+        self.assertEqual(check(main_class, POINT_CLASS), [])
+        self.assertEqual(check(POINT_CLASS, main_class), [])
+
+    def test_every_error_is_reported_with_its_position(self):
+        main_class = "class Main {\n" \
+                     "    function void main() {\n" \
+                     "        let y = 1;\n" \
+                     "        do Main.run(z);\n" \
+                     "        return;\n" \
+                     "    }\n" \
+                     "    function void run() { return; }\n" \
+                     "}\n"
+        self.assertEqual(check(main_class), [
+            Diagnostic(3, 13, "undeclared identifier 'y'"),
+            Diagnostic(4, 17, "'Main.run' expects 0 argument(s), got 1"),
+            Diagnostic(4, 21, "undeclared identifier 'z'"),
+        ])
+
+    def test_argument_counts_are_checked_across_classes_and_against_the_os(self):
+        main_class = """class Main {
+            function void main() {
+                var Point p;
+                let p = Point.new();
+                do p.getX(1);
+                do Output.printInt(1, 2);
+                return;
+            }
+        }"""
+        messages = [diagnostic.message for diagnostic in check(main_class, POINT_CLASS)]
+        self.assertEqual(messages, ["'Point.new' expects 1 argument(s), got 0",
+                                    "'Point.getX' expects 0 argument(s), got 1",
+                                    "'Output.printInt' expects 1 argument(s), got 2"])
+
+    def test_this_cannot_be_used_in_a_function(self):
+        point_class = POINT_CLASS.replace("function int getCount() { return count; }",
+                                          "function int getCount() { do getX(); do Point.getX(); "
+                                          "let count = x; return this; }")
+        messages = [diagnostic.message for diagnostic in check(point_class)]
+        self.assertEqual(messages, ["method 'getX' cannot be called from a function without an object",
+                                    "method 'Point.getX' called without an object",
+                                    "field 'x' cannot be used in a function",
+                                    "'this' cannot be used in a function"])
+
+    def test_undeclared_classes_and_subroutines(self):
+        main_class = """class Main {
+            function void main() {
+                do Shape.draw();
+                do Point.draw();
+                do Output.draw();
+                return;
+            }
+        }"""
+        messages = [diagnostic.message for diagnostic in check(main_class, POINT_CLASS)]
+        self.assertEqual(messages, ["undeclared identifier 'Shape'", "undeclared subroutine 'Point.draw'",
+                                    "undeclared subroutine 'Output.draw'"])
+
+    def test_calls_to_variables_of_unknown_classes_are_not_checked(self):
+        main_class = """class Main {
+            function void main() {
+                var Shape s;
+                do s.draw(1, 2, 3);
+                return;
+            }
+        }"""
+        self.assertEqual(check(main_class), [])
+
+
+class CheckedBuildTest(JackDirectoryTestCase):
+
+    def test_all_errors_are_reported_and_broken_files_are_not_cached(self):
+        self.write_jack_class("Point", POINT_CLASS)
+        self.write_jack_class("Main", "class Main {\n    function void main() {\n        do Point.new(1, 2);\n"
+                                      "        return;\n    }\n}\n")
+        compiler = JackCompiler(path=self.jack_dir, use_cache=True, check=True)
+        with self.assertRaises(AssertionError) as context:
+            compiler.compile()
+        main_file = (self.jack_dir / "Main.jack").as_posix()
+        self.assertIn("Compilation failed with 1 error(s):\n{}:3:18: 'Point.new' expects 1 argument(s), got 2".format(
+            main_file), str(context.exception))
+        self.assertEqual([path.name for path in compiler.compiled_file_paths], ["Point.jack"])
+        self.assertTrue((self.jack_dir / "Point.vm").exists())
+        self.assertFalse((self.jack_dir / "Main.vm").exists())
+
+        compiler = JackCompiler(path=self.jack_dir, use_cache=True, check=True)
+        self.assertRaises(AssertionError, compiler.compile)
+        self.assertEqual(compiler.compiled_file_paths, [])
+
+    def test_files_with_errors_leave_no_output_behind(self):
+        self.write_jack_class("Main", "class Main { function void main() { return; } }")
+        JackCompiler(path=self.jack_dir, check=True, source_maps=True).compile()
+        self.assertTrue((self.jack_dir / "Main.vm").exists())
+
+        self.write_jack_class("Main", "class Main { function void main() { let x = 1; return; } }")
+        self.assertRaises(AssertionError, JackCompiler(path=self.jack_dir, check=True, source_maps=True).compile)
+        self.assertEqual(sorted(path.name for path in self.jack_dir.iterdir()), ["Main.jack"])
+
+    def test_compiling_without_checks_ignores_semantic_errors(self):
+        self.write_jack_class("Main", "class Main { function void main() { do Point.new(); return; } }")
+        JackCompiler(path=self.jack_dir).compile()
+        self.assertTrue((self.jack_dir / "Main.vm").exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
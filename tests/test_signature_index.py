@@ -0,0 +1,100 @@
+__author__ = 'paulpatterson'
+
+import json
+
+from jack_compiler.JackCompiler import JackCompiler, compile_jack_code
+from jack_compiler.SignatureIndex import SignatureIndex, Signature, scan_signatures, build_signature_index, \
+    INDEX_NAME
+from tests.globals import JackDirectoryTestCase
+
+POINT_CLASS = """
+/** A point: not a function void fake() */
+class Point {
+    field int x, y;
+
+    constructor Point new(int ax, int ay) {
+        let x = ax;
+        let y = ay;
+        return this;
+    }
+
+    // method void commented(int a)
+    method int distance(Point other, boolean manhattan) {
+        do Output.printString("function int inString()");
+        return Point.origin() + x - other.getX();
+    }
+
+    function int origin() {
+        return 0;
+    }
+
+    method int getX() { return x; }
+}
+"""
+
+MAIN_CLASS = """
+class Main {
+    function void main() {
+        do Output.printInt(twice(21));
+        return;
+    }
+
+    function int twice(int x) {
+        return x + x;
+    }
+}
+"""
+
+
+class SignatureIndexTest(JackDirectoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.write_jack_class("Point", POINT_CLASS)
+        self.write_jack_class("Main", MAIN_CLASS)
+
+    def test_only_headers_are_scanned(self):
+        class_name, signatures = scan_signatures(POINT_CLASS)
+        self.assertEqual(class_name, "Point")
+        self.assertListEqual(signatures, [Signature("constructor", "Point", "new", ("int", "int")),
+                                          Signature("method", "int", "distance", ("Point", "boolean")),
+                                          Signature("function", "int", "origin", ()),
+                                          Signature("method", "int", "getX", ())])
+
+    def test_index_round_trips_through_json(self):
+        signature_index = build_signature_index(sorted(self.jack_dir.glob("*.jack")))
+        copy = SignatureIndex.from_json(json.loads(json.dumps(signature_index.to_json())))
+        self.assertEqual(copy.signature_of("Point", "distance"), signature_index.signature_of("Point", "distance"))
+        self.assertTrue(copy.knows_class("Main"))
+        self.assertIsNone(copy.signature_of("Main", "distance"))
+
+    def test_unchanged_files_are_not_rescanned(self):
+        jack_files = sorted(self.jack_dir.glob("*.jack"))
+        build_signature_index(jack_files, self.jack_dir)
+        with open((self.jack_dir / INDEX_NAME).as_posix()) as index_file:
+            cached_index = json.load(index_file)
+        cached_index["files"]["Point.jack"]["signatures"] = [["function", "void", "cached", []]]
+        with open((self.jack_dir / INDEX_NAME).as_posix(), "w") as index_file:
+            json.dump(cached_index, index_file)
+
+        self.write_jack_class("Main", MAIN_CLASS.replace("twice", "double"))
+        signature_index = build_signature_index(jack_files, self.jack_dir)
+        self.assertIsNotNone(signature_index.signature_of("Point", "cached"))
+        self.assertIsNotNone(signature_index.signature_of("Main", "double"))
+        self.assertIsNone(signature_index.signature_of("Main", "twice"))
+
+    def test_unqualified_function_calls_pass_no_this(self):
+        JackCompiler(path=self.jack_dir, use_cache=True).compile()
+        with open((self.jack_dir / "Main.vm").as_posix()) as vm_file:
+            vm_code = vm_file.read().splitlines()
+        self.assertListEqual(vm_code[1:4], ["push constant 21", "call Main.twice 1", "call Output.printInt 1"])
+        self.assertTrue((self.jack_dir / INDEX_NAME).exists())
+
+    def test_unqualified_function_calls_pass_no_this_in_memory(self):
+        vm_code = compile_jack_code(MAIN_CLASS).vm_code
+        self.assertListEqual(vm_code.splitlines()[1:4],
+                             ["push constant 21", "call Main.twice 1", "call Output.printInt 1"])
+
+        compiler = JackCompiler.compiler_for_jack_string(MAIN_CLASS, self.jack_dir / "Main.vm")
+        compiler.compile()
+        self.assertEqual(compiler.vm_code, vm_code)
@@ -0,0 +1,88 @@
+__author__ = 'paulpatterson'
+
+import unittest
+
+from jack_compiler.JackCompiler import JackCompiler
+from jack_compiler.SourceMap import SourceLocation, read_source_map, source_map_path, write_source_map
+from jack_compiler.VMWriter import VMWriter
+from tests.globals import JackDirectoryTestCase
+
+MAIN_CLASS = """class Main {
+    function void main() {
+        var int x;
+        let x = 1 +
+            Main.double(2);
+        if (x) { do Output.printInt(x); }
+        return;
+    }
+
+    function int double(int a) {
+        return a * 2;
+    }
+}
+"""
+
+
+class SourceMapTest(JackDirectoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.write_jack_class("Main", MAIN_CLASS)
+        self.vm_file_path = self.jack_dir / "Main.vm"
+
+    def test_writer_records_the_offset_of_every_command(self):
+        vm_writer = VMWriter(source_map=True)
+        vm_writer.write_push("CONST", 1)
+        vm_writer.mark_source(10)
+        vm_writer.mark_source(20)
+        vm_writer.write_push("CONST", 2)
+        vm_writer.write_string("ab")
+        vm_writer.mark_source(30)
+        vm_writer.write_return()
+        self.assertEqual(list(vm_writer.source_offsets), [-1, 20, 20, 20, 20, 20, 20, 20, 30])
+
+        self.assertRaises(AssertionError, lambda: VMWriter().source_offsets)
+
+    def test_every_command_is_mapped_to_the_construct_that_produced_it(self):
+        JackCompiler(path=self.jack_dir, source_maps=True).compile()
+        header, locations = read_source_map(source_map_path(self.vm_file_path))
+        self.assertEqual(header, {"source": "Main.jack", "vm": "Main.vm"})
+
+        commands = self.vm_file_path.read_text().splitlines()
+        self.assertEqual([location.instruction for location in locations], list(range(len(commands))))
+        mapped = {command: (location.line, location.column) for command, location in zip(commands, locations)}
+        self.assertEqual(mapped["function Main.main 1"], (2, 5))
+        self.assertEqual(mapped["push constant 1"], (4, 17))
+        self.assertEqual(mapped["call Main.double 1"], (5, 13))
+        self.assertEqual(mapped["add"], (4, 19))
+        self.assertEqual(mapped["pop local 0"], (4, 9))
+        self.assertEqual(mapped["if-goto IF_TRUE0"], (6, 9))
+        self.assertEqual(mapped["call Output.printInt 1"], (6, 21))
+        self.assertEqual(mapped["call Math.multiply 2"], (11, 18))
+        self.assertEqual(locations[-1], SourceLocation(len(commands) - 1, 11, 9))
+
+    def test_commands_without_a_source_position_are_mapped_to_line_zero(self):
+        write_source_map(self.jack_dir / "Main.jack", self.vm_file_path, [-1, 0], lambda offset: (1, offset + 1))
+        header, locations = read_source_map(source_map_path(self.vm_file_path))
+        self.assertEqual(locations, [SourceLocation(0, 0, 0), SourceLocation(1, 1, 1)])
+
+    def test_a_missing_source_map_is_written_again(self):
+        JackCompiler(path=self.jack_dir, use_cache=True, source_maps=True).compile()
+        source_map_path(self.vm_file_path).unlink()
+
+        compiler = JackCompiler(path=self.jack_dir, use_cache=True, source_maps=True)
+        compiler.compile()
+        self.assertEqual(compiler.compiled_file_paths, [self.jack_dir / "Main.jack"])
+        self.assertTrue(source_map_path(self.vm_file_path).exists())
+
+    def test_no_source_maps_by_default(self):
+        JackCompiler(path=self.jack_dir).compile()
+        self.assertFalse(source_map_path(self.vm_file_path).exists())
+
+    def test_source_maps_need_unoptimized_separate_compilation(self):
+        self.assertRaises(AssertionError, JackCompiler, path=self.jack_dir, optimization_level=1, source_maps=True)
+        self.assertRaises(AssertionError, JackCompiler, path=self.jack_dir, whole_program=True, source_maps=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
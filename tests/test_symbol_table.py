@@ -0,0 +1,53 @@
+__author__ = 'paulpatterson'
+
+import unittest
+
+from jack_compiler.SymbolTable import SymbolTable, Symbol
+
+
+class SymbolTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.symbol_table = SymbolTable()
+        self.symbol_table.define("x", "int", "FIELD")
+        self.symbol_table.define("y", "int", "FIELD")
+        self.symbol_table.define("count", "int", "STATIC")
+
+    def test_indices_are_counted_per_kind(self):
+        self.symbol_table.start_subroutine()
+        self.symbol_table.define("this", "Point", "ARG")
+        self.symbol_table.define("dx", "int", "ARG")
+        self.symbol_table.define("total", "int", "VAR")
+
+        self.assertEqual(self.symbol_table.info_for_symbol("y"), Symbol("int", "FIELD", 1))
+        self.assertEqual(self.symbol_table.info_for_symbol("count"), Symbol("int", "STATIC", 0))
+        self.assertEqual(self.symbol_table.info_for_symbol("dx"), Symbol("int", "ARG", 1))
+        self.assertEqual(self.symbol_table.info_for_symbol("total"), Symbol("int", "VAR", 0))
+        self.assertListEqual([self.symbol_table.var_count(kind) for kind in ["FIELD", "STATIC", "ARG", "VAR"]],
+                             [2, 1, 2, 1])
+        self.assertIsNone(self.symbol_table.info_for_symbol("z"))
+
+    def test_start_subroutine_discards_subroutine_symbols(self):
+        self.symbol_table.start_subroutine()
+        self.symbol_table.define("a", "int", "ARG")
+        self.symbol_table.start_subroutine()
+
+        self.assertFalse(self.symbol_table.recognises_symbol("a"))
+        self.assertEqual(self.symbol_table.var_count("ARG"), 0)
+        self.assertEqual(self.symbol_table.var_count("FIELD"), 2)
+
+    def test_nested_scopes_shadow_and_restore(self):
+        self.symbol_table.start_subroutine()
+        self.symbol_table.define("x", "char", "VAR")
+        self.symbol_table.push_scope()
+        self.symbol_table.define("x", "boolean", "VAR")
+        self.assertEqual(self.symbol_table.info_for_symbol("x"), Symbol("boolean", "VAR", 1))
+
+        self.symbol_table.pop_scope()
+        self.assertEqual(self.symbol_table.info_for_symbol("x"), Symbol("char", "VAR", 0))
+        self.symbol_table.start_subroutine()
+        self.assertEqual(self.symbol_table.info_for_symbol("x"), Symbol("int", "FIELD", 0))
+
+    def test_class_variables_must_come_first(self):
+        self.symbol_table.start_subroutine()
+        self.assertRaises(AssertionError, self.symbol_table.define, "z", "int", "FIELD")
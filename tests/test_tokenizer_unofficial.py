@@ -1,10 +1,12 @@
 
 import unittest
 import tempfile
+import io
 import os
 from pathlib import  Path
 
-from jack_compiler.Tokenizer import Tokenizer
+from jack_compiler.Tokenizer import Tokenizer, SourcePositions, MASTER_LEXER, CASCADE_LEXER, KEYWORD, IDENTIFIER, \
+    SYMBOL, STRING_CONST
 
 
 class CustomTokenizerTests(unittest.TestCase):
@@ -100,9 +102,9 @@ class CustomTokenizerTests(unittest.TestCase):
         tokenizer.advance()
         tokenizer.advance()
         tokenizer.advance()
-        xml = tokenizer.current_token
+        token = tokenizer.current_token
         self.assertTrue( \
-            xml.text == " new ", "advance() returned unexpected result: got '', expected 'new'".format(xml.text))
+            token.value == "new", "advance() returned unexpected result: got '', expected 'new'".format(token.value))
 
     def test_advance_b(self):
         jack_snippet = "return Fraction.new(sum, denominator * other.getDenominator());"
@@ -111,9 +113,9 @@ class CustomTokenizerTests(unittest.TestCase):
         tokenizer = Tokenizer(self.temporary_file_path)
         for _ in range(10):
             tokenizer.advance()
-        xml = tokenizer.current_token
+        token = tokenizer.current_token
         self.assertTrue( \
-            xml.text == " other ", "advance() returned unexpected result: got '', expected 'other'".format(xml.text))
+            token.value == "other", "advance() returned unexpected result: got '', expected 'other'".format(token.value))
 
     def test_advance_at_init(self):
         jack_snippet = "return Fraction.new(sum, denominator * other.getDenominator());"
@@ -129,13 +131,13 @@ class CustomTokenizerTests(unittest.TestCase):
         tokenizer = Tokenizer(self.temporary_file_path)
         for _ in range(100):
             tokenizer.advance()
-        xml = tokenizer.current_token
+        token = tokenizer.current_token
         self.assertTrue( \
-            xml.text == " ; ", "advance() returned unexpected result: got '', expected ';'".format(xml.text))
+            token.value == ";", "advance() returned unexpected result: got '', expected ';'".format(token.value))
         tokenizer.advance()
-        xml = tokenizer.current_token
+        token = tokenizer.current_token
         self.assertTrue(\
-            xml.text == " ; ", "advance() returned unexpected result: got '', expected ';'".format(xml.text))
+            token.value == ";", "advance() returned unexpected result: got '', expected ';'".format(token.value))
 
     def test_inline_comments(self):
         snippet = """
@@ -154,14 +156,14 @@ class CustomTokenizerTests(unittest.TestCase):
         tokenizer.advance()  # ...eats 'class', now at 'Main'
         tokenizer.advance()  # ...eats 'Main', now at '{'
         tokenizer.advance()  # ...eats 'Main', IGNORES COMMENT, now at 'field'
-        self.assertTrue(tokenizer.current_token.text == " field ")
+        self.assertTrue(tokenizer.current_token.value == "field")
         tokenizer.advance()  # ...eats 'field', now at 'int'
         tokenizer.advance()  # ...eats 'int', now at 'numerator'
         tokenizer.advance()  # ...eats 'numerator', now at ','
         tokenizer.advance()  # ...eats ',' now at 'denominator'
         tokenizer.advance()  # ...eats 'denominator' now at ';'
         tokenizer.advance()  # ...eats ';', IGNORES COMMENT, now at '}'
-        self.assertTrue(tokenizer.current_token.text == " } ")
+        self.assertTrue(tokenizer.current_token.value == "}")
 
     def test_keyword_conflicts(self):
         """"""
@@ -176,3 +178,116 @@ class CustomTokenizerTests(unittest.TestCase):
             ("symbol", " ; "), ("symbol", " } "), ("symbol", " } ")]
         actual = self.tokenize_snippet(jack_snippet)
         self.assertListEqual(actual, expected, "failed {}".format(jack_snippet))
+
+    def test_tokens_tree_reflects_consumed_tokens(self):
+        self.write_snippet_to_temporary_file("let x = 10;")
+
+        tokenizer = Tokenizer(self.temporary_file_path)
+        tokenizer.advance()
+        tokenizer.advance()
+        self.assertEqual(tokenizer.current_token.value, "x")
+        self.assertListEqual([(child.tag, child.text) for child in tokenizer.tokens],
+                             [("keyword", " let "), ("identifier", " x ")])
+
+        tokenizer.advance()
+        self.assertEqual(tokenizer.current_token.value, "=")
+        self.assertEqual(len(tokenizer.tokens), 3)
+
+    def test_lexers_agree(self):
+        jack_snippet = """
+        /** Tokens from every category, comments of both styles and a few awkward cases. */
+        class Main {
+            field int x1; // trailing comment
+            method void do_this(int classy) {
+                var String s;
+                let s = "a // not a comment";
+                let x1 = -(classy * 100) / (~x1 & 7);
+                return;
+            }
+        }
+        """
+        self.write_snippet_to_temporary_file(jack_snippet)
+        master_tokens = Tokenizer(self.temporary_file_path, lexer=MASTER_LEXER).tokenize()
+        cascade_tokens = Tokenizer(self.temporary_file_path, lexer=CASCADE_LEXER).tokenize()
+        self.assertListEqual([(child.tag, child.text) for child in master_tokens],
+                             [(child.tag, child.text) for child in cascade_tokens])
+
+    def test_token_kinds_values_and_offsets(self):
+        self.write_snippet_to_temporary_file('let s = /** note */ "hi";')
+
+        tokenizer = Tokenizer(self.temporary_file_path)
+        actual = []
+        token = tokenizer.advance()
+        while token is not None:
+            actual.append((token.kind, token.value, token.offset))
+            token = tokenizer.advance()
+        expected = [(KEYWORD, "let", 0), (IDENTIFIER, "s", 4), (SYMBOL, "=", 6), (STRING_CONST, "hi", 20),
+                    (SYMBOL, ";", 24)]
+        self.assertListEqual(actual, expected)
+
+    def test_streamed_tokens_match_file_tokens(self):
+        jack_snippet = """
+        /** A block comment that is longer than several of the chunk sizes used below. */
+        class Main {
+            function void main() {
+                var String greeting; // a line comment
+                let greeting = "hello, world";
+                do Output.printInt(12345 / 5);
+                return;
+            }
+        }
+        """
+        self.write_snippet_to_temporary_file(jack_snippet)
+        expected = [(child.tag, child.text) for child in Tokenizer(self.temporary_file_path).tokenize()]
+
+        for chunk_size in [1, 2, 3, 5, 16, 1024]:
+            tokenizer = Tokenizer(jack_stream=io.StringIO(jack_snippet), chunk_size=chunk_size)
+            actual = [(child.tag, child.text) for child in tokenizer.tokenize()]
+            self.assertListEqual(actual, expected, "failed with chunk_size={}".format(chunk_size))
+
+    def test_streaming_tokenizer_keeps_no_history(self):
+        tokenizer = Tokenizer(jack_stream=io.StringIO("let x = 10;"), chunk_size=4)
+        tokenizer.advance()
+        tokenizer.advance()
+        self.assertTrue(tokenizer.streaming)
+        self.assertEqual(tokenizer.current_token.value, "x")
+        self.assertEqual(tokenizer.current_token.offset, 4)
+        self.assertRaises(AssertionError, lambda: tokenizer.tokens)
+
+    def test_memory_mapped_tokens_match_file_tokens(self):
+        jack_snippet = """
+        class Main { /** comment */
+            function void main() {
+                do Output.printString("text"); // comment
+                return 17;
+            }
+        }
+        """
+        self.write_snippet_to_temporary_file(jack_snippet)
+        expected = [(child.tag, child.text) for child in Tokenizer(self.temporary_file_path).tokenize()]
+
+        tokenizer = Tokenizer(self.temporary_file_path, memory_map=True)
+        actual = [(child.tag, child.text) for child in tokenizer.tokenize()]
+        self.assertListEqual(actual, expected)
+
+    def test_memory_mapped_empty_file(self):
+        self.write_snippet_to_temporary_file("")
+        tokenizer = Tokenizer(self.temporary_file_path, memory_map=True)
+        self.assertIsNone(tokenizer.advance())
+
+    def test_token_positions(self):
+        jack_snippet = "class Main {\n\n    /** a\n    comment */ field int x;\n}"
+        self.write_snippet_to_temporary_file(jack_snippet)
+        expected = [(1, 1), (1, 7), (1, 12), (4, 16), (4, 22), (4, 26), (4, 27), (5, 1)]
+
+        for memory_map in [False, True]:
+            tokenizer = Tokenizer(self.temporary_file_path, memory_map=memory_map)
+            positions = []
+            while tokenizer.advance() is not None:
+                positions.append(tokenizer.position(tokenizer.current_token.offset))
+            self.assertListEqual(positions, expected, "failed with memory_map={}".format(memory_map))
+
+    def test_source_positions(self):
+        positions = SourcePositions("ab\ncd\n\nef")
+        self.assertListEqual([positions.position(offset) for offset in range(10)],
+                             [(1, 1), (1, 2), (1, 3), (2, 1), (2, 2), (2, 3), (3, 1), (4, 1), (4, 2), (4, 3)])
@@ -0,0 +1,53 @@
+__author__ = 'paulpatterson'
+
+import unittest
+from pathlib import Path
+import xml.etree.ElementTree as ET
+
+from jack_compiler.JackCompiler import compile_jack_code
+from jack_compiler.VMCode import VMCode, Instruction, serialize, PUSH, POP, ADD, LABEL, IF_GOTO, CALL, FUNCTION, \
+    RETURN, NO_SEGMENT, CONSTANT, LOCAL, THIS
+from jack_compiler.VMWriter import VMWriter
+
+
+class VMCodeTest(unittest.TestCase):
+
+    INSTRUCTIONS = [Instruction(FUNCTION, NO_SEGMENT, "Main.main", 1),
+                    Instruction(LABEL, NO_SEGMENT, "WHILE_EXP0", 0),
+                    Instruction(PUSH, CONSTANT, None, 32767),
+                    Instruction(PUSH, LOCAL, None, 0),
+                    Instruction(ADD, NO_SEGMENT, None, 0),
+                    Instruction(POP, LOCAL, None, 0),
+                    Instruction(IF_GOTO, NO_SEGMENT, "WHILE_EXP0", 0),
+                    Instruction(CALL, NO_SEGMENT, "Main.main", 0),
+                    Instruction(RETURN, NO_SEGMENT, None, 0)]
+
+    def test_instructions_round_trip(self):
+        vm_code = VMCode(self.INSTRUCTIONS)
+        self.assertEqual(len(vm_code), len(self.INSTRUCTIONS))
+        self.assertListEqual(list(vm_code), self.INSTRUCTIONS)
+        self.assertEqual(vm_code[2], self.INSTRUCTIONS[2])
+        self.assertListEqual(vm_code.names, ["Main.main", "WHILE_EXP0"])
+
+    def test_serialize(self):
+        self.assertEqual(serialize(VMCode(self.INSTRUCTIONS)),
+                         "function Main.main 1\nlabel WHILE_EXP0\npush constant 32767\npush local 0\nadd\n"
+                         "pop local 0\nif-goto WHILE_EXP0\ncall Main.main 0\nreturn\n")
+
+    def test_compiled_classes_serialize_to_expected_vm(self):
+        tests = ET.parse((Path(__file__).parent / "CompilationTests.xml").as_posix()).getroot()
+        for test in tests.iter("test"):
+            with self.subTest(test=test.get("id")):
+                result = compile_jack_code(test.find("jack_class").text)
+                expected_vm = [line.strip() for line in test.find("expected_vm").text.strip().splitlines()]
+                self.assertListEqual(result.vm_code.splitlines(), expected_vm)
+
+    def test_writer_emits_instructions(self):
+        vm_writer = VMWriter()
+        vm_writer.write_push("FIELD", 2)
+        vm_writer.write_arithmetic("ADD")
+        vm_writer.write_string("A")
+        self.assertListEqual(list(vm_writer.vm_instructions)[:3],
+                             [Instruction(PUSH, THIS, None, 2), Instruction(ADD, NO_SEGMENT, None, 0),
+                              Instruction(PUSH, CONSTANT, None, 1)])
+        self.assertEqual(len(vm_writer.vm_instructions), 6)
@@ -0,0 +1,56 @@
+__author__ = 'paulpatterson'
+
+import unittest
+from pathlib import Path
+import shutil
+import tempfile
+
+from jack_compiler.VMWriter import VMWriter
+
+
+class VMWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+        self.vm_file_path = self.directory / "Main.vm"
+
+    def tearDown(self):
+        shutil.rmtree(self.directory.as_posix())
+
+    def write_commands(self, vm_writer):
+        vm_writer.write_function("Main.main", 1)
+        vm_writer.write_push("CONST", 7)
+        vm_writer.write_pop("VAR", 0)
+        vm_writer.write_label("WHILE_EXP0")
+        vm_writer.write_arithmetic("NOT")
+        vm_writer.write_if_goto("WHILE_END0")
+        vm_writer.write_string("Hi")
+        vm_writer.write_goto("WHILE_EXP0")
+        vm_writer.write_call("Output.printString", 1)
+        vm_writer.write_return()
+
+    def test_commands_are_buffered_until_close(self):
+        with VMWriter(self.vm_file_path) as vm_writer:
+            self.write_commands(vm_writer)
+            self.assertFalse(self.vm_file_path.exists())
+            in_memory_writer = VMWriter()
+            self.write_commands(in_memory_writer)
+
+        with open(self.vm_file_path.as_posix()) as vm_file:
+            self.assertEqual(vm_file.read(), in_memory_writer.vm_code)
+        self.assertListEqual(in_memory_writer.vm_code.splitlines(),
+                             ["function Main.main 1", "push constant 7", "pop local 0", "label WHILE_EXP0", "not",
+                              "if-goto WHILE_END0", "push constant 2", "call String.new 1", "push constant 72",
+                              "call String.appendChar 2", "push constant 105", "call String.appendChar 2",
+                              "goto WHILE_EXP0", "call Output.printString 1", "return"])
+
+    def test_existing_file_is_untouched_when_compilation_fails(self):
+        with VMWriter(self.vm_file_path) as vm_writer:
+            vm_writer.write_function("Main.main", 0)
+            vm_writer.write_return()
+        with self.assertRaises(AssertionError):
+            with VMWriter(self.vm_file_path) as vm_writer:
+                vm_writer.write_return()
+                raise AssertionError("compilation failed")
+        with open(self.vm_file_path.as_posix()) as vm_file:
+            self.assertEqual(vm_file.read(), "function Main.main 0\nreturn\n")
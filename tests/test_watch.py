@@ -0,0 +1,59 @@
+__author__ = 'paulpatterson'
+
+import os
+
+from jack_compiler.JackCompiler import JackCompiler
+from tests.globals import JackDirectoryTestCase
+
+MAIN_CLASS = """
+class Main {
+    function void main() {
+        do Output.printInt(%d);
+        return;
+    }
+}
+"""
+
+
+class WatchModeTest(JackDirectoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.write_jack_class("Main", MAIN_CLASS % 1)
+        self.compiler = JackCompiler(path=self.jack_dir)
+        self.reports = []
+
+    def recompile(self):
+        return [jack_file.name for jack_file in self.compiler.recompile_changed_files(self.reports.append)]
+
+    def test_only_changed_files_are_recompiled(self):
+        self.assertListEqual(self.recompile(), ["Main.jack"])
+        self.assertListEqual(self.recompile(), [])
+
+        self.write_jack_class("Main", MAIN_CLASS % 12)
+        self.assertListEqual(self.recompile(), ["Main.jack"])
+
+        self.write_jack_class("Other", MAIN_CLASS.replace("Main", "Other") % 2)
+        self.assertListEqual(self.recompile(), ["Other.jack"])
+        self.assertTrue((self.jack_dir / "Other.vm").exists())
+        self.assertTrue(all("compiled in" in report for report in self.reports))
+
+    def test_touching_a_file_does_not_recompile_it(self):
+        self.recompile()
+        main_jack = self.jack_dir / "Main.jack"
+        stat = main_jack.stat()
+        os.utime(main_jack.as_posix(), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertListEqual(self.recompile(), [])
+
+    def test_failures_are_reported_and_watching_continues(self):
+        self.recompile()
+        self.write_jack_class("Main", "class Main { function void main() { let = 1; } }")
+        self.assertListEqual(self.recompile(), [])
+        self.assertIn("Main.jack: failed", self.reports[-1])
+
+        self.write_jack_class("Main", MAIN_CLASS % 3)
+        self.assertListEqual(self.recompile(), ["Main.jack"])
+
+    def test_watch_stops_after_max_polls(self):
+        self.compiler.watch(poll_interval=0, report=self.reports.append, max_polls=2)
+        self.assertEqual(len(self.reports), 1)
@@ -0,0 +1,216 @@
+__author__ = 'paulpatterson'
+
+## A small emulator for the vm language, used by the tests to check that optimized vm code behaves exactly like the
+## unoptimized code it replaces. It follows the standard mapping of the vm onto the Hack RAM (stack from 256, statics
+## from 16, heap from 2048). The parts of the OS that the test programs use are written in python; anything that only
+## draws, or waits, does nothing and returns 0.
+
+from math import isqrt
+
+SP, LCL, ARG, THIS, THAT = range(5)
+TEMP_BASE = 5
+STATIC_BASE = 16
+STACK_BASE = 256
+HEAP_BASE = 2048
+RAM_SIZE = 32768
+
+ARITHMETIC = {"add": lambda x, y: x + y, "sub": lambda x, y: x - y, "and": lambda x, y: x & y,
+              "or": lambda x, y: x | y, "eq": lambda x, y: -1 if x == y else 0, "gt": lambda x, y: -1 if x > y else 0,
+              "lt": lambda x, y: -1 if x < y else 0}
+
+
+def to_word(value):
+    """ Returns value as a signed 16-bit integer. """
+    value &= 0xFFFF
+    return value - 0x10000 if value & 0x8000 else value
+
+
+class VMEmulator():
+
+    def __init__(self, vm_sources, keyboard_input=()):
+        """ Creates an emulator for the program made up of vm_sources, a dictionary mapping class names to vm code.
+        Numbers read from the keyboard are taken, in turn, from keyboard_input. """
+        self.ram = [0] * RAM_SIZE
+        self.output = []
+        self.keyboard_input = list(keyboard_input)
+        self.instructions = []
+        self.functions = {}
+        self.labels = {}
+        self.statics = {}
+        self.heap_pointer = HEAP_BASE
+        self.steps = 0
+        self.calls = 0
+        for class_name, vm_code in sorted(vm_sources.items()):
+            self._load(class_name, vm_code)
+
+    def _load(self, class_name, vm_code):
+        function_name = None
+        for line in vm_code.splitlines():
+            words = line.split()
+            if len(words) == 0:
+                continue
+            if words[0] == "function":
+                function_name = words[1]
+                self.functions[function_name] = len(self.instructions)
+            elif words[0] == "label":
+                self.labels[(function_name, words[1])] = len(self.instructions)
+                continue
+            self.instructions.append((words, class_name, function_name))
+
+    def run(self, function_name="Main.main", max_steps=1000000):
+        """ Calls function_name (with no arguments) and runs until it returns. Returns the value it returned. """
+        self.ram[SP] = STACK_BASE
+        self._call(function_name, 0, None)
+        while self.pc is not None:
+            self.steps += 1
+            assert self.steps <= max_steps, "program did not finish within {} steps".format(max_steps)
+            self._step()
+        return self._pop()
+
+    @property
+    def printed(self):
+        return "".join(self.output)
+
+    def _push(self, value):
+        self.ram[self.ram[SP]] = to_word(value)
+        self.ram[SP] += 1
+
+    def _pop(self):
+        self.ram[SP] -= 1
+        return self.ram[self.ram[SP]]
+
+    def _address(self, segment, index, class_name):
+        if segment == "local":
+            return self.ram[LCL] + index
+        if segment == "argument":
+            return self.ram[ARG] + index
+        if segment == "this":
+            return self.ram[THIS] + index
+        if segment == "that":
+            return self.ram[THAT] + index
+        if segment == "pointer":
+            return THIS + index
+        if segment == "temp":
+            return TEMP_BASE + index
+        assert segment == "static", "unknown segment '{}'".format(segment)
+        return self.statics.setdefault((class_name, index), STATIC_BASE + len(self.statics))
+
+    def _step(self):
+        words, class_name, function_name = self.instructions[self.pc]
+        self.pc += 1
+        command = words[0]
+        if command == "push":
+            index = int(words[2])
+            self._push(index if words[1] == "constant" else self.ram[self._address(words[1], index, class_name)])
+        elif command == "pop":
+            self.ram[self._address(words[1], int(words[2]), class_name)] = self._pop()
+        elif command in ARITHMETIC:
+            y = self._pop()
+            self._push(ARITHMETIC[command](self._pop(), y))
+        elif command == "neg":
+            self._push(-self._pop())
+        elif command == "not":
+            self._push(~self._pop())
+        elif command == "goto":
+            self.pc = self.labels[(function_name, words[1])]
+        elif command == "if-goto":
+            if self._pop() != 0:
+                self.pc = self.labels[(function_name, words[1])]
+        elif command == "call":
+            self._call(words[1], int(words[2]), self.pc)
+        elif command == "function":
+            for _ in range(int(words[2])):
+                self._push(0)
+        else:
+            assert command == "return", "unknown command '{}'".format(command)
+            self._return()
+
+    def _call(self, function_name, num_args, return_address):
+        if function_name not in self.functions:
+            arguments = [self._pop() for _ in range(num_args)][::-1]
+            self._push(getattr(self, "os_" + function_name.replace(".", "_"), self._os_nothing)(*arguments) or 0)
+            self.pc = return_address
+            return
+        self.calls += 1
+        for value in [return_address if return_address is not None else -1] + self.ram[LCL:THAT + 1]:
+            self._push(value)
+        self.ram[ARG] = self.ram[SP] - num_args - 5
+        self.ram[LCL] = self.ram[SP]
+        self.pc = self.functions[function_name]
+
+    def _return(self):
+        frame = self.ram[LCL]
+        return_address = self.ram[frame - 5]
+        self.ram[self.ram[ARG]] = self._pop()
+        self.ram[SP] = self.ram[ARG] + 1
+        self.ram[LCL:THAT + 1] = [self.ram[frame - 4], self.ram[frame - 3], self.ram[frame - 2], self.ram[frame - 1]]
+        self.pc = return_address if return_address != -1 else None
+
+    # The OS
+
+    def _os_nothing(self, *arguments):
+        return 0
+
+    def os_Math_multiply(self, x, y):
+        return x * y
+
+    def os_Math_divide(self, x, y):
+        return abs(x) // abs(y) * (1 if (x < 0) == (y < 0) else -1)
+
+    def os_Math_abs(self, x):
+        return abs(x)
+
+    def os_Math_min(self, x, y):
+        return min(x, y)
+
+    def os_Math_max(self, x, y):
+        return max(x, y)
+
+    def os_Math_sqrt(self, x):
+        return isqrt(x)
+
+    def os_Memory_alloc(self, size):
+        address = self.heap_pointer
+        self.heap_pointer += max(size, 1)
+        return address
+
+    def os_Memory_peek(self, address):
+        return self.ram[address]
+
+    def os_Memory_poke(self, address, value):
+        self.ram[address] = value
+
+    def os_Array_new(self, size):
+        return self.os_Memory_alloc(size)
+
+    def os_String_new(self, max_length):
+        string = self.os_Memory_alloc(max_length + 1)
+        self.ram[string] = 0
+        return string
+
+    def os_String_appendChar(self, string, character):
+        self.ram[string] += 1
+        self.ram[string + self.ram[string]] = character
+        return string
+
+    def os_String_length(self, string):
+        return self.ram[string]
+
+    def os_String_charAt(self, string, index):
+        return self.ram[string + 1 + index]
+
+    def os_Output_printChar(self, character):
+        self.output.append(chr(character))
+
+    def os_Output_printString(self, string):
+        self.output.append("".join(chr(character) for character in self.ram[string + 1:string + 1 + self.ram[string]]))
+
+    def os_Output_printInt(self, value):
+        self.output.append(str(value))
+
+    def os_Output_println(self):
+        self.output.append("\n")
+
+    def os_Keyboard_readInt(self, prompt):
+        self.os_Output_printString(prompt)
+        return self.keyboard_input.pop(0)